@@ -0,0 +1,67 @@
+"""Compare storage backends on the same synthetic workload.
+
+Runs ``benchmarks.run`` once per backend in a separate process (each backend
+is selected at import time) and prints ingest throughput and dashboard
+latency side by side:
+
+    python -m benchmarks.compare_backends
+    python -m benchmarks.compare_backends --backends duckdb clickhouse -- --orders 20000
+
+Arguments after ``--`` are passed through to ``benchmarks.run``.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMPARED_PREFIXES = ('ingest.', 'endpoint.')
+
+
+def run_backend(backend, extra_args):
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, f'{backend}.json')
+        subprocess.run(
+            [sys.executable, '-m', 'benchmarks.run', '--backend', backend, '--output', output, *extra_args],
+            cwd=SERVICE_DIR,
+            check=True,
+            stdout=subprocess.DEVNULL
+        )
+        with open(output) as f:
+            return json.load(f)['results']
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    extra_args = []
+    if '--' in argv:
+        split = argv.index('--')
+        argv, extra_args = argv[:split], argv[split + 1:]
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', default=['fake', 'duckdb'], help='backends to compare')
+    args = parser.parse_args(argv)
+
+    results = {backend: run_backend(backend, extra_args) for backend in args.backends}
+
+    names = sorted({
+        name
+        for backend_results in results.values()
+        for name in backend_results
+        if name.startswith(COMPARED_PREFIXES)
+    })
+    print(f"{'metric':55s}" + ''.join(f"{backend:>16s}" for backend in args.backends))
+    for name in names:
+        row = f"{name:55s}"
+        for backend in args.backends:
+            value = results[backend].get(name)
+            row += f"{value['value']:>16.3f}" if value else f"{'-':>16s}"
+        print(row)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,337 @@
+"""In-process stand-ins for the storage backend and Kafka.
+
+``FakeStorageBackend`` implements the ``StorageBackend`` operations used by
+the consumer, the API routes and the recommender on top of Python data
+structures. Aggregates are maintained incrementally on insert, so query cost
+stays small and benchmarks measure the service code rather than the fake.
+
+``install()`` must run before anything under ``src`` is imported: it selects
+the fake through ``STORAGE_BACKEND`` so the module-level backend never tries
+to reach a real server. This module deliberately does not import ``src``.
+"""
+import os
+from collections import Counter, defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+FAKE_BACKEND = 'benchmarks.fakes:FakeStorageBackend'
+
+TopicPartition = namedtuple('TopicPartition', 'topic partition')
+ConsumerRecord = namedtuple('ConsumerRecord', 'topic partition offset value')
+
+
+def _stream(rows, limit):
+    """Closable row iterator, like the real backends' ``iter_rows``"""
+    yield from (rows[:limit] if limit else rows)
+
+
+def _shape(rows, columnar):
+    """Mimic clickhouse-driver's row or columnar result layout"""
+    if columnar:
+        return [list(column) for column in zip(*rows)]
+    return rows
+
+
+class FakeStorageBackend:
+    name = 'fake'
+    embedded = False
+
+    def __init__(self):
+        self.events = []
+        self.items = []
+        self.order_users = {}
+        self.created_orders = set()
+        self.daily = defaultdict(lambda: [0, 0.0])
+        self.products = {}
+        self.latest_status = {}
+        self.totals = [0, 0.0]
+        self.event_ids = set()
+        self.item_keys = set()
+        self.first_orders = {}
+        self.cohort_orders = set()
+        self.weekly_activity = defaultdict(lambda: [set(), 0, 0.0])
+        self.monthly_customers = defaultdict(Counter)
+
+    def parse_timestamp(self, ts):
+        if isinstance(ts, str):
+            ts = ts.replace('Z', '').replace('T', ' ').split('.')[0]
+            return datetime.strptime(ts, '%Y-%m-%d %H:%M:%S')
+        return ts
+
+    # Shared row helpers, borrowed from StorageBackend. Imported late because
+    # src.storage imports this module to build the backend.
+
+    def event_key(self, event_data: dict):
+        from src.storage.base import StorageBackend
+        return StorageBackend.event_key(self, event_data)
+
+    def cohort_keys(self, first_order, timestamp):
+        from src.storage.base import StorageBackend
+        return StorageBackend.cohort_keys(self, first_order, timestamp)
+
+    def insert_order_batch(self, events: list):
+        from src.storage.base import StorageBackend
+        return StorageBackend.insert_order_batch(self, events)
+
+    # Writes
+
+    def insert_order_event(self, event_data: dict):
+        key, timestamp = self.event_key(event_data)
+        if key in self.event_ids:
+            return
+        self.event_ids.add(key)
+        event_id = key[1]
+        order_id = event_data.get('orderId') or event_data.get('order_id')
+        user_id = event_data.get('userId') or event_data.get('user_id')
+        event_type = event_data.get('event_type', 'unknown')
+        amount = float(event_data.get('totalAmount', 0) or event_data.get('total_amount', 0))
+        status = event_data.get('status')
+
+        self.events.append((event_id, order_id, user_id, event_type, timestamp, amount, status))
+        if event_type == 'order.created':
+            self.order_users[order_id] = user_id
+            self.created_orders.add(order_id)
+            day = self.daily[timestamp.date()]
+            day[0] += 1
+            day[1] += amount
+            self.totals[0] += 1
+            self.totals[1] += amount
+        if status is not None:
+            latest = self.latest_status.get(order_id)
+            if latest is None or timestamp >= latest[0]:
+                self.latest_status[order_id] = (timestamp, status)
+
+    def insert_order_items(self, order_id: str, items: list, timestamp: str):
+        timestamp = self.parse_timestamp(timestamp)
+        for item in items:
+            product_id = item.get('product_id')
+            if (order_id, product_id) in self.item_keys:
+                continue
+            self.item_keys.add((order_id, product_id))
+            quantity = int(item.get('quantity'))
+            subtotal = float(str(item.get('subtotal')))
+            self.items.append((order_id, product_id, item.get('product_name'), quantity, subtotal, timestamp))
+
+            product = self.products.setdefault(product_id, [item.get('product_name'), 0, 0.0, set()])
+            product[1] += quantity
+            product[2] += subtotal
+            product[3].add(order_id)
+
+    # Reads
+
+    def get_daily_sales(self, days: int = 7, columnar: bool = False):
+        since = (datetime.now() - timedelta(days=days)).date()
+        rows = [
+            (day, count, revenue, revenue / count)
+            for day, (count, revenue) in sorted(self.daily.items(), reverse=True)
+            if day >= since
+        ]
+        return _shape(rows, columnar)
+
+    def get_top_products(self, limit: int = 10, columnar: bool = False):
+        rows = sorted(
+            ((pid, name, qty, revenue, len(orders)) for pid, (name, qty, revenue, orders) in self.products.items()),
+            key=lambda row: row[3],
+            reverse=True
+        )[:limit]
+        return _shape(rows, columnar)
+
+    def get_order_status_distribution(self, columnar: bool = False):
+        counts = Counter(status for _, status in self.latest_status.values())
+        return _shape(counts.most_common(), columnar)
+
+    def get_top_users(self, days: int = 30, limit: int = 10, columnar: bool = False):
+        since = datetime.now() - timedelta(days=days)
+        users = {}
+        for _, order_id, user_id, event_type, timestamp, amount, _ in self.events:
+            if event_type != 'order.created' or timestamp < since:
+                continue
+            user = users.setdefault(user_id, [set(), 0.0, timestamp])
+            user[0].add(order_id)
+            user[1] += amount
+            user[2] = max(user[2], timestamp)
+        rows = sorted(
+            ((uid, len(orders), spent, last) for uid, (orders, spent, last) in users.items()),
+            key=lambda row: row[2],
+            reverse=True
+        )[:limit]
+        return _shape(rows, columnar)
+
+    def get_total_metrics(self):
+        count, revenue = self.totals
+        return (count, revenue, revenue / count if count else 0)
+
+    def get_training_order_items(self):
+        return [
+            (order_id, self.order_users[order_id], product_id, name, quantity, subtotal)
+            for order_id, product_id, name, quantity, subtotal, _ in self.items
+            if order_id in self.created_orders
+        ]
+
+    def get_popular_products(self, limit: int = 5):
+        rows = sorted(
+            ((pid, name, qty, len(orders)) for pid, (name, qty, _, orders) in self.products.items()),
+            key=lambda row: row[2],
+            reverse=True
+        )
+        return rows[:limit]
+
+    def recent_event_ids(self, since):
+        return [(row[3], row[0], row[4]) for row in self.events if row[4] > since]
+
+    def existing_event_ids(self, keys) -> set:
+        return {key for key, _ in keys if key in self.event_ids}
+
+    # Cohorts
+
+    def get_first_orders(self, user_ids):
+        return {user_id: self.first_orders[user_id] for user_id in user_ids if user_id in self.first_orders}
+
+    def set_first_orders(self, first_orders: dict):
+        for user_id, first_order in first_orders.items():
+            current = self.first_orders.get(user_id)
+            self.first_orders[user_id] = first_order if current is None else min(current, first_order)
+
+    def record_cohort_orders(self, orders: list):
+        for order_id, user_id, first_order, timestamp, total_amount in orders:
+            if order_id in self.cohort_orders:
+                continue
+            self.cohort_orders.add(order_id)
+            cohort_week, week_number, cohort_month = self.cohort_keys(first_order, timestamp)
+            week = self.weekly_activity[(cohort_week, week_number)]
+            week[0].add(user_id)
+            week[1] += 1
+            week[2] += float(total_amount or 0)
+            self.monthly_customers[cohort_month][user_id] += 1
+
+    def get_weekly_retention(self, since, columnar: bool = False):
+        rows = [
+            (cohort_week, week_number, len(users), orders, revenue)
+            for (cohort_week, week_number), (users, orders, revenue) in sorted(self.weekly_activity.items())
+            if cohort_week >= since
+        ]
+        return _shape(rows, columnar)
+
+    def get_repeat_purchase(self, since, columnar: bool = False):
+        rows = [
+            (month, len(users), sum(1 for orders in users.values() if orders > 1), sum(users.values()))
+            for month, users in sorted(self.monthly_customers.items())
+            if month >= since
+        ]
+        return _shape(rows, columnar)
+
+    def rebuild_cohorts(self):
+        self.first_orders = {}
+        self.cohort_orders = set()
+        self.weekly_activity.clear()
+        self.monthly_customers.clear()
+        orders = [row for row in self.events if row[3] == 'order.created']
+        for _, _, user_id, _, timestamp, _, _ in orders:
+            self.set_first_orders({user_id: timestamp})
+        self.record_cohort_orders([
+            (order_id, user_id, self.first_orders[user_id], timestamp, amount)
+            for _, order_id, user_id, _, timestamp, amount, _ in sorted(orders, key=lambda row: (row[4], row[0]))
+        ])
+
+    # Streaming exports
+
+    def iter_order_events(self, start, end, after=None, limit=None):
+        rows = sorted(
+            (row for row in self.events if start <= row[4] < end and (after is None or (row[4], row[0], row[3]) > after)),
+            key=lambda row: (row[4], row[0], row[3])
+        )
+        return _stream(rows, limit)
+
+    def iter_user_spend(self, start, end, after=None, limit=None):
+        users = {}
+        for _, order_id, user_id, event_type, timestamp, amount, _ in self.events:
+            if event_type != 'order.created' or not start <= timestamp < end:
+                continue
+            if after and user_id <= after[0]:
+                continue
+            user = users.setdefault(user_id, [set(), 0.0, timestamp, timestamp])
+            user[0].add(order_id)
+            user[1] += amount
+            user[2] = min(user[2], timestamp)
+            user[3] = max(user[3], timestamp)
+        rows = [(uid, len(o), spent, first, last) for uid, (o, spent, first, last) in sorted(users.items())]
+        return _stream(rows, limit)
+
+    def iter_product_sales(self, start, end, after=None, limit=None):
+        products = {}
+        for order_id, product_id, name, quantity, subtotal, timestamp in self.items:
+            if not start <= timestamp < end or (after and product_id <= after[0]):
+                continue
+            product = products.setdefault(product_id, [name, 0, 0.0, set()])
+            product[1] += quantity
+            product[2] += subtotal
+            product[3].add(order_id)
+        rows = [(pid, name, qty, rev, len(o)) for pid, (name, qty, rev, o) in sorted(products.items())]
+        return _stream(rows, limit)
+
+    def ping(self):
+        return True
+
+    def truncate(self):
+        self.__init__()
+
+
+class FakeKafkaConsumer:
+    """Replays a list of (topic, event) pairs through the KafkaConsumer poll API.
+
+    Records are spread round-robin over ``partitions`` partitions per topic.
+    Like the real consumer it tracks a position per partition, supports
+    ``seek`` and commits either every position or explicit offsets, which
+    are recorded in ``committed`` as partition -> next offset to read.
+    ``on_exhausted`` is called once every record has been handed out, which
+    lets a benchmark stop ``OrderEventConsumer.start()`` cleanly.
+    """
+
+    def __init__(self, events, partitions: int = 3, on_exhausted=None):
+        self.partitions = {}
+        for index, (topic, event) in enumerate(events):
+            partition = TopicPartition(topic, index % partitions)
+            records = self.partitions.setdefault(partition, [])
+            records.append(ConsumerRecord(topic, partition.partition, len(records), event))
+        self.positions = dict.fromkeys(self.partitions, 0)
+        self.on_exhausted = on_exhausted
+        self.committed = {}
+        self.closed = False
+
+    def poll(self, timeout_ms=0, max_records=500):
+        share = max(1, -(-max_records // max(1, len(self.partitions))))
+        batch = {}
+        for partition, records in self.partitions.items():
+            position = self.positions[partition]
+            taken = records[position:position + min(share, max_records - sum(map(len, batch.values())))]
+            if taken:
+                batch[partition] = taken
+                self.positions[partition] = position + len(taken)
+        if not batch and self.on_exhausted:
+            self.on_exhausted()
+        return batch
+
+    def seek(self, partition, offset):
+        self.positions[partition] = offset
+
+    def assignment(self):
+        return set(self.partitions)
+
+    def highwater(self, partition):
+        return len(self.partitions[partition])
+
+    def position(self, partition):
+        return self.positions[partition]
+
+    def commit(self, offsets=None):
+        if offsets is None:
+            self.committed.update(self.positions)
+        else:
+            self.committed.update({partition: meta.offset for partition, meta in offsets.items()})
+
+    def close(self):
+        self.closed = True
+
+
+def install():
+    """Select the fake backend; must run before ``src.storage`` is imported"""
+    os.environ['STORAGE_BACKEND'] = FAKE_BACKEND
@@ -0,0 +1,237 @@
+"""Analytics service benchmark runner.
+
+Runs ingest, training, recommendation and dashboard benchmarks against a
+storage backend (the in-process fakes by default), writes the results as
+JSON and optionally compares them with a stored baseline:
+
+    python -m benchmarks.run --orders 20000 --output results.json
+    python -m benchmarks.run --backend duckdb
+    python -m benchmarks.run --save-baseline
+    python -m benchmarks.run --baseline benchmarks/baseline.json --tolerance 0.15
+
+Exits with status 1 when a metric regressed beyond the tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(SERVICE_DIR, 'benchmarks', 'baseline.json')
+
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('INTERACTION_STORE', 'memory')
+# Publish benchmark models away from a service running on the same host
+os.environ.setdefault('MODEL_STORE_DIR', tempfile.mkdtemp(prefix='analytics-bench-model-'))
+sys.path.insert(0, SERVICE_DIR)
+
+from benchmarks.fakes import FakeKafkaConsumer, install  # noqa: E402
+from benchmarks.synthetic import BASKET_DISTRIBUTIONS, SyntheticOrderGenerator  # noqa: E402
+
+BACKENDS = ('fake', 'duckdb', 'clickhouse')
+
+
+def select_backend(argv):
+    """Point STORAGE_BACKEND at the requested engine; runs before src is imported"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--backend', choices=BACKENDS, default='fake')
+    backend = parser.parse_known_args(argv)[0].backend
+    if backend == 'fake':
+        install()
+    else:
+        os.environ['STORAGE_BACKEND'] = backend
+        # Keep benchmark rows away from real data
+        os.environ.setdefault('DUCKDB_PATH', ':memory:')
+        os.environ.setdefault('CLICKHOUSE_DATABASE', 'analytics_bench')
+    return backend
+
+
+select_backend(sys.argv[1:])
+
+from fastapi.testclient import TestClient  # noqa: E402
+from src.ai.recommender import recommender  # noqa: E402
+from src.kafka_consumer.consumer import OrderEventConsumer  # noqa: E402
+from src.main import app  # noqa: E402
+from src.storage import storage  # noqa: E402
+
+DASHBOARD_ENDPOINTS = (
+    '/api/analytics/dashboard',
+    '/api/analytics/sales/daily?days=30',
+    '/api/analytics/products/top-selling?limit=50',
+    '/api/analytics/orders/status-distribution',
+    '/api/analytics/users/activity?days=90',
+)
+
+
+def metric(value, unit, better):
+    return {'value': round(value, 6), 'unit': unit, 'better': better}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_metrics(prefix, samples):
+    millis = [sample * 1000 for sample in samples]
+    return {
+        f'{prefix}.p50_ms': metric(percentile(millis, 50), 'ms', 'lower'),
+        f'{prefix}.p95_ms': metric(percentile(millis, 95), 'ms', 'lower'),
+        f'{prefix}.p99_ms': metric(percentile(millis, 99), 'ms', 'lower'),
+    }
+
+
+def bench_ingest(events, repeat):
+    """Consumer throughput: poll loop -> process_event -> storage inserts"""
+    rates = []
+    for _ in range(repeat):
+        storage.truncate()
+        consumer = OrderEventConsumer()
+        consumer.consumer = FakeKafkaConsumer(
+            [(topic, dict(event)) for topic, event in events],
+            on_exhausted=consumer.stop
+        )
+        start = time.perf_counter()
+        consumer.start()
+        rates.append(len(events) / (time.perf_counter() - start))
+    return {'ingest.events_per_second': metric(statistics.median(rates), 'events/s', 'higher')}
+
+
+def bench_train(repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if not recommender.train():
+            raise RuntimeError("Recommender training failed")
+        durations.append(time.perf_counter() - start)
+    return {'train.seconds': metric(statistics.median(durations), 's', 'lower')}
+
+
+def bench_http(client, paths, warmup):
+    for path in paths[:warmup]:
+        client.get(path)
+    samples = []
+    for path in paths:
+        start = time.perf_counter()
+        response = client.get(path)
+        samples.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {path} returned {response.status_code}")
+    return samples
+
+
+def bench_recommendations(client, user_ids, requests, rng):
+    # Mostly known users, with a share of cold-start lookups
+    paths = [
+        f'/api/ai/recommendations/user/{rng.choice(user_ids) if rng.random() < 0.9 else f"new-user-{i}"}'
+        for i in range(requests)
+    ]
+    return latency_metrics('recommendations.user', bench_http(client, paths, warmup=10))
+
+
+def bench_dashboard(client, requests):
+    results = {}
+    for endpoint in DASHBOARD_ENDPOINTS:
+        name = endpoint.split('?')[0].replace('/api/analytics/', '').replace('/', '.')
+        results.update(latency_metrics(f'endpoint.{name}', bench_http(client, [endpoint] * requests, warmup=5)))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return (name, baseline, current, change) for regressed metrics"""
+    regressions = []
+    for name, base in baseline.get('results', {}).items():
+        current = results.get(name)
+        if current is None or not base['value']:
+            continue
+        change = (current['value'] - base['value']) / base['value']
+        worse = change < -tolerance if base['better'] == 'higher' else change > tolerance
+        if worse:
+            regressions.append((name, base['value'], current['value'], change))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=BACKENDS, default='fake', help='storage backend to benchmark')
+    parser.add_argument('--orders', type=int, default=5000, help='orders to generate')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--skus', type=int, default=200)
+    parser.add_argument('--basket-mean', type=float, default=2.5)
+    parser.add_argument('--basket-distribution', choices=BASKET_DISTRIBUTIONS, default='poisson')
+    parser.add_argument('--days', type=int, default=90, help='span of the generated order history')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions for ingest and training')
+    parser.add_argument('--requests', type=int, default=200, help='requests per latency benchmark')
+    parser.add_argument('--output', help='write results JSON to this file')
+    parser.add_argument('--baseline', help='compare against this results file')
+    parser.add_argument('--save-baseline', action='store_true', help=f'write results to {DEFAULT_BASELINE}')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed relative regression')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    generator = SyntheticOrderGenerator(
+        users=args.users,
+        skus=args.skus,
+        basket_mean=args.basket_mean,
+        basket_distribution=args.basket_distribution,
+        days=args.days,
+        seed=args.seed
+    )
+    events = list(generator.stream(args.orders))
+    rng = random.Random(args.seed)
+    # Not entered as a context manager: startup would launch the embedded
+    # backend's Kafka consumer thread
+    client = TestClient(app)
+
+    results = {}
+    results.update(bench_ingest(events, args.repeat))
+    results.update(bench_train(args.repeat))
+    results.update(bench_recommendations(client, generator.user_ids, args.requests, rng))
+    results.update(bench_dashboard(client, args.requests))
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'save_baseline')},
+            'events': len(events)
+        },
+        'results': results
+    }
+
+    for name, value in results.items():
+        print(f"{name:55s} {value['value']:>14.3f} {value['unit']}")
+
+    output = DEFAULT_BASELINE if args.save_baseline else args.output
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('parameters') != report['meta']['parameters']:
+            print("Warning: baseline was recorded with different parameters")
+        regressions = compare(results, baseline, args.tolerance)
+        for name, base, current, change in regressions:
+            print(f"REGRESSION {name}: {base:.3f} -> {current:.3f} ({change:+.1%})")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
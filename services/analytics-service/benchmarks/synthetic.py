@@ -0,0 +1,140 @@
+"""Synthetic order stream generator.
+
+Produces ``order.created`` events shaped like the ones the order service
+publishes (see ``order.json`` for the request side), followed by status
+transition events. Product popularity follows a Zipf distribution and basket
+sizes follow a configurable distribution so the data has realistic skew.
+"""
+import itertools
+import math
+import random
+import uuid
+from datetime import datetime, timedelta
+
+STATUS_FLOW = (
+    ('order.confirmed', 'confirmed'),
+    ('order.shipped', 'shipped'),
+    ('order.delivered', 'delivered'),
+)
+
+BASKET_DISTRIBUTIONS = ('poisson', 'geometric', 'fixed')
+
+
+class SyntheticOrderGenerator:
+    def __init__(
+        self,
+        users: int = 1000,
+        skus: int = 200,
+        basket_mean: float = 2.5,
+        basket_distribution: str = 'poisson',
+        max_quantity: int = 3,
+        days: int = 90,
+        status_probability: float = 0.8,
+        cancel_probability: float = 0.05,
+        zipf_exponent: float = 1.1,
+        seed: int = 42
+    ):
+        if basket_distribution not in BASKET_DISTRIBUTIONS:
+            raise ValueError(f"basket_distribution must be one of {BASKET_DISTRIBUTIONS}")
+        self.rng = random.Random(seed)
+        self.basket_mean = basket_mean
+        self.basket_distribution = basket_distribution
+        self.max_quantity = max_quantity
+        self.days = days
+        self.status_probability = status_probability
+        self.cancel_probability = cancel_probability
+
+        self.user_ids = [str(uuid.UUID(int=self.rng.getrandbits(128), version=4)) for _ in range(users)]
+        self.products = [
+            {
+                'product_id': str(uuid.UUID(int=self.rng.getrandbits(128), version=4)),
+                'product_name': f"Product {index:04d}",
+                'price': round(self.rng.uniform(5, 1500), 2)
+            }
+            for index in range(skus)
+        ]
+        weights = [1 / (rank ** zipf_exponent) for rank in range(1, skus + 1)]
+        self.cum_weights = list(itertools.accumulate(weights))
+
+    def _uuid(self):
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def basket_size(self) -> int:
+        if self.basket_distribution == 'fixed':
+            return max(1, round(self.basket_mean))
+        if self.basket_distribution == 'geometric':
+            p = 1 / max(self.basket_mean, 1)
+            size = 1
+            while self.rng.random() > p:
+                size += 1
+            return size
+        # Poisson shifted by one so every basket holds at least one product
+        lam = max(self.basket_mean - 1, 0)
+        threshold, size, product = math.exp(-lam), 0, self.rng.random()
+        while product > threshold:
+            size += 1
+            product *= self.rng.random()
+        return size + 1
+
+    def order(self, timestamp: datetime) -> dict:
+        """A single ``order.created`` event"""
+        size = min(self.basket_size(), len(self.products))
+        chosen = {}
+        while len(chosen) < size:
+            product = self.rng.choices(self.products, cum_weights=self.cum_weights)[0]
+            chosen[product['product_id']] = product
+
+        items = []
+        for product in chosen.values():
+            quantity = self.rng.randint(1, self.max_quantity)
+            items.append({
+                'product_id': product['product_id'],
+                'product_name': product['product_name'],
+                'quantity': quantity,
+                'price': product['price'],
+                'subtotal': round(product['price'] * quantity, 2)
+            })
+
+        return {
+            'eventId': self._uuid(),
+            'orderId': self._uuid(),
+            'userId': self.rng.choice(self.user_ids),
+            'timestamp': timestamp.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'totalAmount': round(sum(item['subtotal'] for item in items), 2),
+            'status': 'pending',
+            'items': items
+        }
+
+    def status_events(self, order: dict, created_at: datetime):
+        """Follow-up status events for an order, as (topic, event) pairs"""
+        if self.rng.random() < self.cancel_probability:
+            flow = (('order.cancelled', 'cancelled'),)
+        elif self.rng.random() < self.status_probability:
+            flow = STATUS_FLOW[:self.rng.randint(1, len(STATUS_FLOW))]
+        else:
+            flow = ()
+
+        timestamp = created_at
+        for topic, status in flow:
+            timestamp += timedelta(hours=self.rng.randint(1, 48))
+            yield topic, {
+                'eventId': self._uuid(),
+                'orderId': order['orderId'],
+                'userId': order['userId'],
+                'timestamp': timestamp.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                'totalAmount': order['totalAmount'],
+                'status': status
+            }
+
+    def stream(self, orders: int, end: datetime = None):
+        """(topic, event) pairs for ``orders`` orders spread over ``days`` days"""
+        end = end or datetime.utcnow().replace(microsecond=0)
+        start = end - timedelta(days=self.days)
+        span = (end - start).total_seconds()
+        offsets = sorted(self.rng.uniform(0, span) for _ in range(orders))
+        for offset in offsets:
+            created_at = start + timedelta(seconds=offset)
+            order = self.order(created_at)
+            yield 'order.created', order
+            for topic, event in self.status_events(order, created_at):
+                yield topic, event
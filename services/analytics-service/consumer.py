@@ -15,9 +15,11 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 from src.kafka_consumer.consumer import event_consumer
 from src.utils.logger import logger
+from src.utils.metrics import start_metrics_server
 
 if __name__ == "__main__":
     logger.info("Starting Analytics Service - Kafka Consumer")
+    start_metrics_server()
     try:
         event_consumer.start()
     except KeyboardInterrupt:
@@ -0,0 +1,174 @@
+"""Live per-user interaction vectors.
+
+The consumer adds each ``order.created`` to the buyer's vector (product id ->
+quantity bought) as soon as it is stored, and the recommender scores from it
+alongside the trained model. Purchases then show up in recommendations
+within seconds instead of after the next retrain.
+
+Vectors live in Redis so the consumer process and every API worker see the
+same data, and expire after ``INTERACTION_TTL_SECONDS`` without purchases.
+Each order is added at most once per TTL: replayed or redelivered orders
+find their order id already marked and leave the vector unchanged.
+When Redis is not configured, an in-process store is used instead. It is
+only shared when the consumer runs inside the API process (embedded storage
+backends). While Redis is unreachable, calls fall back to the in-process
+store and Redis is tried again after ``REDIS_RETRY_SECONDS``. With the
+ClickHouse backend the consumer runs as a separate process, and API workers
+never read its memory: purchases made during an outage reach recommendations
+only with the next retrain.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from src.utils.logger import logger
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is in requirements.txt
+    redis = None
+
+KEY_PREFIX = 'analytics:interactions:'
+# Orders already added to a vector, kept for the vector TTL
+ORDER_KEY_PREFIX = 'analytics:interaction-orders:'
+
+# Adds an order's items to the user's vector unless the order was already
+# added. KEYS: vector hash, order marker. ARGV: ttl, then product/quantity pairs.
+RECORD_ORDER_SCRIPT = """
+if not redis.call('SET', KEYS[2], 1, 'NX', 'EX', ARGV[1]) then
+    return 0
+end
+for i = 2, #ARGV, 2 do
+    redis.call('HINCRBYFLOAT', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+class MemoryInteractionStore:
+    name = 'memory'
+
+    def __init__(self, ttl: float, max_users: int = 100000, max_orders: int = 1000000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.max_orders = max_orders
+        # user_id -> (expires_at, {product_id: quantity}), least recently updated first
+        self.vectors = OrderedDict()
+        # order_id -> expires_at of the orders already added, oldest first
+        self.orders = OrderedDict()
+        self.lock = threading.Lock()
+
+    def record_order(self, user_id: str, order_id: str, items: list):
+        now = time.monotonic()
+        with self.lock:
+            if self.orders.get(order_id, 0.0) > now:
+                return
+            self.orders.pop(order_id, None)
+            self.orders[order_id] = now + self.ttl
+            # Every order gets the same TTL, so the oldest entries expire first
+            while self.orders and (len(self.orders) > self.max_orders or next(iter(self.orders.values())) <= now):
+                self.orders.popitem(last=False)
+
+            _, vector = self.vectors.pop(user_id, (None, {}))
+            for item in items:
+                product_id = item.get('product_id')
+                vector[product_id] = vector.get(product_id, 0.0) + float(item.get('quantity', 1))
+            self.vectors[user_id] = (now + self.ttl, vector)
+            while len(self.vectors) > self.max_users:
+                self.vectors.popitem(last=False)
+
+    def get(self, user_id: str) -> dict:
+        with self.lock:
+            expires_at, vector = self.vectors.get(user_id, (0.0, {}))
+            if time.monotonic() >= expires_at:
+                self.vectors.pop(user_id, None)
+                return {}
+            return dict(vector)
+
+
+class RedisInteractionStore:
+    """One Redis hash per user: product_id -> quantity bought.
+
+    The client connects on first use and reconnects by itself. A call
+    failing with a Redis error is answered by ``fallback`` instead, and Redis is skipped for
+    ``retry_seconds`` so the request path does not wait on a timeout per call.
+    """
+
+    name = 'redis'
+
+    def __init__(self, client, ttl: float, fallback, retry_seconds: float = 5.0):
+        self.client = client
+        self.ttl = int(ttl)
+        self.fallback = fallback
+        self.retry_seconds = retry_seconds
+        self.retry_at = 0.0
+        self.record_script = client.register_script(RECORD_ORDER_SCRIPT)
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.retry_at
+
+    def failed(self, error):
+        self.retry_at = time.monotonic() + self.retry_seconds
+        logger.warning(f"Redis unavailable, using in-process interaction vectors for {self.retry_seconds:g}s: {error}")
+
+    def record_order(self, user_id: str, order_id: str, items: list):
+        """Add an order's items in one atomic script, unless the order was already added"""
+        if self.available():
+            args = [self.ttl]
+            for item in items:
+                args += [item.get('product_id'), float(item.get('quantity', 1))]
+            try:
+                self.record_script(keys=[KEY_PREFIX + user_id, ORDER_KEY_PREFIX + order_id], args=args)
+                return
+            except redis.RedisError as e:
+                self.failed(e)
+        self.fallback.record_order(user_id, order_id, items)
+
+    def get(self, user_id: str) -> dict:
+        if self.available():
+            try:
+                return {
+                    product_id.decode('utf-8'): float(quantity)
+                    for product_id, quantity in self.client.hgetall(KEY_PREFIX + user_id).items()
+                }
+            except redis.RedisError as e:
+                self.failed(e)
+        return self.fallback.get(user_id)
+
+
+def create_interaction_store():
+    """Redis-backed store with an in-process fallback, or only the in-process one.
+
+    Nothing is sent to Redis here: the client connects on first use, so a
+    Redis outage at startup does not pin the process to the fallback.
+    """
+    ttl = float(os.getenv('INTERACTION_TTL_SECONDS', 7 * 24 * 3600))
+    memory = MemoryInteractionStore(
+        ttl,
+        int(os.getenv('INTERACTION_MEMORY_MAX_USERS', 100000)),
+        int(os.getenv('INTERACTION_MEMORY_MAX_ORDERS', 1000000))
+    )
+    if os.getenv('INTERACTION_STORE', 'redis') != 'redis':
+        return memory
+    if redis is None:
+        logger.warning("Redis client not installed, keeping interaction vectors in process")
+        return memory
+    from redis.backoff import NoBackoff
+    from redis.retry import Retry
+    client = redis.Redis(
+        host=os.getenv('REDIS_HOST', 'localhost'),
+        port=int(os.getenv('REDIS_PORT', 6379)),
+        db=int(os.getenv('REDIS_DB', 0)),
+        password=os.getenv('REDIS_PASSWORD') or None,
+        # Looked up on the request path, so fail fast rather than stall
+        socket_timeout=float(os.getenv('REDIS_SOCKET_TIMEOUT', 0.1)),
+        socket_connect_timeout=float(os.getenv('REDIS_SOCKET_TIMEOUT', 0.1)),
+        # Failed calls fall back right away and Redis is retried later
+        retry=Retry(NoBackoff(), 0)
+    )
+    logger.info("Interaction vectors stored in Redis")
+    return RedisInteractionStore(client, ttl, memory, float(os.getenv('REDIS_RETRY_SECONDS', 5)))
+
+
+interaction_store = create_interaction_store()
@@ -0,0 +1,114 @@
+"""Shared, read-only storage for trained model arrays.
+
+The trainer publishes each model as a *generation*: a directory of ``.npy``
+files under ``MODEL_STORE_DIR`` (``/dev/shm`` by default, so the files live in
+RAM). Readers open the arrays with ``mmap_mode='r'``, so every uvicorn worker
+maps the same physical pages instead of holding its own copy, and per-worker
+memory does not grow with the model.
+
+Publishing is atomic: arrays are written to a temporary directory which is
+renamed into place, then the ``CURRENT`` pointer file is swapped with
+``os.replace``. Readers that still map an older generation keep working; the
+previous generation is kept for readers that are mid-switch and anything
+older is removed.
+"""
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+import numpy as np
+from src.utils.logger import logger
+
+CURRENT_FILE = 'CURRENT'
+LOCK_FILE = 'train.lock'
+META_FILE = 'meta.json'
+GENERATION_PREFIX = 'gen-'
+
+
+def default_store_dir():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'analytics-model')
+
+
+class ModelStore:
+    def __init__(self, root: str = None):
+        self.root = root or os.getenv('MODEL_STORE_DIR') or default_store_dir()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    @contextmanager
+    def training_lock(self, blocking: bool = True):
+        """Exclusive lock electing one trainer across worker processes.
+
+        Yields True when the lock is held, False when ``blocking`` is off and
+        another process is already training.
+        """
+        with open(self._path(LOCK_FILE), 'a') as lock:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(lock, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def current_generation(self):
+        try:
+            with open(self._path(CURRENT_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def metadata(self, generation: str) -> dict:
+        with open(self._path(generation, META_FILE)) as f:
+            return json.load(f)
+
+    def publish(self, arrays: dict, meta: dict = None) -> str:
+        """Write ``arrays`` as a new generation and make it current"""
+        generation = f"{GENERATION_PREFIX}{time.time_ns()}"
+        staging = tempfile.mkdtemp(prefix='.staging-', dir=self.root)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+            with open(os.path.join(staging, META_FILE), 'w') as f:
+                json.dump({**(meta or {}), 'generation': generation, 'published_at': time.time()}, f)
+            os.rename(staging, self._path(generation))
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        pointer = self._path(f".{CURRENT_FILE}.{os.getpid()}")
+        with open(pointer, 'w') as f:
+            f.write(generation)
+        os.replace(pointer, self._path(CURRENT_FILE))
+
+        self._remove_old_generations(keep=2)
+        logger.info(f"Published model generation {generation} to {self.root}")
+        return generation
+
+    def load(self, generation: str) -> dict:
+        """Memory-map every array of a generation read-only"""
+        directory = self._path(generation)
+        return {
+            name[:-len('.npy')]: np.load(os.path.join(directory, name), mmap_mode='r', allow_pickle=False)
+            for name in os.listdir(directory)
+            if name.endswith('.npy')
+        }
+
+    def _remove_old_generations(self, keep: int):
+        generations = sorted(
+            (name for name in os.listdir(self.root) if name.startswith(GENERATION_PREFIX)),
+            key=lambda name: int(name[len(GENERATION_PREFIX):])
+        )
+        # Mapped files stay valid after unlinking, so only readers that have
+        # not opened a generation yet need it to exist
+        for name in generations[:-keep]:
+            shutil.rmtree(self._path(name), ignore_errors=True)
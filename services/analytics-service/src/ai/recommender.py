@@ -1,34 +1,46 @@
+import os
+import time
 import pandas as pd
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 from collections import defaultdict
-from src.kafka_consumer.clickhouse_client import clickhouse_client
+from src.ai.interactions import interaction_store
+from src.ai.model_store import ModelStore
+from src.storage import storage
 from src.utils.logger import logger
+from src.utils.metrics import (
+    RECOMMENDER_MODEL_BYTES,
+    RECOMMENDER_MODEL_ENTITIES,
+    RECOMMENDER_PHASE_DURATION
+)
 
 class ProductRecommender:
-    def __init__(self):
-        self.user_item_matrix = None
-        self.product_similarity = None
-        self.product_names = {}
+    """Item-similarity recommender backed by a shared, memory-mapped model.
+
+    One process trains and publishes the model arrays to a ``ModelStore``;
+    every worker maps them read-only and switches to newer generations as
+    they are published.
+    """
+
+    def __init__(self, store: ModelStore = None):
+        self.store = store or ModelStore()
+        # Read-only arrays of the attached generation: sorted user_ids and
+        # product_ids, product_names aligned with product_ids, the user_item
+        # matrix and the product similarity matrix
+        self.model = None
+        self.generation = None
+        self.last_refresh = 0.0
+        self.refresh_interval = float(os.getenv('MODEL_REFRESH_SECONDS', 5))
+        self.max_age = float(os.getenv('MODEL_MAX_AGE_SECONDS', 300))
+        # Cold-start fallback rows: (expires_at, limit fetched, rows)
+        self.popular_ttl = float(os.getenv('POPULAR_PRODUCTS_TTL_SECONDS', 60))
+        self.popular_cache = (0.0, 0, [])
         
     def load_data(self):
-        """Load order data from ClickHouse"""
+        """Load order data from the storage backend"""
         try:
             # Get all order items
-            query = """
-                SELECT 
-                    oi.order_id,
-                    oe.user_id,
-                    oi.product_id,
-                    oi.product_name,
-                    oi.quantity,
-                    oi.subtotal
-                FROM order_items_analytics oi
-                JOIN order_events oe ON oi.order_id = oe.order_id
-                WHERE oe.event_type = 'order.created'
-            """
-            
-            result = clickhouse_client.client.execute(query)
+            result = storage.get_training_order_items()
             
             if not result:
                 logger.warning("No order data available for recommendations")
@@ -39,9 +51,6 @@ class ProductRecommender:
                 'order_id', 'user_id', 'product_id', 'product_name', 'quantity', 'subtotal'
             ])
             
-            # Store product names
-            self.product_names = dict(zip(df['product_id'], df['product_name']))
-            
             logger.info(f"Loaded {len(df)} order items for recommendation engine")
             return df
             
@@ -75,7 +84,7 @@ class ProductRecommender:
         product_product = df.groupby('order_id')['product_id'].apply(list).reset_index()
         
         # Build co-purchase matrix
-        products = df['product_id'].unique()
+        products = np.sort(df['product_id'].unique())
         n_products = len(products)
         product_idx = {pid: idx for idx, pid in enumerate(products)}
         
@@ -95,22 +104,49 @@ class ProductRecommender:
         
         return pd.DataFrame(similarity, index=products, columns=products)
     
+    def start(self):
+        """Attach to a recently published model, training one if none is fresh.
+
+        Workers starting together queue on the training lock: the first one
+        trains and publishes, the rest find a fresh generation and attach.
+        """
+        with self.store.training_lock():
+            generation = self.store.current_generation()
+            if generation and time.time() - self.store.metadata(generation)['published_at'] < self.max_age:
+                logger.info(f"Attaching to published model generation {generation}")
+                return self.attach(generation)
+            return self._train()
+
     def train(self):
-        """Train the recommendation model"""
+        """Train the recommendation model and publish it to all workers"""
+        with self.store.training_lock():
+            return self._train()
+
+    def _train(self):
         try:
             logger.info("Training recommendation model...")
             
-            # Load data
-            df = self.load_data()
-            
-            if df.empty:
-                logger.warning("No data available for training")
-                return False
-            
-            # Build matrices
-            self.user_item_matrix = self.build_user_item_matrix(df)
-            self.product_similarity = self.calculate_product_similarity(df)
+            with RECOMMENDER_PHASE_DURATION.labels('train').time():
+                # Load data
+                with RECOMMENDER_PHASE_DURATION.labels('load_data').time():
+                    df = self.load_data()
+                
+                if df.empty:
+                    logger.warning("No data available for training")
+                    return False
+                
+                # Build matrices
+                with RECOMMENDER_PHASE_DURATION.labels('build_user_item_matrix').time():
+                    user_item_matrix = self.build_user_item_matrix(df)
+                with RECOMMENDER_PHASE_DURATION.labels('calculate_product_similarity').time():
+                    product_similarity = self.calculate_product_similarity(df)
+                
+                with RECOMMENDER_PHASE_DURATION.labels('publish').time():
+                    names = df.drop_duplicates('product_id').set_index('product_id')['product_name']
+                    generation = self.store.publish(self.to_arrays(user_item_matrix, product_similarity, names))
             
+            # Serve from the shared copy so the trainer holds no private model
+            self.attach(generation)
             logger.info("Recommendation model trained successfully")
             return True
             
@@ -118,42 +154,103 @@ class ProductRecommender:
             logger.error(f"Failed to train recommendation model: {e}")
             return False
     
+    def to_arrays(self, user_item_matrix, product_similarity, names):
+        """Flatten the trained frames into arrays keyed by sorted string ids"""
+        product_ids = product_similarity.index.to_numpy(dtype=str)
+        user_item_matrix = user_item_matrix.sort_index().reindex(columns=product_ids, fill_value=0)
+        return {
+            'user_ids': user_item_matrix.index.to_numpy(dtype=str),
+            'product_ids': product_ids,
+            'product_names': names.reindex(product_ids).fillna('Unknown').to_numpy(dtype=str),
+            'user_item': user_item_matrix.to_numpy(dtype=np.float32),
+            'similarity': product_similarity.to_numpy(dtype=np.float32)
+        }
+    
+    def attach(self, generation):
+        """Map a published generation and serve from it"""
+        self.model = self.store.load(generation)
+        self.generation = generation
+        self.last_refresh = time.monotonic()
+        self.record_model_size()
+        return True
+    
+    def refresh(self):
+        """Switch to a newer generation if one was published since the last check"""
+        now = time.monotonic()
+        if now - self.last_refresh < self.refresh_interval:
+            return
+        self.last_refresh = now
+        generation = self.store.current_generation()
+        if generation and generation != self.generation:
+            try:
+                self.attach(generation)
+                logger.info(f"Switched to model generation {generation}")
+            except FileNotFoundError:
+                # Superseded and removed between reading CURRENT and mapping it
+                logger.debug("Model generation %s disappeared before attaching", generation)
+    
+    def record_model_size(self):
+        """Publish model dimensions and memory footprint as metrics"""
+        RECOMMENDER_MODEL_BYTES.labels('user_item_matrix').set(self.model['user_item'].nbytes)
+        RECOMMENDER_MODEL_BYTES.labels('product_similarity').set(self.model['similarity'].nbytes)
+        RECOMMENDER_MODEL_ENTITIES.labels('users').set(len(self.model['user_ids']))
+        RECOMMENDER_MODEL_ENTITIES.labels('products').set(len(self.model['product_ids']))
+    
+    def status(self):
+        model = self.model
+        return {
+            'is_trained': model is not None,
+            'generation': self.generation,
+            'users_count': len(model['user_ids']) if model else 0,
+            'products_count': len(model['product_ids']) if model else 0
+        }
+    
+    @staticmethod
+    def _lookup(ids, key):
+        """Position of ``key`` in a sorted id array, or None"""
+        index = int(np.searchsorted(ids, key))
+        if index < len(ids) and ids[index] == key:
+            return index
+        return None
+    
     def get_user_recommendations(self, user_id, n=5):
         """Get product recommendations for a user"""
         try:
-            if self.user_item_matrix is None or self.user_item_matrix.empty:
+            self.refresh()
+            model = self.model
+            if model is None:
                 return []
             
-            # Check if user exists
-            if user_id not in self.user_item_matrix.index:
+            # Combine the trained history with purchases since the last
+            # training; the elementwise max avoids counting twice purchases
+            # already in the model
+            user_items = self.live_vector(model, user_id)
+            user_index = self._lookup(model['user_ids'], user_id)
+            if user_index is not None:
+                user_items = np.maximum(user_items, model['user_item'][user_index])
+            
+            if not user_items.any():
                 # Return popular products for new users
                 return self.get_popular_products(n)
             
-            # Get user's purchase history
-            user_items = self.user_item_matrix.loc[user_id]
-            purchased = user_items[user_items > 0].index.tolist()
-            
-            # Calculate similarity-based scores
-            scores = {}
-            for product in self.product_similarity.index:
-                if product not in purchased:
-                    # Score based on similarity to purchased items
-                    score = sum(
-                        self.product_similarity.loc[product, p] * user_items[p]
-                        for p in purchased
-                    )
-                    scores[product] = score
+            purchased = np.flatnonzero(user_items > 0)
+            candidates = np.flatnonzero(user_items <= 0)
+            
+            # Similarity-weighted sum over purchased items; the matrix is
+            # symmetric, so read the purchased rows rather than columns
+            scores = user_items[purchased] @ model['similarity'][purchased]
+            scores = scores[candidates]
             
             # Sort and get top N
-            top_products = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:n]
+            top = np.argsort(-scores, kind='stable')[:n]
             
             recommendations = [
                 {
-                    'product_id': pid,
-                    'product_name': self.product_names.get(pid, 'Unknown'),
-                    'score': float(score)
+                    'product_id': str(model['product_ids'][candidates[i]]),
+                    'product_name': str(model['product_names'][candidates[i]]),
+                    'score': float(scores[i])
                 }
-                for pid, score in top_products
+                for i in top
             ]
             
             return recommendations
@@ -162,31 +259,47 @@ class ProductRecommender:
             logger.error(f"Failed to get user recommendations: {e}")
             return []
     
+    def live_vector(self, model, user_id):
+        """The user's live interactions as a dense row over the model's products"""
+        vector = np.zeros(len(model['product_ids']), dtype=np.float32)
+        try:
+            interactions = interaction_store.get(user_id)
+        except Exception as e:
+            logger.warning(f"Failed to read live interactions: {e}")
+            return vector
+        if interactions:
+            product_ids = np.array(list(interactions), dtype=str)
+            positions = np.searchsorted(model['product_ids'], product_ids)
+            # Products newer than the model have no similarities yet
+            known = positions < len(model['product_ids'])
+            known[known] = model['product_ids'][positions[known]] == product_ids[known]
+            vector[positions[known]] = np.fromiter(interactions.values(), dtype=np.float32)[known]
+        return vector
+    
     def get_similar_products(self, product_id, n=5):
         """Get similar products based on co-purchase patterns"""
         try:
-            if self.product_similarity is None or self.product_similarity.empty:
+            self.refresh()
+            model = self.model
+            if model is None:
                 return []
             
-            if product_id not in self.product_similarity.index:
+            product_index = self._lookup(model['product_ids'], product_id)
+            if product_index is None:
                 return []
             
-            # Get similarity scores
-            similarities = self.product_similarity[product_id].sort_values(ascending=False)
-            
-            # Exclude the product itself
-            similarities = similarities[similarities.index != product_id]
-            
-            # Get top N
-            top_similar = similarities.head(n)
+            # Get similarity scores, excluding the product itself
+            similarities = model['similarity'][product_index]
+            ranked = np.argsort(-similarities, kind='stable')
+            top_similar = ranked[ranked != product_index][:n]
             
             recommendations = [
                 {
-                    'product_id': pid,
-                    'product_name': self.product_names.get(pid, 'Unknown'),
-                    'similarity': float(score)
+                    'product_id': str(model['product_ids'][i]),
+                    'product_name': str(model['product_names'][i]),
+                    'similarity': float(similarities[i])
                 }
-                for pid, score in top_similar.items()
+                for i in top_similar
             ]
             
             return recommendations
@@ -198,19 +311,13 @@ class ProductRecommender:
     def get_popular_products(self, n=5):
         """Get most popular products (fallback for cold start)"""
         try:
-            query = f"""
-                SELECT 
-                    product_id,
-                    product_name,
-                    sum(quantity) as total_sold,
-                    count(DISTINCT order_id) as order_count
-                FROM order_items_analytics
-                GROUP BY product_id, product_name
-                ORDER BY total_sold DESC
-                LIMIT {n}
-            """
-            
-            result = clickhouse_client.client.execute(query)
+            # Cached briefly so bursts of unknown users do not each run an
+            # aggregate over every order item
+            expires_at, cached_limit, result = self.popular_cache
+            if time.monotonic() >= expires_at or cached_limit < n:
+                result = storage.get_popular_products(n)
+                self.popular_cache = (time.monotonic() + self.popular_ttl, n, result)
+            result = result[:n]
             
             recommendations = [
                 {
@@ -0,0 +1,193 @@
+"""Admission control for the analytics API.
+
+Every route belongs to a cost class. Each class admits a bounded number of
+concurrent requests; further requests wait in a bounded queue until a slot
+frees up or their deadline passes. When the queue is full or the deadline
+expires the request is shed immediately with ``Retry-After``, so a flood of
+expensive aggregate queries cannot starve cheap in-memory endpoints.
+
+Classes also cap range and size query parameters (``days``, ``weeks``,
+``months``, ``limit``) so a single request cannot ask for an unbounded
+scan. All limits are per worker process and can be overridden with
+``ADMISSION_<CLASS>_<SETTING>`` environment variables, e.g.
+``ADMISSION_AGGREGATE_CONCURRENCY=16`` or ``ADMISSION_AGGREGATE_MAX_WEEKS=52``.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from urllib.parse import parse_qs
+from starlette.responses import JSONResponse
+from src.utils.metrics import ADMISSION_ACTIVE, ADMISSION_QUEUE_DEPTH, ADMISSION_QUEUE_WAIT, ADMISSION_SHED
+from src.utils.request_context import match_route_template
+
+# Route template -> cost class; unlisted routes are "cheap"
+ROUTE_CLASSES = {
+    "/api/analytics/dashboard": "aggregate",
+    "/api/analytics/sales/daily": "aggregate",
+    "/api/analytics/products/top-selling": "aggregate",
+    "/api/analytics/orders/status-distribution": "aggregate",
+    "/api/analytics/users/activity": "aggregate",
+    "/api/analytics/cohorts": "aggregate",
+    "/api/analytics/repeat-purchase": "aggregate",
+    "/api/ai/recommendations/popular": "aggregate",
+    "/api/analytics/export/{dataset}": "export",
+    "/api/ai/train": "training",
+}
+
+# Probes must answer even when every class is saturated
+EXEMPT_ROUTES = {"/health", "/metrics", "/api/analytics/health"}
+
+
+def _env(cost_class: str, setting: str, default):
+    value = os.getenv(f"ADMISSION_{cost_class.upper()}_{setting}")
+    return type(default)(value) if value is not None else default
+
+
+class CostClass:
+    """Concurrency limit with a bounded FIFO wait queue"""
+
+    def __init__(
+        self,
+        name: str,
+        concurrency: int,
+        queue_size: int,
+        queue_timeout_ms: int,
+        retry_after: int,
+        limits: dict = None,
+        reject_status: int = 503
+    ):
+        self.name = name
+        self.concurrency = _env(name, "CONCURRENCY", concurrency)
+        self.queue_size = _env(name, "QUEUE_SIZE", queue_size)
+        self.queue_timeout = _env(name, "QUEUE_TIMEOUT_MS", queue_timeout_ms) / 1000
+        self.retry_after = _env(name, "RETRY_AFTER", retry_after)
+        # Query parameter -> largest accepted value
+        self.limits = {
+            param: _env(name, f"MAX_{param.upper()}", maximum)
+            for param, maximum in (limits or {}).items()
+        }
+        self.reject_status = reject_status
+
+        self.active = 0
+        self.waiters = deque()
+        self.active_gauge = ADMISSION_ACTIVE.labels(name)
+        self.queue_gauge = ADMISSION_QUEUE_DEPTH.labels(name)
+        self.wait_histogram = ADMISSION_QUEUE_WAIT.labels(name)
+
+    def check_params(self, query: dict):
+        """Error message for the first query parameter outside this class' range"""
+        for param, maximum in self.limits.items():
+            values = query.get(param)
+            if not values:
+                continue
+            try:
+                value = int(values[0])
+            except ValueError:
+                # Left to request validation
+                continue
+            if not 1 <= value <= maximum:
+                return f"{param} must be between 1 and {maximum}"
+        return None
+
+    async def acquire(self):
+        """Take a slot, waiting up to the queue timeout; returns a shed reason on failure"""
+        if self.active < self.concurrency and not self.waiters:
+            self.active += 1
+            self.active_gauge.set(self.active)
+            self.wait_histogram.observe(0)
+            return None
+        if len(self.waiters) >= self.queue_size:
+            return "queue_full"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.queue_gauge.set(len(self.waiters))
+        start = time.perf_counter()
+        try:
+            # A released slot is handed over by resolving the waiter
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            return "timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            self.queue_gauge.set(len(self.waiters))
+        self.wait_histogram.observe(time.perf_counter() - start)
+        return None
+
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                # The slot passes straight to the next waiter
+                waiter.set_result(True)
+                self.queue_gauge.set(len(self.waiters))
+                return
+        self.active -= 1
+        self.active_gauge.set(self.active)
+
+
+def default_classes():
+    return {
+        "cheap": CostClass("cheap", concurrency=64, queue_size=128, queue_timeout_ms=1000, retry_after=1,
+                           limits={"limit": 50}),
+        "aggregate": CostClass("aggregate", concurrency=8, queue_size=32, queue_timeout_ms=2000, retry_after=5,
+                               limits={"days": 365, "weeks": 104, "months": 36, "limit": 100}),
+        "export": CostClass("export", concurrency=2, queue_size=4, queue_timeout_ms=1000, retry_after=30,
+                            limits={"limit": 1000000}),
+        # A retrain is already running when the single slot is taken
+        "training": CostClass("training", concurrency=1, queue_size=0, queue_timeout_ms=0, retry_after=60,
+                              reject_status=429),
+    }
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying per-route cost classes.
+
+    Disabled with ``ADMISSION_CONTROL_ENABLED=false``.
+    """
+
+    def __init__(self, app, classes: dict = None):
+        self.app = app
+        self.enabled = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.classes = classes or default_classes()
+
+    def classify(self, scope):
+        template = match_route_template(scope)
+        if template in EXEMPT_ROUTES:
+            return None
+        return self.classes[ROUTE_CLASSES.get(template, "cheap")]
+
+    async def __call__(self, scope, receive, send):
+        cost_class = self.classify(scope) if self.enabled and scope["type"] == "http" else None
+        if cost_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        error = cost_class.check_params(query)
+        if error:
+            ADMISSION_SHED.labels(cost_class.name, "param_cap").inc()
+            await JSONResponse({"detail": error}, status_code=400)(scope, receive, send)
+            return
+
+        reason = await cost_class.acquire()
+        if reason:
+            ADMISSION_SHED.labels(cost_class.name, reason).inc()
+            response = JSONResponse(
+                {"detail": f"Too many concurrent {cost_class.name} requests, retry later"},
+                status_code=cost_class.reject_status,
+                headers={"Retry-After": str(cost_class.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            cost_class.release()
@@ -19,8 +19,10 @@ async def train_model(background_tasks: BackgroundTasks):
         logger.error(f"Failed to start model training: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# A plain function: the Redis lookup of live interactions blocks, so it runs
+# in the threadpool instead of on the event loop
 @router.get("/recommendations/user/{user_id}")
-async def get_user_recommendations(user_id: str, limit: int = 5):
+def get_user_recommendations(user_id: str, limit: int = 5):
     """Get personalized product recommendations for a user"""
     try:
         recommendations = recommender.get_user_recommendations(user_id, limit)
@@ -58,7 +60,7 @@ async def get_similar_products(product_id: str, limit: int = 5):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/recommendations/popular")
-async def get_popular_products(limit: int = 10):
+def get_popular_products(limit: int = 10):
     """Get most popular products"""
     try:
         recommendations = recommender.get_popular_products(limit)
@@ -79,16 +81,10 @@ async def get_popular_products(limit: int = 10):
 async def get_model_status():
     """Get recommendation model status"""
     try:
-        is_trained = (
-            recommender.user_item_matrix is not None and
-            recommender.product_similarity is not None
-        )
-        
         return {
             "success": True,
             "data": {
-                "is_trained": is_trained,
-                "products_count": len(recommender.product_names),
+                **recommender.status(),
                 "timestamp": datetime.now().isoformat()
             }
         }
@@ -0,0 +1,208 @@
+import base64
+import csv
+import io
+import json
+import os
+from contextlib import closing
+from datetime import date, datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from src.storage import storage
+from src.api.responses import dumps
+
+router = APIRouter()
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv"
+
+# Rows serialized per chunk written to the socket
+CHUNK_ROWS = 1000
+
+# Paged CSV is buffered whole, so its pages are kept far smaller than the
+# streamed NDJSON pages admission control allows
+CSV_MAX_PAGE_ROWS = int(os.getenv('EXPORT_CSV_MAX_PAGE_ROWS', 10000))
+
+# name -> (row iterator, column names, keyset columns)
+DATASETS = {
+    "order-events": (
+        storage.iter_order_events,
+        ("event_id", "order_id", "user_id", "event_type", "timestamp", "total_amount", "status"),
+        ("timestamp", "event_id", "event_type")
+    ),
+    "user-spend": (
+        storage.iter_user_spend,
+        ("user_id", "order_count", "total_spent", "first_order_date", "last_order_date"),
+        ("user_id",)
+    ),
+    "product-sales": (
+        storage.iter_product_sales,
+        ("product_id", "product_name", "total_quantity", "total_revenue", "order_count"),
+        ("product_id",)
+    ),
+}
+
+
+def encode_token(values) -> str:
+    """Opaque keyset pagination token for the last row of a page"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def decode_token(token: str, key_columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        if not isinstance(values, list) or len(values) != len(key_columns):
+            raise ValueError("wrong number of key values")
+        return tuple(
+            datetime.fromisoformat(value) if column == "timestamp" else value
+            for column, value in zip(key_columns, values)
+        )
+    except (TypeError, ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid pagination token")
+
+
+def _format_value(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+
+def ndjson_chunks(rows, columns, key_indexes, limit):
+    """Serialize rows as NDJSON, CHUNK_ROWS at a time.
+
+    When a full page was returned the last line is ``{"next_token": ...}``.
+    """
+    count = 0
+    last = None
+    buffer = []
+    with closing(rows):
+        for row in rows:
+            buffer.append(dumps(dict(zip(columns, map(_format_value, row)))))
+            count += 1
+            last = row
+            if len(buffer) >= CHUNK_ROWS:
+                yield b"\n".join(buffer) + b"\n"
+                buffer = []
+    if limit and count == limit:
+        buffer.append(dumps({"next_token": encode_token([last[i] for i in key_indexes])}))
+    if buffer:
+        yield b"\n".join(buffer) + b"\n"
+
+
+def csv_chunks(rows, columns, key_indexes, limit):
+    """Serialize rows as CSV with a header, CHUNK_ROWS at a time.
+
+    CSV has no room for an in-band token, so when a full page was returned the
+    next-page token is the generator's return value (see ``csv_page``).
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    count = 0
+    last = None
+    with closing(rows):
+        for row in rows:
+            writer.writerow([_format_value(value) for value in row])
+            count += 1
+            last = row
+            if count % CHUNK_ROWS == 0:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+    if limit and count == limit:
+        return encode_token([last[i] for i in key_indexes])
+    return None
+
+
+def csv_page(rows, columns, key_indexes, limit):
+    """Serialize a whole page as CSV; returns the body and the next-page token"""
+    chunks = csv_chunks(rows, columns, key_indexes, limit)
+    body = []
+    while True:
+        try:
+            body.append(next(chunks))
+        except StopIteration as done:
+            return b"".join(body), done.value
+
+
+async def stream_chunks(chunks):
+    """Pull chunks from a blocking generator without blocking the event loop.
+
+    StreamingResponse cancels this generator when the client disconnects; the
+    blocking generator is then closed, which cancels the underlying storage
+    query instead of letting it run to completion.
+    """
+    try:
+        while True:
+            chunk = await run_in_threadpool(next, chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        chunks.close()
+
+
+def _resolve_format(request: Request, format: Optional[str]):
+    if format is None:
+        format = "csv" if CSV_MEDIA_TYPE in request.headers.get("accept", "") else "ndjson"
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    return format
+
+
+@router.get("/{dataset}")
+async def export_dataset(
+    request: Request,
+    dataset: str,
+    start: date,
+    end: Optional[date] = None,
+    format: Optional[str] = None,
+    limit: Optional[int] = None,
+    after: Optional[str] = None
+):
+    """Stream a dataset for the inclusive date range [start, end] as NDJSON or CSV.
+
+    Paged CSV is buffered so the next-page token can go in ``X-Next-Token``,
+    and its page size is capped at ``CSV_MAX_PAGE_ROWS``.
+    """
+    if dataset not in DATASETS:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset '{dataset}'")
+    if limit is not None and limit <= 0:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+
+    end = end or date.today()
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+
+    iterate, columns, key_columns = DATASETS[dataset]
+    format = _resolve_format(request, format)
+    if format == "csv" and limit and limit > CSV_MAX_PAGE_ROWS:
+        raise HTTPException(status_code=400, detail=f"limit must be at most {CSV_MAX_PAGE_ROWS} for paged CSV")
+    cursor = decode_token(after, key_columns) if after else None
+
+    rows = iterate(
+        datetime.combine(start, datetime.min.time()),
+        datetime.combine(end + timedelta(days=1), datetime.min.time()),
+        after=cursor,
+        limit=limit
+    )
+    key_indexes = [columns.index(column) for column in key_columns]
+
+    filename = f"{dataset}_{start.isoformat()}_{end.isoformat()}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+    if format == "csv" and limit:
+        body, next_token = await run_in_threadpool(csv_page, rows, columns, key_indexes, limit)
+        if next_token:
+            headers["X-Next-Token"] = next_token
+        return Response(body, media_type=CSV_MEDIA_TYPE, headers=headers)
+
+    if format == "csv":
+        chunks, media_type = csv_chunks(rows, columns, key_indexes, limit), CSV_MEDIA_TYPE
+    else:
+        chunks, media_type = ndjson_chunks(rows, columns, key_indexes, limit), NDJSON_MEDIA_TYPE
+    return StreamingResponse(stream_chunks(chunks), media_type=media_type, headers=headers)
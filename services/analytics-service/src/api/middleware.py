@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from urllib.parse import parse_qs
+from src.utils.metrics import HTTP_REQUEST_DURATION
+from src.utils.profiler import SamplingProfiler
+from src.utils.request_context import bind_scope, match_route_template, route_template, unbind_scope
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording request latency per route template.
+
+    Routes are labelled by their template (``/recommendations/user/{user_id}``)
+    rather than the raw path to keep label cardinality bounded. Requests
+    answered before routing, such as those rejected by admission control, are
+    matched against the routes here. The scope is also bound to the request context so queries can be tagged with the
+    calling endpoint.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+        token = bind_scope(scope)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            unbind_scope(token)
+            route = route_template(scope)
+            if route == "unmatched":
+                route = match_route_template(scope)
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"], route, str(status)
+            ).observe(time.perf_counter() - start)
+
+
+class ProfilingMiddleware:
+    """Opt-in per-request sampling profiler.
+
+    When ``REQUEST_PROFILING_ENABLED`` is set, a request carrying the
+    ``X-Profile: 1`` header or the ``profile=1`` query parameter is executed as
+    usual but its body is replaced by the collapsed stacks sampled while the
+    handler ran. The handler's own status is reported in ``X-Profiled-Status``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.enabled = os.getenv('REQUEST_PROFILING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+    @staticmethod
+    def requested(scope) -> bool:
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                return value in (b"1", b"true")
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        return query.get("profile", [""])[0] in ("1", "true")
+
+    async def __call__(self, scope, receive, send):
+        if not (self.enabled and scope["type"] == "http" and self.requested(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def capture(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        start = time.perf_counter()
+        profiler = SamplingProfiler(threading.get_ident()).start()
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            profiler.stop()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        body = profiler.collapsed().encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-profile-format", b"collapsed"),
+                (b"x-profile-samples", str(profiler.sample_count).encode()),
+                (b"x-profiled-status", str(status).encode()),
+                (b"x-profiled-duration-ms", f"{elapsed_ms:.1f}".encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,170 @@
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - Arrow output is optional
+    pa = None
+
+JSON_MEDIA_TYPE = "application/json"
+COLUMNS_MEDIA_TYPE = "application/vnd.cloudcart.columns+json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+SUPPORTED_MEDIA_TYPES = (JSON_MEDIA_TYPE, COLUMNS_MEDIA_TYPE, ARROW_MEDIA_TYPE)
+
+# Negotiated responses differ by Accept header, so caches must key on it
+VARY_HEADERS = {"Vary": "Accept"}
+
+
+def _default(value):
+    """Fallback encoder for types neither orjson nor json handle natively"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    """Serialize content to JSON bytes using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse backed by orjson instead of the stdlib encoder"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+class Table:
+    """Column-oriented query result.
+
+    Built directly from ``execute(..., columnar=True)`` output so handlers can
+    transform whole columns instead of casting values row by row.
+    """
+
+    def __init__(self, names, columns):
+        self.names = list(names)
+        self.columns = {name: list(column) for name, column in zip(self.names, columns)}
+        for name in self.names:
+            self.columns.setdefault(name, [])
+
+    @classmethod
+    def from_result(cls, result, names):
+        """Wrap a columnar driver result (an empty list when there are no rows)"""
+        return cls(names, result or [[] for _ in names])
+
+    def __len__(self):
+        return len(self.columns[self.names[0]]) if self.names else 0
+
+    def column(self, name):
+        return self.columns[name]
+
+    def with_column(self, name, values):
+        """Add or replace a column, keeping insertion order for new names"""
+        if name not in self.columns:
+            self.names.append(name)
+        self.columns[name] = list(values)
+        return self
+
+    def select(self, *names):
+        """Return a new table restricted to the given columns"""
+        return Table(names, [self.columns[name] for name in names])
+
+    def to_records(self):
+        """Row-oriented representation: a list of dicts"""
+        names = self.names
+        return [dict(zip(names, values)) for values in zip(*(self.columns[name] for name in names))]
+
+    def to_columns(self):
+        """Column-oriented representation: a dict of lists"""
+        return {name: self.columns[name] for name in self.names}
+
+    def to_arrow(self, metadata=None):
+        arrays = [pa.array(self.columns[name]) for name in self.names]
+        schema_metadata = {key: dumps(value) for key, value in (metadata or {}).items()}
+        return pa.Table.from_arrays(arrays, names=self.names).replace_schema_metadata(schema_metadata)
+
+
+def negotiate(request: Request, allow_arrow: bool = True) -> str:
+    """Pick the response media type from the Accept header.
+
+    Falls back to row-oriented JSON when nothing acceptable is requested, so
+    existing clients keep working unchanged.
+    """
+    accept = request.headers.get("accept", "")
+    candidates = []
+    for position, part in enumerate(accept.split(",")):
+        media_type, _, params = part.strip().partition(";")
+        media_type = media_type.strip().lower()
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            candidates.append((-quality, position, media_type))
+
+    for _, _, media_type in sorted(candidates):
+        if media_type == ARROW_MEDIA_TYPE and not (allow_arrow and pa is not None):
+            continue
+        if media_type in SUPPORTED_MEDIA_TYPES:
+            return media_type
+    return JSON_MEDIA_TYPE
+
+
+def table_response(request: Request, key: str, table: Table, extra: dict = None) -> Response:
+    """Render a single-table payload in the negotiated format.
+
+    ``key`` is the name of the table inside ``data`` and ``extra`` holds the
+    scalar fields that accompany it (``period_days``, ``limit`` ...). Arrow
+    responses carry ``extra`` as schema metadata.
+    """
+    extra = extra or {}
+    media_type = negotiate(request)
+
+    if media_type == ARROW_MEDIA_TYPE:
+        arrow_table = table.to_arrow(metadata=extra)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+        return Response(content=sink.getvalue(), media_type=ARROW_MEDIA_TYPE, headers=VARY_HEADERS)
+
+    if media_type == COLUMNS_MEDIA_TYPE:
+        data = {key: table.to_columns(), **extra}
+        return FastJSONResponse({"success": True, "data": data}, media_type=COLUMNS_MEDIA_TYPE, headers=VARY_HEADERS)
+
+    data = {key: table.to_records(), **extra}
+    return FastJSONResponse({"success": True, "data": data}, headers=VARY_HEADERS)
+
+
+def tables_response(request: Request, tables: dict, extra: dict = None) -> Response:
+    """Render a payload made of several tables (e.g. the dashboard).
+
+    Arrow IPC carries a single schema per stream, so multi-table payloads only
+    negotiate between the row and column JSON shapes.
+    """
+    extra = extra or {}
+    media_type = negotiate(request, allow_arrow=False)
+
+    if media_type == COLUMNS_MEDIA_TYPE:
+        data = {**extra, **{key: table.to_columns() for key, table in tables.items()}}
+        return FastJSONResponse({"success": True, "data": data, "message": None}, media_type=COLUMNS_MEDIA_TYPE, headers=VARY_HEADERS)
+
+    data = {**extra, **{key: table.to_records() for key, table in tables.items()}}
+    return FastJSONResponse({"success": True, "data": data, "message": None}, headers=VARY_HEADERS)
@@ -1,181 +1,194 @@
-from fastapi import APIRouter, HTTPException
-from src.kafka_consumer.clickhouse_client import clickhouse_client
+from fastapi import APIRouter, HTTPException, Request
+from src.storage import storage
+from src.api.responses import FastJSONResponse, Table, table_response, tables_response
+from src.utils.slow_query_log import slow_query_log
 from src.utils.logger import logger
-from datetime import datetime
+from datetime import date, datetime, timedelta
+import os
 
 router = APIRouter()
 
+# Debug endpoints expose raw query text, so they are off unless explicitly enabled
+DEBUG_ENDPOINTS_ENABLED = os.getenv('DEBUG_ENDPOINTS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+DAILY_SALES_COLUMNS = ("date", "total_orders", "total_revenue", "average_order_value")
+TOP_PRODUCTS_COLUMNS = ("product_id", "product_name", "total_quantity", "total_revenue", "order_count")
+STATUS_COLUMNS = ("status", "count")
+TOP_USERS_COLUMNS = ("user_id", "order_count", "total_spent", "last_order_date")
+RETENTION_COLUMNS = ("cohort_week", "week_number", "active_users", "orders", "revenue")
+REPEAT_PURCHASE_COLUMNS = ("cohort_month", "customers", "repeat_customers", "orders")
+
+
+def _with_percentages(distribution: Table, total_orders):
+    """Add the share of each status relative to the total order count"""
+    counts = distribution.column("count")
+    if total_orders > 0:
+        percentages = [round(count / total_orders * 100, 2) for count in counts]
+    else:
+        percentages = [0] * len(counts)
+    return distribution.with_column("percentage", percentages)
+
+
 @router.get("/dashboard")
-async def get_dashboard():
+def get_dashboard(request: Request):
     """Get comprehensive dashboard metrics"""
     try:
-        total_orders, total_revenue, avg_order = clickhouse_client.get_total_metrics()
-        daily_sales = clickhouse_client.get_daily_sales(7)
-        top_products = clickhouse_client.get_top_products(10)
-        order_status = clickhouse_client.get_order_status_distribution()
+        total_orders, total_revenue, avg_order = storage.get_total_metrics()
+        total_orders = int(total_orders) if total_orders else 0
+        daily_sales = Table.from_result(storage.get_daily_sales(7, columnar=True), DAILY_SALES_COLUMNS)
+        top_products = Table.from_result(storage.get_top_products(10, columnar=True), TOP_PRODUCTS_COLUMNS)
+        order_status = Table.from_result(storage.get_order_status_distribution(columnar=True), STATUS_COLUMNS)
         
-        return {
-            "success": True,
-            "data": {
+        return tables_response(
+            request,
+            {
+                "recent_sales": daily_sales.select("date", "total_orders", "total_revenue"),
+                "top_products": top_products.select("product_name", "total_quantity", "total_revenue", "order_count"),
+                "order_status": _with_percentages(order_status, total_orders)
+            },
+            extra={
                 "overview": {
-                    "total_orders": int(total_orders) if total_orders else 0,
+                    "total_orders": total_orders,
                     "total_revenue": float(total_revenue) if total_revenue else 0.0,
                     "average_order_value": float(avg_order) if avg_order else 0.0
                 },
-                "recent_sales": [
-                    {
-                        "date": str(row[0]),
-                        "total_orders": int(row[1]),
-                        "total_revenue": float(row[2])
-                    }
-                    for row in daily_sales
-                ],
-                "top_products": [
-                    {
-                        "product_name": row[1],
-                        "total_quantity": int(row[2]),
-                        "total_revenue": float(row[3]),
-                        "order_count": int(row[4])
-                    }
-                    for row in top_products
-                ],
-                "order_status": [
-                    {
-                        "status": row[0],
-                        "count": int(row[1]),
-                        "percentage": round(float(row[1]) / total_orders * 100, 2) if total_orders > 0 else 0
-                    }
-                    for row in order_status
-                ],
                 "last_updated": datetime.now().isoformat()
-            },
-            "message": None
-        }
+            }
+        )
     except Exception as e:
         logger.error(f"Failed to get dashboard data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/sales/daily")
-async def get_daily_sales(days: int = 7):
+def get_daily_sales(request: Request, days: int = 7):
     """Get daily sales for the last N days"""
     try:
-        sales = clickhouse_client.get_daily_sales(days)
-        return {
-            "success": True,
-            "data": {
-                "daily_sales": [
-                    {
-                        "date": str(row[0]),
-                        "total_orders": int(row[1]),
-                        "total_revenue": float(row[2]),
-                        "average_order_value": float(row[3])
-                    }
-                    for row in sales
-                ],
-                "period_days": days
-            }
-        }
+        sales = Table.from_result(storage.get_daily_sales(days, columnar=True), DAILY_SALES_COLUMNS)
+        return table_response(request, "daily_sales", sales, extra={"period_days": days})
     except Exception as e:
         logger.error(f"Failed to get daily sales: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/products/top-selling")
-async def get_top_selling_products(limit: int = 10):
+def get_top_selling_products(request: Request, limit: int = 10):
     """Get top selling products"""
     try:
-        products = clickhouse_client.get_top_products(limit)
-        return {
-            "success": True,
-            "data": {
-                "products": [
-                    {
-                        "product_id": row[0],
-                        "product_name": row[1],
-                        "total_quantity": int(row[2]),
-                        "total_revenue": float(row[3]),
-                        "order_count": int(row[4])
-                    }
-                    for row in products
-                ],
-                "limit": limit
-            }
-        }
+        products = Table.from_result(storage.get_top_products(limit, columnar=True), TOP_PRODUCTS_COLUMNS)
+        return table_response(request, "products", products, extra={"limit": limit})
     except Exception as e:
         logger.error(f"Failed to get top products: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/orders/status-distribution")
-async def get_order_status_distribution():
+def get_order_status_distribution(request: Request):
     """Get order status distribution"""
     try:
-        total_orders, _, _ = clickhouse_client.get_total_metrics()
-        distribution = clickhouse_client.get_order_status_distribution()
+        total_orders, _, _ = storage.get_total_metrics()
+        total_orders = int(total_orders) if total_orders else 0
+        distribution = Table.from_result(storage.get_order_status_distribution(columnar=True), STATUS_COLUMNS)
         
-        return {
-            "success": True,
-            "data": {
-                "distribution": [
-                    {
-                        "status": row[0],
-                        "count": int(row[1]),
-                        "percentage": round(float(row[1]) / total_orders * 100, 2) if total_orders > 0 else 0
-                    }
-                    for row in distribution
-                ],
-                "total_orders": int(total_orders) if total_orders else 0
-            }
-        }
+        return table_response(
+            request,
+            "distribution",
+            _with_percentages(distribution, total_orders),
+            extra={"total_orders": total_orders}
+        )
     except Exception as e:
         logger.error(f"Failed to get order status distribution: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/users/activity")
-async def get_user_activity(days: int = 30):
+def get_user_activity(request: Request, days: int = 30):
     """Get top active users by spending"""
     try:
-        query = f"""
-            SELECT 
-                user_id,
-                count(DISTINCT order_id) as order_count,
-                sum(total_amount) as total_spent,
-                max(timestamp) as last_order_date
-            FROM order_events
-            WHERE event_type = 'order.created'
-              AND timestamp >= now() - INTERVAL {days} DAY
-            GROUP BY user_id
-            ORDER BY total_spent DESC
-            LIMIT 10
-        """
+        users = Table.from_result(storage.get_top_users(days, 10, columnar=True), TOP_USERS_COLUMNS)
+        users.with_column("last_order_date", map(str, users.column("last_order_date")))
         
-        result = clickhouse_client.client.execute(query)
+        return table_response(request, "top_users", users, extra={"period_days": days})
+    except Exception as e:
+        logger.error(f"Failed to get user activity: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/cohorts")
+def get_cohort_retention(request: Request, weeks: int = 12):
+    """Weekly retention of the customer cohorts of the last N weeks"""
+    try:
+        today = date.today()
+        since = today - timedelta(days=today.weekday(), weeks=weeks - 1)
+        retention = Table.from_result(storage.get_weekly_retention(since, columnar=True), RETENTION_COLUMNS)
         
-        return {
-            "success": True,
-            "data": {
-                "top_users": [
-                    {
-                        "user_id": row[0],
-                        "order_count": int(row[1]),
-                        "total_spent": float(row[2]),
-                        "last_order_date": str(row[3])
-                    }
-                    for row in result
-                ],
-                "period_days": days
-            }
+        # Week 0 of a cohort is every customer who joined that week
+        cohort_weeks = retention.column("cohort_week")
+        active_users = retention.column("active_users")
+        sizes = {
+            cohort_week: active
+            for cohort_week, week_number, active in zip(cohort_weeks, retention.column("week_number"), active_users)
+            if week_number == 0
         }
+        cohort_sizes = [sizes.get(cohort_week, 0) for cohort_week in cohort_weeks]
+        retention.with_column("cohort_size", cohort_sizes)
+        retention.with_column("retention_rate", [
+            round(active / size * 100, 2) if size else 0
+            for active, size in zip(active_users, cohort_sizes)
+        ])
+        retention.with_column("cohort_week", map(str, cohort_weeks))
+        
+        return table_response(request, "retention", retention, extra={"weeks": weeks})
     except Exception as e:
-        logger.error(f"Failed to get user activity: {e}")
+        logger.error(f"Failed to get cohort retention: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/health")
-async def analytics_health():
-    """Health check for analytics service"""
+@router.get("/repeat-purchase")
+def get_repeat_purchase(request: Request, months: int = 12):
+    """Repeat-purchase rate of the monthly customer cohorts of the last N months"""
+    try:
+        first_of_month = date.today().replace(day=1)
+        month_index = first_of_month.year * 12 + first_of_month.month - 1 - (months - 1)
+        since = date(month_index // 12, month_index % 12 + 1, 1)
+        cohorts = Table.from_result(storage.get_repeat_purchase(since, columnar=True), REPEAT_PURCHASE_COLUMNS)
+        
+        customers = cohorts.column("customers")
+        cohorts.with_column("repeat_rate", [
+            round(repeat / total * 100, 2) if total else 0
+            for repeat, total in zip(cohorts.column("repeat_customers"), customers)
+        ])
+        cohorts.with_column("orders_per_customer", [
+            round(orders / total, 2) if total else 0
+            for orders, total in zip(cohorts.column("orders"), customers)
+        ])
+        cohorts.with_column("cohort_month", map(str, cohorts.column("cohort_month")))
+        
+        return table_response(request, "cohorts", cohorts, extra={"months": months})
+    except Exception as e:
+        logger.error(f"Failed to get repeat purchase rates: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/debug/slow-queries")
+async def get_slow_queries(limit: int = 50):
+    """Most recent queries that exceeded the slow-query threshold"""
+    if not DEBUG_ENDPOINTS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
     return {
         "success": True,
-        "message": "Analytics API is healthy",
         "data": {
-            "clickhouse": "connected",
+            "threshold_ms": slow_query_log.threshold_ms,
+            "queries": slow_query_log.recent(limit)
+        }
+    }
+
+@router.get("/health")
+def analytics_health():
+    """Health check for analytics service; 503 when the storage backend does not answer"""
+    connected = storage.ping()
+    body = {
+        "success": connected,
+        "message": "Analytics API is healthy" if connected else "Storage backend is unreachable",
+        "data": {
+            "storage": storage.name,
+            "database": "connected" if connected else "disconnected",
             "kafka": "connected"
         }
     }
+    if not connected:
+        return FastJSONResponse(body, status_code=503)
+    return body
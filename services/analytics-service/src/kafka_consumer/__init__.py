@@ -1,4 +1,3 @@
 from .consumer import event_consumer
-from .clickhouse_client import clickhouse_client
 
-__all__ = ['event_consumer', 'clickhouse_client']
+__all__ = ['event_consumer']
@@ -0,0 +1,79 @@
+"""Incremental cohort attribution for ingested orders.
+
+Each user belongs to the cohort of their first order. ``CohortTracker``
+takes the new orders of a consumer poll, looks up the first orders of the
+users it has not cached in one query (then serves them from an LRU cache),
+records the first orders of new customers, and adds the orders to the
+storage backend's weekly retention and monthly repeat-purchase aggregates in
+one write. Backends key those writes on order_id, so an order replayed from
+an old offset is not counted twice. The cohort endpoints then read the
+aggregates instead of scanning raw events.
+
+An order that arrives *before* the user's recorded first order (late or
+replayed from an old offset) moves the first order back, but orders already
+attributed stay in the old cohort. ``python -m src.kafka_consumer.cohorts
+rebuild`` recomputes every aggregate from stored events; run it after a
+backfill, and once after upgrading from a release without ``cohort_orders``.
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+from src.storage import storage
+
+
+class CohortTracker:
+    def __init__(self, max_users: int = 100000):
+        self.max_users = max_users
+        # user_id -> first order timestamp, least recently used first
+        self.first_orders = OrderedDict()
+        self.lock = threading.Lock()
+
+    def cached(self, user_ids):
+        """{user_id: first order} for the users in the cache"""
+        with self.lock:
+            found = {}
+            for user_id in user_ids:
+                if user_id in self.first_orders:
+                    self.first_orders.move_to_end(user_id)
+                    found[user_id] = self.first_orders[user_id]
+            return found
+
+    def remember(self, first_orders: dict):
+        with self.lock:
+            for user_id, first_order in first_orders.items():
+                self.first_orders[user_id] = first_order
+                self.first_orders.move_to_end(user_id)
+            while len(self.first_orders) > self.max_users:
+                self.first_orders.popitem(last=False)
+
+    def record_orders(self, orders: list):
+        """Attribute (order_id, user_id, timestamp, total_amount) orders to their users' cohorts"""
+        user_ids = {user_id for _, user_id, _, _ in orders}
+        first_orders = self.cached(user_ids)
+        missing = user_ids - first_orders.keys()
+        if missing:
+            first_orders.update(storage.get_first_orders(missing))
+
+        # Oldest first, so a new customer's first order in this batch is the
+        # one every later order is attributed to
+        new_first_orders = {}
+        rows = []
+        for order_id, user_id, timestamp, total_amount in sorted(orders, key=lambda order: order[2]):
+            first_order = first_orders.get(user_id)
+            if first_order is None or timestamp < first_order:
+                first_orders[user_id] = new_first_orders[user_id] = first_order = timestamp
+            rows.append((order_id, user_id, first_order, timestamp, float(total_amount or 0)))
+
+        storage.set_first_orders(new_first_orders)
+        storage.record_cohort_orders(rows)
+        self.remember(first_orders)
+
+
+cohort_tracker = CohortTracker(int(os.getenv('COHORT_CACHE_USERS', 100000)))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['rebuild']:
+        sys.exit("usage: python -m src.kafka_consumer.cohorts rebuild")
+    storage.rebuild_cohorts()
@@ -1,8 +1,15 @@
-from kafka import KafkaConsumer
+from kafka import KafkaConsumer, OffsetAndMetadata
 import json
 import os
+from datetime import datetime, timedelta, timezone
+from src.ai.interactions import interaction_store
+from src.kafka_consumer.cohorts import cohort_tracker
+from src.kafka_consumer.dedup import RecentEventFilter
 from src.utils.logger import logger
-from src.kafka_consumer.clickhouse_client import clickhouse_client
+from src.utils.metrics import (
+    CONSUMER_BATCH_DURATION, CONSUMER_BATCH_SIZE, CONSUMER_EVENT_DURATION, CONSUMER_EVENTS, CONSUMER_LAG
+)
+from src.storage import storage
 import time
 
 class OrderEventConsumer:
@@ -10,7 +17,18 @@ class OrderEventConsumer:
         self.brokers = os.getenv('KAFKA_BROKERS', 'localhost:9092').split(',')
         self.group_id = os.getenv('KAFKA_GROUP_ID', 'analytics-service-group')
         self.topics = os.getenv('KAFKA_TOPICS', 'order.created,order.confirmed').split(',')
+        self.poll_timeout_ms = int(os.getenv('KAFKA_POLL_TIMEOUT_MS', 1000))
+        self.max_poll_records = int(os.getenv('KAFKA_MAX_POLL_RECORDS', 500))
+        self.lag_interval = float(os.getenv('KAFKA_LAG_INTERVAL_SECONDS', 15))
+        self.retry_backoff = float(os.getenv('KAFKA_RETRY_BACKOFF_MS', 1000)) / 1000
+        self.dedup_seed_hours = float(os.getenv('DEDUP_SEED_HOURS', 24))
+        self.recent_events = RecentEventFilter(
+            capacity=int(os.getenv('DEDUP_FILTER_CAPACITY', 1000000)),
+            error_rate=float(os.getenv('DEDUP_FILTER_ERROR_RATE', 0.001))
+        )
         self.consumer = None
+        self.running = False
+        self._lag_updated_at = 0.0
         
     def connect(self):
         """Connect to Kafka"""
@@ -24,7 +42,10 @@ class OrderEventConsumer:
                     bootstrap_servers=self.brokers,
                     group_id=self.group_id,
                     auto_offset_reset='earliest',
-                    enable_auto_commit=True,
+                    # Offsets are committed after each batch is stored, and
+                    # only up to the first event that failed; a replay of an
+                    # uncommitted batch is deduplicated
+                    enable_auto_commit=False,
                     value_deserializer=lambda m: json.loads(m.decode('utf-8'))
                 )
                 logger.info(f"Kafka consumer connected. Subscribed to topics: {self.topics}")
@@ -38,30 +59,149 @@ class OrderEventConsumer:
                     raise
         return False
     
-    def process_event(self, topic: str, event_data: dict):
-        """Process incoming Kafka event"""
+    def seed_recent_events(self):
+        """Load recently stored event keys so replays after a restart are dropped early"""
+        horizon = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=self.dedup_seed_hours)
         try:
-            logger.info(f"Processing event from topic: {topic}")
-            logger.debug(f"Event data: {event_data}")
+            self.recent_events.seed(storage.recent_event_ids(horizon), horizon)
+            logger.info(f"Deduplication filter seeded with {self.recent_events.current.count} events since {horizon}")
+        except Exception as e:
+            logger.warning(f"Failed to seed deduplication filter, checking every event against storage: {e}")
+    
+    def drop_duplicates(self, messages):
+        """(message, key) for the messages of a batch whose events are not stored yet.
+        
+        Events the filter has never seen and that are newer than its horizon
+        are new for certain. The rest (filter hits, which may be false
+        positives, and older events) are checked against storage in one query.
+        """
+        entries = []
+        unsure = []
+        seen = set()
+        for message in messages:
+            message.value['event_type'] = message.topic
+            key = storage.event_key(message.value)
+            if key[0] in seen:
+                CONSUMER_EVENTS.labels(message.topic, 'duplicate').inc()
+                continue
+            seen.add(key[0])
+            if not self.recent_events.covers(key[1]) or key[0] in self.recent_events:
+                unsure.append(key)
+            entries.append((message, key))
+        
+        existing = set()
+        if unsure:
+            try:
+                existing = storage.existing_event_ids(unsure)
+            except Exception as e:
+                # Inserts are idempotent, so writing a duplicate is safe, only wasteful
+                logger.warning(f"Failed to look up existing events: {e}")
+        
+        fresh = []
+        for message, key in entries:
+            if key[0] in existing:
+                CONSUMER_EVENTS.labels(message.topic, 'duplicate').inc()
+            else:
+                fresh.append((message, key))
+        return fresh
+    
+    def process_batch(self, entries):
+        """Store the fresh (message, key) entries of a poll with one write per table.
+        
+        If the batch write fails the events are retried one at a time. After
+        an event fails again, the later events of its partition are held back
+        so partition order is kept. Returns the messages that were not stored.
+        """
+        if not entries:
+            return []
+        start = time.perf_counter()
+        try:
+            storage.insert_order_batch([message.value for message, _ in entries])
+        except Exception as e:
+            logger.warning(f"Failed to insert batch of {len(entries)} events, retrying one at a time: {e}")
+            pending = []
+            blocked = set()
+            for message, key in entries:
+                partition = (message.topic, message.partition)
+                if partition in blocked or not self.process_event(message.topic, message.value, key):
+                    blocked.add(partition)
+                    pending.append(message)
+            return pending
+        CONSUMER_BATCH_DURATION.observe(time.perf_counter() - start)
+        self.after_store([(message.topic, message.value, key) for message, key in entries])
+        return []
+    
+    def process_event(self, topic: str, event_data: dict, key=None):
+        """Process incoming Kafka event; returns whether it was stored"""
+        start = time.perf_counter()
+        try:
+            logger.debug("Processing event from topic %s: %s", topic, event_data)
             
-            # Determine event type from topic
-            event_type = topic.replace('.', '_')
             event_data['event_type'] = topic
+            storage.insert_order_batch([event_data])
+        except Exception as e:
+            CONSUMER_EVENTS.labels(topic, 'error').inc()
+            logger.error(f"Failed to process event: {e}")
+            return False
+        finally:
+            CONSUMER_EVENT_DURATION.labels(topic).observe(time.perf_counter() - start)
+        self.after_store([(topic, event_data, key or storage.event_key(event_data))])
+        return True
+    
+    def after_store(self, stored):
+        """Remember stored (topic, event, key) entries and feed them to the live aggregates"""
+        orders = []
+        for topic, event_data, key in stored:
+            # Only remembered once stored, so a failed event is retried on replay
+            self.recent_events.add(*key)
+            CONSUMER_EVENTS.labels(topic, 'success').inc()
             
-            # Insert event into ClickHouse
-            clickhouse_client.insert_order_event(event_data)
-            
-            # If it's an order creation event, also insert items
-            if topic == 'order.created' and 'items' in event_data:
-                clickhouse_client.insert_order_items(
-                    order_id=event_data.get('orderId') or event_data.get('order_id'),
-                    items=event_data['items'],
-                    timestamp=event_data.get('timestamp')
+            if topic == 'order.created':
+                orders.append((event_data, key[1]))
+                if 'items' in event_data:
+                    self.record_interactions(event_data)
+        if orders:
+            self.record_cohorts(orders)
+    
+    def record_interactions(self, event_data: dict):
+        """Add a new order to the buyer's live interaction vector"""
+        try:
+            interaction_store.record_order(
+                event_data.get('userId') or event_data.get('user_id'),
+                event_data.get('orderId') or event_data.get('order_id'),
+                event_data['items']
+            )
+        except Exception as e:
+            # The order is stored; it reaches recommendations at the next retrain
+            logger.warning(f"Failed to record interactions: {e}")
+    
+    def record_cohorts(self, orders):
+        """Add new (event, timestamp) orders to their customer cohorts' retention aggregates"""
+        try:
+            cohort_tracker.record_orders([
+                (
+                    event_data.get('orderId') or event_data.get('order_id'),
+                    event_data.get('userId') or event_data.get('user_id'),
+                    timestamp,
+                    event_data.get('totalAmount') or event_data.get('total_amount') or 0
                 )
-            
-            logger.info(f"Event processed successfully: {topic}")
+                for event_data, timestamp in orders
+            ])
         except Exception as e:
-            logger.error(f"Failed to process event: {e}")
+            # The orders are stored; a cohort rebuild picks them up
+            logger.warning(f"Failed to record {len(orders)} cohort orders: {e}")
+    
+    def update_lag(self):
+        """Record per-partition lag from the high watermarks seen in fetches"""
+        try:
+            for partition in self.consumer.assignment():
+                highwater = self.consumer.highwater(partition)
+                if highwater is None:
+                    continue
+                lag = highwater - self.consumer.position(partition)
+                CONSUMER_LAG.labels(partition.topic, str(partition.partition)).set(lag)
+        except Exception as e:
+            logger.warning(f"Failed to update consumer lag: {e}")
     
     def start(self):
         """Start consuming messages"""
@@ -69,9 +209,25 @@ class OrderEventConsumer:
             self.connect()
         
         logger.info("Starting Kafka consumer...")
+        self.seed_recent_events()
+        self.running = True
         try:
-            for message in self.consumer:
-                self.process_event(message.topic, message.value)
+            while self.running:
+                batch = self.consumer.poll(timeout_ms=self.poll_timeout_ms, max_records=self.max_poll_records)
+                messages = [message for records in batch.values() for message in records]
+                if messages:
+                    CONSUMER_BATCH_SIZE.observe(len(messages))
+                    pending = self.process_batch(self.drop_duplicates(messages))
+                    if pending:
+                        self.rewind(batch, pending)
+                        time.sleep(self.retry_backoff)
+                    else:
+                        self.commit()
+                
+                now = time.monotonic()
+                if now - self._lag_updated_at >= self.lag_interval:
+                    self._lag_updated_at = now
+                    self.update_lag()
         except KeyboardInterrupt:
             logger.info("Consumer interrupted by user")
         except Exception as e:
@@ -79,6 +235,44 @@ class OrderEventConsumer:
         finally:
             self.close()
     
+    def commit(self, offsets=None):
+        """Commit the offsets of the batch just processed, or the given ones"""
+        try:
+            if offsets is None:
+                self.consumer.commit()
+            else:
+                self.consumer.commit(offsets)
+        except Exception as e:
+            logger.warning(f"Failed to commit offsets, the batch will be replayed: {e}")
+    
+    def rewind(self, batch, pending):
+        """Commit what was stored of a batch and seek back to the first event that was not.
+        
+        Per partition, offsets before the earliest pending message are
+        committed and the next poll resumes from it, so a failed event is
+        retried instead of being skipped. Partitions without pending messages
+        are committed in full.
+        """
+        first_pending = {}
+        for message in pending:
+            partition = (message.topic, message.partition)
+            first_pending[partition] = min(first_pending.get(partition, message.offset), message.offset)
+        
+        offsets = {}
+        for partition, records in batch.items():
+            offset = first_pending.get((partition.topic, partition.partition))
+            if offset is None:
+                offsets[partition] = OffsetAndMetadata(records[-1].offset + 1, None)
+            else:
+                offsets[partition] = OffsetAndMetadata(offset, None)
+                self.consumer.seek(partition, offset)
+        logger.warning(f"Retrying {len(pending)} events from {len(first_pending)} partitions after a failed insert")
+        self.commit(offsets)
+    
+    def stop(self):
+        """Ask the poll loop to exit after the current batch"""
+        self.running = False
+    
     def close(self):
         """Close consumer connection"""
         if self.consumer:
@@ -0,0 +1,88 @@
+"""Recently ingested events, used to drop replayed events before they are written.
+
+Events are identified by their (event_type, event_id) key: order-service
+reuses the order id as the id of an order's created and status events.
+``RecentEventFilter`` keeps those keys in a pair of rotating Bloom filters.
+A negative answer is definitive for events newer than the filter's
+*horizon*: every stored event after the horizon was either seeded from
+storage at startup or added after a successful insert. A positive answer
+can be a false positive, so the consumer confirms it with an exact storage
+lookup, as it does for events at or before the horizon.
+"""
+import hashlib
+import math
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Kirsch-Mitzenmacher double hashing over one 128-bit digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RecentEventFilter:
+    """Two-generation Bloom filter of (event_type, event_id) keys with a timestamp horizon.
+
+    When the current generation fills up it becomes the previous one and the
+    oldest generation is dropped. The horizon then advances to the newest
+    timestamp in the dropped generation, so that events the filter no longer
+    remembers are always checked against storage.
+    """
+
+    def __init__(self, capacity: int = 1000000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.current = BloomFilter(capacity, error_rate)
+        self.current_latest = None
+        self.previous = None
+        self.previous_latest = None
+        # Events at or before the horizon are not guaranteed to be in the filter
+        self.horizon = None
+
+    def seed(self, rows, horizon):
+        """Load (event_type, event_id, timestamp) rows of every stored event after ``horizon``"""
+        for event_type, event_id, timestamp in rows:
+            self.add((event_type, event_id), timestamp)
+        self.horizon = horizon if self.horizon is None else max(self.horizon, horizon)
+
+    def covers(self, timestamp) -> bool:
+        return self.horizon is not None and timestamp > self.horizon
+
+    def add(self, key: tuple, timestamp):
+        if self.current.count >= self.capacity:
+            self._rotate()
+        self.current.add(self._member(key))
+        if self.current_latest is None or timestamp > self.current_latest:
+            self.current_latest = timestamp
+
+    def _rotate(self):
+        if self.previous_latest is not None and self.horizon is not None:
+            self.horizon = max(self.horizon, self.previous_latest)
+        self.previous, self.previous_latest = self.current, self.current_latest
+        self.current, self.current_latest = BloomFilter(self.capacity, self.error_rate), None
+
+    def __contains__(self, key: tuple) -> bool:
+        member = self._member(key)
+        return member in self.current or (self.previous is not None and member in self.previous)
+
+    @staticmethod
+    def _member(key: tuple) -> str:
+        event_type, event_id = key
+        return f"{event_type}\x1f{event_id}"
@@ -1,18 +1,34 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST
 from src.api.routes import router as analytics_router
 from src.api.ai_routes import router as ai_router
+from src.api.export_routes import router as export_router
+from src.api.responses import FastJSONResponse
+from src.api.admission import AdmissionMiddleware
+from src.api.middleware import MetricsMiddleware, ProfilingMiddleware
 from src.ai.recommender import recommender
+from src.kafka_consumer.consumer import event_consumer
+from src.storage import storage
 from src.utils.logger import logger
+from src.utils.metrics import generate_metrics, mark_process_dead
 import os
+import threading
 
 app = FastAPI(
     title="CloudCart Analytics API",
     description="Real-time analytics and AI-powered recommendations",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=FastJSONResponse
 )
 
-# CORS
+# Request latency metrics, opt-in request profiling and per-route admission
+# control (innermost, so shed requests are still measured)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+# CORS (outermost, so shed and rejected responses carry its headers too)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -24,17 +40,30 @@ app.add_middleware(
 # Include routers
 app.include_router(analytics_router, prefix="/api/analytics", tags=["Analytics"])
 app.include_router(ai_router, prefix="/api/ai", tags=["AI Recommendations"])
+app.include_router(export_router, prefix="/api/analytics/export", tags=["Exports"])
 
 @app.on_event("startup")
 async def startup_event():
-    """Train recommendation model on startup"""
+    """Attach to the shared recommendation model, training it if needed"""
     logger.info("Starting Analytics API with AI capabilities...")
-    # Train model in background
+    # One worker trains and publishes; the others map the published arrays
     try:
-        recommender.train()
+        recommender.start()
         logger.info("AI recommendation model initialized")
     except Exception as e:
         logger.error(f"Failed to initialize AI model: {e}")
+    
+    # Embedded backends can only be opened by one process, so the consumer
+    # runs alongside the API instead of as a separate process
+    if storage.embedded:
+        threading.Thread(target=event_consumer.start, name="kafka-consumer", daemon=True).start()
+        logger.info(f"Kafka consumer started in-process for the {storage.name} backend")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if storage.embedded:
+        event_consumer.stop()
+    mark_process_dead()
 
 @app.get("/health")
 async def health_check():
@@ -48,6 +77,12 @@ async def health_check():
         }
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics for this API process, or for every worker when
+    ``PROMETHEUS_MULTIPROC_DIR`` is set"""
+    return Response(content=generate_metrics(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/")
 async def root():
     return {
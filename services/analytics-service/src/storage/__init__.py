@@ -0,0 +1,28 @@
+import importlib
+import os
+from .base import StorageBackend
+
+
+def create_backend(name: str = None) -> StorageBackend:
+    """Instantiate the backend selected by ``STORAGE_BACKEND``.
+
+    Accepts ``clickhouse`` (default), ``duckdb``, or a ``module:Class`` path for
+    custom backends such as the benchmark fakes. Drivers are imported lazily so
+    only the selected backend's dependency has to be installed.
+    """
+    name = name or os.getenv('STORAGE_BACKEND', 'clickhouse')
+    if name == 'clickhouse':
+        from .clickhouse_client import ClickHouseClient
+        return ClickHouseClient()
+    if name == 'duckdb':
+        from .duckdb_client import DuckDBClient
+        return DuckDBClient()
+    if ':' in name:
+        module_name, class_name = name.split(':', 1)
+        return getattr(importlib.import_module(module_name), class_name)()
+    raise ValueError(f"Unknown storage backend '{name}'")
+
+
+storage = create_backend()
+
+__all__ = ['StorageBackend', 'create_backend', 'storage']
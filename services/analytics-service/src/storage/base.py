@@ -0,0 +1,218 @@
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+
+
+class StorageBackend(ABC):
+    """Storage operations used by the consumer, the API and the recommender.
+
+    Read methods return driver-style results: a list of row tuples, or a list
+    of column lists when ``columnar=True`` (an empty list when there are no
+    rows). ``iter_*`` methods return row iterators whose ``close()`` cancels
+    the underlying query.
+    """
+
+    name = None
+    # True when the engine runs inside this process, so the Kafka consumer
+    # has to share the process with the API instead of running separately
+    embedded = False
+
+    def parse_timestamp(self, ts):
+        if isinstance(ts, str):
+            ts = ts.replace('Z', '').replace('T', ' ').split('.')[0]
+            return datetime.strptime(ts, '%Y-%m-%d %H:%M:%S')
+        return ts
+
+    def event_key(self, event_data: dict):
+        """((event_type, event_id), timestamp) identifying an event across replays.
+
+        order-service reuses the order id as the event id of the created
+        event and of every status event, so the id is only unique per type.
+        Events without an id get one derived from their type, order,
+        timestamp and status, so replays of the same event map to the same id.
+        """
+        timestamp = self.parse_timestamp(event_data.get('timestamp'))
+        event_id = event_data.get('eventId') or event_data.get('event_id')
+        if not event_id:
+            order_id = event_data.get('orderId') or event_data.get('order_id')
+            name = f"cloudcart:order-event:{event_data.get('event_type')}:{order_id}:{timestamp}:{event_data.get('status')}"
+            event_id = str(uuid.uuid5(uuid.NAMESPACE_URL, name))
+        return (event_data.get('event_type', 'unknown'), event_id), timestamp
+
+    def event_row(self, event_data: dict) -> dict:
+        """Normalize a Kafka order event into an ``order_events`` row"""
+        (_, event_id), timestamp = self.event_key(event_data)
+        return {
+            'event_id': event_id,
+            'order_id': event_data.get('orderId') or event_data.get('order_id'),
+            'user_id': event_data.get('userId') or event_data.get('user_id'),
+            'event_type': event_data.get('event_type', 'unknown'),
+            'timestamp': timestamp,
+            'total_amount': float(event_data.get('totalAmount', 0) or event_data.get('total_amount', 0)),
+            'status': event_data.get('status')
+        }
+
+    def item_rows(self, order_id: str, items: list, timestamp) -> list:
+        """Normalize order items into ``order_items_analytics`` rows"""
+        timestamp = self.parse_timestamp(timestamp)
+        return [
+            {
+                'order_id': order_id,
+                'product_id': item.get('product_id'),
+                'product_name': item.get('product_name'),
+                'quantity': int(item.get('quantity')),
+                'price': float(str(item.get('price'))),
+                'subtotal': float(str(item.get('subtotal'))),
+                'timestamp': timestamp
+            }
+            for item in items
+        ]
+
+    def cohort_keys(self, first_order: datetime, timestamp: datetime):
+        """(cohort_week, week_number, cohort_month) of an order by a user's first order.
+
+        Cohort weeks start on Monday; week 0 is the week of the first order.
+        """
+        cohort_week = first_order.date() - timedelta(days=first_order.weekday())
+        week_number = (timestamp.date() - cohort_week).days // 7
+        return cohort_week, week_number, first_order.date().replace(day=1)
+
+    # Ingest
+    #
+    # Inserts are idempotent: writing an event or an order's items again
+    # leaves aggregates unchanged. They raise on failure so the consumer
+    # only remembers events that were stored.
+
+    @abstractmethod
+    def insert_order_event(self, event_data: dict):
+        ...
+
+    @abstractmethod
+    def insert_order_items(self, order_id: str, items: list, timestamp: str):
+        ...
+
+    def insert_order_batch(self, events: list):
+        """Store a poll's worth of events and the items of their order.created events.
+
+        Events carry their ``event_type``. This default writes them one at a
+        time; backends override it to write each table with one statement.
+        """
+        for event_data in events:
+            self.insert_order_event(event_data)
+            if event_data.get('event_type') == 'order.created' and 'items' in event_data:
+                self.insert_order_items(
+                    event_data.get('orderId') or event_data.get('order_id'),
+                    event_data['items'],
+                    event_data.get('timestamp')
+                )
+
+    def batch_rows(self, events: list):
+        """``order_events`` rows and ``order_items_analytics`` rows of a batch"""
+        rows = []
+        items = []
+        for event_data in events:
+            row = self.event_row(event_data)
+            rows.append(row)
+            if row['event_type'] == 'order.created' and 'items' in event_data:
+                items.extend(self.item_rows(row['order_id'], event_data['items'], row['timestamp']))
+        return rows, items
+
+    @abstractmethod
+    def recent_event_ids(self, since):
+        """(event_type, event_id, timestamp) of events after ``since``, to seed the consumer's filter"""
+
+    @abstractmethod
+    def existing_event_ids(self, keys) -> set:
+        """Which of the given ((event_type, event_id), timestamp) keys are already stored,
+        as (event_type, event_id) pairs"""
+
+    # Dashboard aggregates
+
+    @abstractmethod
+    def get_daily_sales(self, days: int = 7, columnar: bool = False):
+        """(date, total_orders, total_revenue, avg_order) for the last N days, newest first"""
+
+    @abstractmethod
+    def get_top_products(self, limit: int = 10, columnar: bool = False):
+        """(product_id, product_name, total_qty, total_revenue, order_count) by revenue"""
+
+    @abstractmethod
+    def get_order_status_distribution(self, columnar: bool = False):
+        """(status, count) of each order's latest status"""
+
+    @abstractmethod
+    def get_top_users(self, days: int = 30, limit: int = 10, columnar: bool = False):
+        """(user_id, order_count, total_spent, last_order_date) by spend"""
+
+    @abstractmethod
+    def get_total_metrics(self):
+        """(total_orders, total_revenue, avg_order)"""
+
+    # Cohorts
+    #
+    # Maintained incrementally as orders are ingested: each user's first
+    # order date, plus per-cohort weekly activity and monthly repeat-purchase
+    # aggregates that the endpoints read without touching raw events.
+
+    @abstractmethod
+    def get_first_orders(self, user_ids):
+        """{user_id: first order timestamp} for the users that have ordered before"""
+
+    @abstractmethod
+    def set_first_orders(self, first_orders: dict):
+        """Record {user_id: first order}; an earlier existing one is kept"""
+
+    @abstractmethod
+    def record_cohort_orders(self, orders: list):
+        """Add (order_id, user_id, first_order, timestamp, total_amount) rows to
+        their cohorts' weekly activity and monthly repeat aggregates.
+
+        Keyed by order_id: an order recorded before is skipped, so replayed
+        events do not inflate the aggregates.
+        """
+
+    @abstractmethod
+    def get_weekly_retention(self, since, columnar: bool = False):
+        """(cohort_week, week_number, active_users, orders, revenue) for cohorts since a date"""
+
+    @abstractmethod
+    def get_repeat_purchase(self, since, columnar: bool = False):
+        """(cohort_month, customers, repeat_customers, orders) for cohorts since a date"""
+
+    @abstractmethod
+    def rebuild_cohorts(self):
+        """Recompute every cohort aggregate from stored order events"""
+
+    # Recommender
+
+    @abstractmethod
+    def get_training_order_items(self):
+        """(order_id, user_id, product_id, product_name, quantity, subtotal) rows"""
+
+    @abstractmethod
+    def get_popular_products(self, limit: int = 5):
+        """(product_id, product_name, total_sold, order_count) by quantity"""
+
+    # Streaming exports
+
+    @abstractmethod
+    def iter_order_events(self, start, end, after=None, limit=None):
+        """Order events in [start, end), keyed by (timestamp, event_id, event_type)"""
+
+    @abstractmethod
+    def iter_user_spend(self, start, end, after=None, limit=None):
+        """Per-user spend for orders created in [start, end), keyed by user_id"""
+
+    @abstractmethod
+    def iter_product_sales(self, start, end, after=None, limit=None):
+        """Per-product sales for items sold in [start, end), keyed by product_id"""
+
+    # Maintenance
+
+    @abstractmethod
+    def ping(self) -> bool:
+        """Whether the backend answers a trivial query"""
+
+    @abstractmethod
+    def truncate(self):
+        """Delete all analytics rows (benchmarks only)"""
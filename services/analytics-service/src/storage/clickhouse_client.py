@@ -0,0 +1,776 @@
+from clickhouse_driver import Client
+from src.storage.base import StorageBackend
+from src.storage.tiering import TIERING_SCHEMAS, TIERING_TABLES, TierPlanner
+from src.utils.logger import logger
+from src.utils.metrics import CLICKHOUSE_BYTES_READ, CLICKHOUSE_ROWS_READ, STORAGE_QUERY_DURATION, timed
+from src.utils.request_context import current_endpoint
+from src.utils.slow_query_log import slow_query_log
+from datetime import datetime, timedelta, timezone
+import functools
+import hashlib
+import os
+import threading
+import time
+
+# Both tables are ReplacingMergeTree keyed on their natural key, so a row
+# written twice collapses on merge. Event ids are only unique per event type
+# (order-service sends the order id for the created and every status event). Inserts also carry a deduplication token;
+# non_replicated_deduplication_window makes the server drop a repeated token
+# outright, so replays never reach the aggregates. Monthly partitions let the
+# archiver (src/storage/tiering.py) drop archived months cheaply.
+TABLE_SCHEMAS = {
+    'order_events': ("""
+        CREATE TABLE IF NOT EXISTS {name} (
+            event_id String, order_id String, user_id String, event_type String,
+            timestamp DateTime, total_amount Nullable(Float64), status Nullable(String),
+            created_at DateTime DEFAULT now()
+        ) ENGINE = ReplacingMergeTree(created_at) PARTITION BY toYYYYMM(timestamp)
+        ORDER BY (timestamp, event_type, event_id)
+        SETTINGS non_replicated_deduplication_window = {window}{storage_policy}
+    """, ('timestamp', 'event_type', 'event_id')),
+    'order_items_analytics': ("""
+        CREATE TABLE IF NOT EXISTS {name} (
+            order_id String, product_id String, product_name String,
+            quantity Int32, price Float64, subtotal Float64, timestamp DateTime,
+            created_at DateTime DEFAULT now()
+        ) ENGINE = ReplacingMergeTree(created_at) PARTITION BY toYYYYMM(timestamp)
+        ORDER BY (timestamp, order_id, product_id)
+        SETTINGS non_replicated_deduplication_window = {window}{storage_policy}
+    """, ('timestamp', 'order_id', 'product_id')),
+}
+
+# Cohort aggregates. Each order is written once to cohort_orders (keyed by
+# order_id, so a replayed order can be looked up and skipped); materialized
+# views fold new rows into AggregatingMergeTree states, so the endpoints merge
+# a few rows per cohort instead of scanning order_events. The SELECTs are
+# shared with rebuild_cohorts.
+COHORT_WEEKLY_SELECT = """
+    SELECT toMonday(first_order) AS cohort_week,
+           toUInt16(intDiv(dateDiff('day', toMonday(first_order), toDate(timestamp)), 7)) AS week_number,
+           uniqState(user_id) AS active_users, count() AS orders, sum(total_amount) AS revenue
+    FROM {source} GROUP BY cohort_week, week_number
+"""
+COHORT_MONTHLY_SELECT = """
+    SELECT toStartOfMonth(first_order) AS cohort_month, uniqState(user_id) AS customers,
+           uniqIfState(user_id, toUInt8(timestamp > first_order)) AS repeat_customers, count() AS orders
+    FROM {source} GROUP BY cohort_month
+"""
+
+COHORT_SCHEMAS = (
+    """
+    CREATE TABLE IF NOT EXISTS user_first_orders (
+        user_id String, first_order SimpleAggregateFunction(min, DateTime)
+    ) ENGINE = AggregatingMergeTree() ORDER BY user_id
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS cohort_orders (
+        order_id String, user_id String, first_order DateTime, timestamp DateTime, total_amount Float64
+    ) ENGINE = ReplacingMergeTree() ORDER BY order_id
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS cohort_weekly_activity (
+        cohort_week Date, week_number UInt16,
+        active_users AggregateFunction(uniq, String),
+        orders SimpleAggregateFunction(sum, UInt64),
+        revenue SimpleAggregateFunction(sum, Float64)
+    ) ENGINE = AggregatingMergeTree() ORDER BY (cohort_week, week_number)
+    """,
+    "CREATE MATERIALIZED VIEW IF NOT EXISTS cohort_orders_weekly_mv TO cohort_weekly_activity AS"
+    + COHORT_WEEKLY_SELECT.format(source='cohort_orders'),
+    """
+    CREATE TABLE IF NOT EXISTS cohort_monthly_customers (
+        cohort_month Date,
+        customers AggregateFunction(uniq, String),
+        repeat_customers AggregateFunction(uniqIf, String, UInt8),
+        orders SimpleAggregateFunction(sum, UInt64)
+    ) ENGINE = AggregatingMergeTree() ORDER BY cohort_month
+    """,
+    "CREATE MATERIALIZED VIEW IF NOT EXISTS cohort_orders_monthly_mv TO cohort_monthly_customers AS"
+    + COHORT_MONTHLY_SELECT.format(source='cohort_orders'),
+)
+
+COHORT_TABLES = ('user_first_orders', 'cohort_orders', 'cohort_weekly_activity', 'cohort_monthly_customers')
+
+# Orders of a source attributed to their users' first orders, one row per order
+COHORT_ORDERS_SELECT = """
+    SELECT oe.order_id, oe.user_id, fo.first_order, oe.timestamp, ifNull(oe.total_amount, 0)
+    FROM (
+        SELECT order_id, user_id, timestamp, total_amount FROM {source}
+        WHERE event_type = 'order.created' {where}
+        ORDER BY timestamp LIMIT 1 BY order_id
+    ) oe
+    INNER JOIN (
+        SELECT user_id, min(first_order) AS first_order FROM {first_orders} GROUP BY user_id
+    ) fo ON oe.user_id = fo.user_id
+"""
+
+# Older releases fed the aggregates through a Null-engine cohort_events
+# table, which could not tell a replayed order from a new one
+LEGACY_COHORT_VIEWS = ('cohort_weekly_activity_mv', 'cohort_monthly_customers_mv')
+LEGACY_COHORT_TABLES = ('cohort_events',)
+
+
+def utcnow():
+    """Naive UTC now, matching how event timestamps are stored"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class ClickHouseClient(StorageBackend):
+    name = 'clickhouse'
+    
+    def __init__(self):
+        self.host = os.getenv('CLICKHOUSE_HOST', 'localhost')
+        self.port = int(os.getenv('CLICKHOUSE_PORT', 9000))
+        self.database = os.getenv('CLICKHOUSE_DATABASE', 'analytics')
+        self.user = os.getenv('CLICKHOUSE_USER', 'default')
+        self.password = os.getenv('CLICKHOUSE_PASSWORD', '')
+        self.dedup_window = int(os.getenv('CLICKHOUSE_DEDUP_WINDOW', 100000))
+        # Optional TTL move of older parts to a cold volume of the storage policy
+        self.storage_policy = os.getenv('CLICKHOUSE_STORAGE_POLICY')
+        self.cold_volume = os.getenv('CLICKHOUSE_COLD_VOLUME')
+        self.cold_after_days = int(os.getenv('CLICKHOUSE_COLD_AFTER_DAYS', 30))
+        self.archive_dir = os.getenv('CLICKHOUSE_ARCHIVE_DIR', 'analytics_archive')
+        self.tiers = TierPlanner(self, self.archive_dir, float(os.getenv('CLICKHOUSE_TIER_REFRESH_SECONDS', 30)))
+        
+        # clickhouse-driver clients are not thread-safe and API handlers run
+        # on a thread pool, so each thread gets its own connection
+        self._local = threading.local()
+        self.connect_with_retry()
+        self.init_database()
+    
+    def connect_with_retry(self, max_retries=10):
+        for attempt in range(max_retries):
+            try:
+                self._local.client = Client(host=self.host, port=self.port, user=self.user, password=self.password)
+                logger.info(f"Connected to ClickHouse at {self.host}:{self.port}")
+                return
+            except Exception as e:
+                logger.warning(f"Failed to connect (attempt {attempt + 1}/{max_retries}): {e}")
+                if attempt < max_retries - 1:
+                    time.sleep(5)
+                else:
+                    raise
+    
+    @property
+    def client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.new_connection()
+        return client
+    
+    def run_query(self, query: str, params=None, columnar: bool = False, client=None, settings=None):
+        """Execute a query and record its profile.
+        
+        Every query goes through here: it is tagged with the calling endpoint
+        (visible as ``log_comment`` in ``system.query_log``), its rows/bytes
+        read are counted, and queries over the slow-query threshold are logged
+        together with their EXPLAIN output.
+        """
+        client = client or self.client
+        endpoint = current_endpoint()
+        if endpoint:
+            settings = {**(settings or {}), 'log_comment': endpoint}
+        
+        start = time.perf_counter()
+        result = client.execute(query, params, columnar=columnar, settings=settings)
+        elapsed = time.perf_counter() - start
+        
+        self.record_profile(client, query, params, endpoint, elapsed)
+        return result
+    
+    def record_profile(self, client, query, params, endpoint, elapsed, explain=True):
+        info = client.last_query
+        rows_read = info.progress.rows if info else 0
+        bytes_read = info.progress.bytes if info else 0
+        label = endpoint or 'background'
+        CLICKHOUSE_ROWS_READ.labels(label).inc(rows_read)
+        CLICKHOUSE_BYTES_READ.labels(label).inc(bytes_read)
+        
+        if not slow_query_log.is_slow(elapsed):
+            return
+        stats = {
+            'endpoint': endpoint,
+            'elapsed_ms': elapsed * 1000,
+            'server_elapsed_ms': info.elapsed * 1000 if info else None,
+            'rows_read': rows_read,
+            'bytes_read': bytes_read,
+            'total_rows_to_read': info.progress.total_rows if info else None,
+            'result_rows': info.profile_info.rows if info else None,
+            'result_bytes': info.profile_info.bytes if info else None
+        }
+        slow_query_log.record(query, stats, functools.partial(self.explain, query, params) if explain else None)
+    
+    def explain(self, query: str, params=None):
+        """EXPLAIN output for a SELECT query, as a list of plan lines.
+        
+        Called from the slow-query log's background thread, whose own
+        thread-local connection keeps it off the connection that ran the query.
+        """
+        if not query.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return None
+        try:
+            return [row[0] for row in self.client.execute(f"EXPLAIN indexes = 1 {query}", params)]
+        except Exception as e:
+            logger.warning(f"Failed to EXPLAIN slow query: {e}")
+            return None
+    
+    def new_connection(self):
+        """Open a dedicated connection, e.g. for a long-running streaming query"""
+        return Client(host=self.host, port=self.port, database=self.database, user=self.user, password=self.password)
+    
+    def iter_rows(self, query: str, params: dict = None, block_size: int = 10000):
+        """Stream rows block by block on a dedicated connection.
+        
+        Closing the generator before it is exhausted cancels the query on the
+        server, so abandoned exports do not keep scanning.
+        """
+        client = self.new_connection()
+        endpoint = current_endpoint()
+        settings = {'max_block_size': block_size}
+        if endpoint:
+            settings['log_comment'] = endpoint
+        
+        finished = False
+        start = time.perf_counter()
+        try:
+            for row in client.execute_iter(query, params, settings=settings):
+                yield row
+            finished = True
+            # Exports are expected to run long, so they are profiled but never EXPLAINed
+            self.record_profile(client, query, params, endpoint, time.perf_counter() - start, explain=False)
+        finally:
+            if not finished and client.connection.connected:
+                try:
+                    client.connection.send_cancel()
+                except Exception as e:
+                    logger.warning(f"Failed to cancel streaming query: {e}")
+            client.disconnect()
+    
+    def init_database(self):
+        try:
+            self.run_query(f"CREATE DATABASE IF NOT EXISTS {self.database}")
+            logger.info(f"Database '{self.database}' created")
+            
+            self._local.client = self.new_connection()
+            
+            for table in TABLE_SCHEMAS:
+                self.run_query(self.table_schema(table, table))
+                reason = self.outdated_table(table)
+                if reason:
+                    logger.warning(
+                        f"Table '{table}' {reason}. Stop ingest and run "
+                        f"`python -m src.storage.migrate` to rebuild it"
+                    )
+                self.ensure_ttl_move(table)
+            for schema in COHORT_SCHEMAS + TIERING_SCHEMAS:
+                self.run_query(schema)
+            
+            logger.info("ClickHouse tables initialized")
+        except Exception as e:
+            logger.error(f"Failed to init database: {e}")
+            raise
+    
+    def table_schema(self, table: str, name: str) -> str:
+        schema, _ = TABLE_SCHEMAS[table]
+        storage_policy = f", storage_policy = '{self.storage_policy}'" if self.storage_policy else ""
+        return schema.format(name=name, window=self.dedup_window, storage_policy=storage_policy)
+    
+    def ensure_ttl_move(self, table: str):
+        """Move parts older than CLICKHOUSE_COLD_AFTER_DAYS to CLICKHOUSE_COLD_VOLUME.
+        
+        The volume must belong to the table's storage policy, which is
+        configured on the server (``storage_configuration``).
+        """
+        if not self.cold_volume:
+            return
+        ttl = f"timestamp + toIntervalDay({self.cold_after_days}) TO VOLUME '{self.cold_volume}'"
+        try:
+            engine = self.run_query(
+                "SELECT engine_full FROM system.tables WHERE database = %(database)s AND name = %(table)s",
+                {'database': self.database, 'table': table}
+            )[0][0]
+            # MODIFY TTL rewrites existing parts, so only run it when the rule changed
+            if ttl in engine:
+                return
+            if self.storage_policy:
+                self.run_query(f"ALTER TABLE {table} MODIFY SETTING storage_policy = '{self.storage_policy}'")
+            self.run_query(f"ALTER TABLE {table} MODIFY TTL {ttl}")
+        except Exception as e:
+            logger.warning(f"Failed to set the cold volume TTL on '{table}': {e}")
+    
+    def outdated_table(self, table: str):
+        """Why an existing table no longer matches its schema, or None"""
+        result = self.run_query(
+            "SELECT engine, partition_key, sorting_key FROM system.tables "
+            "WHERE database = %(database)s AND name = %(table)s",
+            {'database': self.database, 'table': table}
+        )
+        if not result:
+            return None
+        engine, partition_key, sorting_key = result[0]
+        _, key = TABLE_SCHEMAS[table]
+        if engine == 'MergeTree':
+            return "uses MergeTree, so replayed events are counted twice"
+        if sorting_key != ', '.join(key):
+            return f"is keyed on ({sorting_key}) instead of ({', '.join(key)}), so distinct rows collapse on merge"
+        if partition_key != 'toYYYYMM(timestamp)':
+            return "is not partitioned by month, so archived months are deleted row by row"
+        return None
+    
+    def migrate(self):
+        """Drop superseded cohort objects and rebuild every outdated table;
+        returns the tables rebuilt.
+        
+        Run once, from ``python -m src.storage.migrate``, with ingest stopped.
+        """
+        for view in LEGACY_COHORT_VIEWS:
+            self.run_query(f"DROP VIEW IF EXISTS {view}")
+        for table in LEGACY_COHORT_TABLES:
+            self.run_query(f"DROP TABLE IF EXISTS {table}")
+        migrated = []
+        for table in TABLE_SCHEMAS:
+            reason = self.outdated_table(table)
+            if reason:
+                logger.info(f"Table '{table}' {reason}, rebuilding it")
+                self.rebuild_table(table)
+                migrated.append(table)
+        return migrated
+    
+    def rebuild_table(self, table: str):
+        """Copy a table into its current schema keeping one row per key, then swap them.
+        
+        Rows inserted into the old table after the copy started would be lost
+        by the swap, so the copy is abandoned if the table's row count changes
+        while it runs.
+        """
+        _, key = TABLE_SCHEMAS[table]
+        staging = f"{table}_migrate"
+        count = f"SELECT count() FROM {table}"
+        self.run_query(f"DROP TABLE IF EXISTS {staging}")
+        self.run_query(self.table_schema(table, staging))
+        rows = self.run_query(count)[0][0]
+        self.run_query(f"INSERT INTO {staging} SELECT * FROM {table} ORDER BY created_at DESC LIMIT 1 BY {', '.join(key)}")
+        if self.run_query(count)[0][0] != rows:
+            self.run_query(f"DROP TABLE {staging}")
+            raise RuntimeError(f"Rows were inserted into '{table}' during the migration; stop ingest and retry")
+        self.run_query(f"EXCHANGE TABLES {staging} AND {table}")
+        self.run_query(f"DROP TABLE {staging}")
+        self.ensure_ttl_move(table)
+        logger.info(f"Table '{table}' rebuilt")
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def insert_order_event(self, event_data: dict):
+        try:
+            row = self.event_row(event_data)
+            self.run_query(
+                "INSERT INTO order_events (event_id, order_id, user_id, event_type, timestamp, total_amount, status) VALUES",
+                [row],
+                settings={'insert_deduplication_token': f"{row['event_type']}:{row['event_id']}"}
+            )
+            logger.debug("Order event inserted: %s", row['order_id'])
+        except Exception as e:
+            logger.error(f"Failed to insert order event: {e}")
+            raise
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def insert_order_items(self, order_id: str, items: list, timestamp: str):
+        try:
+            data = self.item_rows(order_id, items, timestamp)
+            if data:
+                self.run_query(
+                    "INSERT INTO order_items_analytics (order_id, product_id, product_name, quantity, price, subtotal, timestamp) VALUES",
+                    data,
+                    settings={'insert_deduplication_token': f"items:{order_id}"}
+                )
+                logger.debug("Order items inserted for order: %s", order_id)
+        except Exception as e:
+            logger.error(f"Failed to insert order items: {e}")
+            raise
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def insert_order_batch(self, events: list):
+        """One INSERT per table for the whole batch.
+        
+        The deduplication token is derived from the batch's (event_type,
+        event_id) keys, so a redelivered batch is dropped as a whole; single
+        replayed events are collapsed by the ReplacingMergeTree engines.
+        """
+        try:
+            rows, items = self.batch_rows(events)
+            if not rows:
+                return
+            keys = sorted(f"{row['event_type']}:{row['event_id']}" for row in rows)
+            token = hashlib.sha1("\n".join(keys).encode()).hexdigest()
+            self.run_query(
+                "INSERT INTO order_events (event_id, order_id, user_id, event_type, timestamp, total_amount, status) VALUES",
+                rows,
+                settings={'insert_deduplication_token': f"events:{token}"}
+            )
+            if items:
+                self.run_query(
+                    "INSERT INTO order_items_analytics (order_id, product_id, product_name, quantity, price, subtotal, timestamp) VALUES",
+                    items,
+                    settings={'insert_deduplication_token': f"items:{token}"}
+                )
+            logger.debug("Inserted %d order events and %d order items", len(rows), len(items))
+        except Exception as e:
+            logger.error(f"Failed to insert order batch: {e}")
+            raise
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def get_daily_sales(self, days: int = 7, columnar: bool = False):
+        try:
+            archive = self.tiers.plan('order_events', utcnow() - timedelta(days=days))
+            if archive is None:
+                return self.run_query(f"""
+                    SELECT toDate(timestamp) as date, count() as total_orders, 
+                           sum(total_amount) as total_revenue, avg(total_amount) as avg_order
+                    FROM order_events WHERE event_type = 'order.created' 
+                    AND timestamp >= now() - INTERVAL {days} DAY
+                    GROUP BY date ORDER BY date DESC
+                """, columnar=columnar)
+            # Archived days come from the daily summaries
+            return self.run_query(f"""
+                SELECT date, sum(orders) as total_orders, sum(revenue) as total_revenue,
+                       if(sum(priced_orders) > 0, sum(revenue) / sum(priced_orders), 0) as avg_order
+                FROM (
+                    SELECT toDate(timestamp) as date, count() as orders, count(total_amount) as priced_orders,
+                           sum(ifNull(total_amount, 0)) as revenue
+                    FROM order_events WHERE event_type = 'order.created'
+                    AND timestamp >= now() - INTERVAL {days} DAY AND timestamp >= %(hot_from)s
+                    GROUP BY date
+                    UNION ALL
+                    SELECT date, orders, priced_orders, revenue FROM archived_daily_sales
+                    WHERE batch IN %(batches)s AND date >= toDate(now() - INTERVAL {days} DAY)
+                )
+                GROUP BY date ORDER BY date DESC
+            """, {'hot_from': archive.boundary, 'batches': archive.batches}, columnar=columnar)
+        except Exception as e:
+            logger.error(f"Failed to get daily sales: {e}")
+            return []
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def get_top_products(self, limit: int = 10, columnar: bool = False):
+        try:
+            source, params = self.product_sales_source()
+            return self.run_query(f"""
+                SELECT product_id, product_name, sum(quantity) as total_qty, 
+                       sum(revenue) as total_revenue, sum(orders) as order_count
+                FROM {source}
+                GROUP BY product_id, product_name ORDER BY total_revenue DESC LIMIT {limit}
+            """, params, columnar=columnar)
+        except Exception as e:
+            logger.error(f"Failed to get top products: {e}")
+            return []
+    
+    def product_sales_source(self):
+        """Per-product (quantity, revenue, orders) of hot items plus archived summaries.
+        
+        An order's items share its timestamp, so no order is counted in both tiers.
+        """
+        archive = self.tiers.plan('order_items_analytics')
+        hot = """
+            SELECT product_id, product_name, sum(quantity) as quantity, sum(subtotal) as revenue,
+                   count(DISTINCT order_id) as orders
+            FROM order_items_analytics {where} GROUP BY product_id, product_name
+        """
+        if archive is None:
+            return f"({hot.format(where='')})", {}
+        return f"""(
+            {hot.format(where='WHERE timestamp >= %(hot_from)s')}
+            UNION ALL
+            SELECT product_id, product_name, quantity, revenue, orders
+            FROM archived_product_sales WHERE batch IN %(batches)s
+        )""", {'hot_from': archive.boundary, 'batches': archive.batches}
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def get_order_status_distribution(self, columnar: bool = False):
+        try:
+            archive = self.tiers.plan('order_events')
+            if archive is None:
+                return self.run_query("""
+                    WITH latest_status AS (
+                        SELECT order_id, argMax(status, timestamp) as current_status
+                        FROM order_events WHERE status IS NOT NULL GROUP BY order_id
+                    )
+                    SELECT current_status as status, count() as count
+                    FROM latest_status GROUP BY current_status ORDER BY count DESC
+                """, columnar=columnar)
+            # Orders whose last status event is archived are counted in the
+            # summaries; the newest batch of a month covers the whole month
+            return self.run_query("""
+                WITH latest_status AS (
+                    SELECT order_id, argMax(assumeNotNull(status), timestamp) as current_status
+                    FROM order_events WHERE status IS NOT NULL AND timestamp >= %(hot_from)s GROUP BY order_id
+                )
+                SELECT status, sum(orders) as count FROM (
+                    SELECT current_status as status, count() as orders FROM latest_status GROUP BY current_status
+                    UNION ALL
+                    SELECT status, orders FROM archived_order_status WHERE batch IN %(batches)s
+                )
+                GROUP BY status ORDER BY count DESC
+            """, {'hot_from': archive.boundary, 'batches': archive.latest()}, columnar=columnar)
+        except Exception as e:
+            logger.error(f"Failed to get status distribution: {e}")
+            return []
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def get_top_users(self, days: int = 30, limit: int = 10, columnar: bool = False):
+        try:
+            source, params = self.tiers.source('order_events', utcnow() - timedelta(days=days))
+            return self.run_query(f"""
+                SELECT user_id, count(DISTINCT order_id) as order_count,
+                       sum(total_amount) as total_spent, max(timestamp) as last_order_date
+                FROM {source} WHERE event_type = 'order.created'
+                AND timestamp >= now() - INTERVAL {days} DAY
+                GROUP BY user_id ORDER BY total_spent DESC LIMIT {limit}
+            """, params, columnar=columnar)
+        except Exception as e:
+            logger.error(f"Failed to get user activity: {e}")
+            return []
+    
+    def iter_order_events(self, start, end, after=None, limit=None):
+        """Order events in [start, end), keyed by (timestamp, event_id, event_type)"""
+        source, tier_params = self.tiers.source('order_events', start, end)
+        keyset = "AND (timestamp, event_id, event_type) > (%(after_ts)s, %(after_id)s, %(after_type)s)" if after else ""
+        query = f"""
+            SELECT event_id, order_id, user_id, event_type, timestamp, total_amount, status
+            FROM {source}
+            WHERE timestamp >= %(start)s AND timestamp < %(end)s {keyset}
+            ORDER BY timestamp, event_id, event_type
+            {f"LIMIT {int(limit)}" if limit else ""}
+        """
+        params = {**tier_params, 'start': start, 'end': end}
+        if after:
+            params['after_ts'], params['after_id'], params['after_type'] = after
+        return self.iter_rows(query, params)
+    
+    def iter_user_spend(self, start, end, after=None, limit=None):
+        """Per-user spend for orders created in [start, end), keyed by user_id"""
+        source, tier_params = self.tiers.source('order_events', start, end)
+        keyset = "AND user_id > %(after_id)s" if after else ""
+        query = f"""
+            SELECT user_id, count(DISTINCT order_id) as order_count, sum(total_amount) as total_spent,
+                   min(timestamp) as first_order_date, max(timestamp) as last_order_date
+            FROM {source}
+            WHERE event_type = 'order.created' AND timestamp >= %(start)s AND timestamp < %(end)s {keyset}
+            GROUP BY user_id ORDER BY user_id
+            {f"LIMIT {int(limit)}" if limit else ""}
+        """
+        params = {**tier_params, 'start': start, 'end': end}
+        if after:
+            params['after_id'] = after[0]
+        return self.iter_rows(query, params)
+    
+    def iter_product_sales(self, start, end, after=None, limit=None):
+        """Per-product sales for items sold in [start, end), keyed by product_id"""
+        source, tier_params = self.tiers.source('order_items_analytics', start, end)
+        keyset = "AND product_id > %(after_id)s" if after else ""
+        query = f"""
+            SELECT product_id, any(product_name) as product_name, sum(quantity) as total_quantity,
+                   sum(subtotal) as total_revenue, count(DISTINCT order_id) as order_count
+            FROM {source}
+            WHERE timestamp >= %(start)s AND timestamp < %(end)s {keyset}
+            GROUP BY product_id ORDER BY product_id
+            {f"LIMIT {int(limit)}" if limit else ""}
+        """
+        params = {**tier_params, 'start': start, 'end': end}
+        if after:
+            params['after_id'] = after[0]
+        return self.iter_rows(query, params)
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def get_first_orders(self, user_ids):
+        if not user_ids:
+            return {}
+        return dict(self.run_query(
+            "SELECT user_id, min(first_order) FROM user_first_orders WHERE user_id IN %(user_ids)s GROUP BY user_id",
+            {'user_ids': list(user_ids)}
+        ))
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def set_first_orders(self, first_orders: dict):
+        if first_orders:
+            self.run_query("INSERT INTO user_first_orders (user_id, first_order) VALUES", list(first_orders.items()))
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def record_cohort_orders(self, orders: list):
+        """Insert the orders cohort_orders does not hold yet; its views add them to the aggregates.
+        
+        The lookup and the insert are not atomic, but an order's events come
+        from a single partition, which only one consumer reads at a time.
+        """
+        if not orders:
+            return
+        recorded = {row[0] for row in self.run_query(
+            "SELECT order_id FROM cohort_orders WHERE order_id IN %(order_ids)s",
+            {'order_ids': list({order[0] for order in orders})}
+        )}
+        fresh = {}
+        for order in orders:
+            if order[0] not in recorded:
+                fresh.setdefault(order[0], order)
+        if fresh:
+            self.run_query(
+                "INSERT INTO cohort_orders (order_id, user_id, first_order, timestamp, total_amount) VALUES",
+                list(fresh.values())
+            )
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def get_weekly_retention(self, since, columnar: bool = False):
+        return self.run_query("""
+            SELECT cohort_week, week_number, uniqMerge(active_users) as active_users,
+                   sum(orders) as orders, sum(revenue) as revenue
+            FROM cohort_weekly_activity
+            WHERE cohort_week >= %(since)s
+            GROUP BY cohort_week, week_number ORDER BY cohort_week, week_number
+        """, {'since': since}, columnar=columnar)
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def get_repeat_purchase(self, since, columnar: bool = False):
+        return self.run_query("""
+            SELECT cohort_month, uniqMerge(customers) as customers,
+                   uniqIfMerge(repeat_customers) as repeat_customers, sum(orders) as orders
+            FROM cohort_monthly_customers
+            WHERE cohort_month >= %(since)s
+            GROUP BY cohort_month ORDER BY cohort_month
+        """, {'since': since}, columnar=columnar)
+    
+    def rebuild_cohorts(self):
+        """Recompute the cohort tables into staging copies and swap their data in.
+        
+        ``REPLACE PARTITION`` swaps each table's data atomically while the
+        tables, and so the materialized views between them, stay in place;
+        the endpoints keep answering from the old aggregates until the swap.
+        What the consumer records meanwhile is replaced too, so orders stored
+        since the rebuild started are recorded again afterwards. An order
+        recorded in the moment between swapping cohort_orders and the
+        aggregates can still be missed until the next rebuild.
+        """
+        started = self.run_query("SELECT now()")[0][0]
+        source, params = self.tiers.source('order_events')
+        for table in COHORT_TABLES:
+            self.run_query(f"DROP TABLE IF EXISTS {table}_rebuild")
+            self.run_query(f"CREATE TABLE {table}_rebuild AS {table}")
+        self.run_query(f"""
+            INSERT INTO user_first_orders_rebuild (user_id, first_order)
+            SELECT user_id, min(timestamp) FROM {source}
+            WHERE event_type = 'order.created' GROUP BY user_id
+        """, params)
+        self.run_query(
+            "INSERT INTO cohort_orders_rebuild (order_id, user_id, first_order, timestamp, total_amount)"
+            + COHORT_ORDERS_SELECT.format(source=source, where='', first_orders='user_first_orders_rebuild'),
+            params
+        )
+        self.run_query("INSERT INTO cohort_weekly_activity_rebuild"
+                       + COHORT_WEEKLY_SELECT.format(source='cohort_orders_rebuild'))
+        self.run_query("INSERT INTO cohort_monthly_customers_rebuild"
+                       + COHORT_MONTHLY_SELECT.format(source='cohort_orders_rebuild'))
+        for table in COHORT_TABLES:
+            self.run_query(f"ALTER TABLE {table} REPLACE PARTITION ID 'all' FROM {table}_rebuild")
+            self.run_query(f"DROP TABLE {table}_rebuild")
+        
+        # Orders stored since the rebuild started, minus those already recorded
+        recent = "AND created_at >= %(started)s"
+        self.run_query(f"""
+            INSERT INTO user_first_orders (user_id, first_order)
+            SELECT user_id, min(timestamp) FROM order_events
+            WHERE event_type = 'order.created' {recent} GROUP BY user_id
+        """, {'started': started})
+        self.run_query(
+            "INSERT INTO cohort_orders (order_id, user_id, first_order, timestamp, total_amount)"
+            + COHORT_ORDERS_SELECT.format(source='order_events', where=recent, first_orders='user_first_orders')
+            + "WHERE oe.order_id NOT IN (SELECT order_id FROM cohort_orders)",
+            {'started': started}
+        )
+        logger.info("Cohort aggregates rebuilt from order events")
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def get_training_order_items(self):
+        """Order items joined with their buyer, used to train the recommender.
+        
+        Only hot rows are used: the model follows recent purchases, and
+        training does not slow down as the archive grows.
+        """
+        archives = [self.tiers.archive(table) for table in ('order_events', 'order_items_analytics')]
+        hot_from = max((archive.boundary for archive in archives if archive), default=datetime(1970, 1, 1))
+        return self.run_query("""
+            SELECT oi.order_id, oe.user_id, oi.product_id, oi.product_name, oi.quantity, oi.subtotal
+            FROM order_items_analytics oi
+            JOIN order_events oe ON oi.order_id = oe.order_id
+            WHERE oe.event_type = 'order.created'
+            AND oi.timestamp >= %(hot_from)s AND oe.timestamp >= %(hot_from)s
+        """, {'hot_from': hot_from})
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def get_popular_products(self, limit: int = 5):
+        source, params = self.product_sales_source()
+        return self.run_query(f"""
+            SELECT product_id, product_name, sum(quantity) as total_sold, sum(orders) as order_count
+            FROM {source}
+            GROUP BY product_id, product_name ORDER BY total_sold DESC LIMIT {limit}
+        """, params)
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def get_total_metrics(self):
+        try:
+            archive = self.tiers.plan('order_events')
+            if archive is None:
+                result = self.run_query("""
+                    SELECT count() as total_orders, sum(total_amount) as total_revenue, 
+                           avg(total_amount) as avg_order
+                    FROM order_events WHERE event_type = 'order.created'
+                """)
+            else:
+                result = self.run_query("""
+                    SELECT sum(orders) as total_orders, sum(revenue) as total_revenue,
+                           if(sum(priced_orders) > 0, sum(revenue) / sum(priced_orders), 0) as avg_order
+                    FROM (
+                        SELECT count() as orders, count(total_amount) as priced_orders,
+                               sum(ifNull(total_amount, 0)) as revenue
+                        FROM order_events WHERE event_type = 'order.created' AND timestamp >= %(hot_from)s
+                        UNION ALL
+                        SELECT sum(orders), sum(priced_orders), sum(revenue)
+                        FROM archived_daily_sales WHERE batch IN %(batches)s
+                    )
+                """, {'hot_from': archive.boundary, 'batches': archive.batches})
+            return result[0] if result else (0, 0, 0)
+        except Exception as e:
+            logger.error(f"Failed to get total metrics: {e}")
+            return (0, 0, 0)
+    
+    def recent_event_ids(self, since):
+        return self.iter_rows(
+            "SELECT event_type, event_id, timestamp FROM order_events WHERE timestamp > %(since)s",
+            {'since': since}
+        )
+    
+    @timed(STORAGE_QUERY_DURATION)
+    def existing_event_ids(self, keys) -> set:
+        if not keys:
+            return set()
+        timestamps = [timestamp for _, timestamp in keys]
+        # Replays of archived events are checked against the archive too
+        source, params = self.tiers.source('order_events', min(timestamps), max(timestamps) + timedelta(seconds=1))
+        # Bounding the timestamp lets the primary key prune the scan
+        result = self.run_query(f"""
+            SELECT DISTINCT event_type, event_id FROM {source}
+            WHERE timestamp >= %(start)s AND timestamp <= %(end)s AND event_id IN %(ids)s
+        """, {
+            **params, 'start': min(timestamps), 'end': max(timestamps),
+            'ids': list({event_id for (_, event_id), _ in keys})
+        })
+        return set(result) & {key for key, _ in keys}
+    
+    def ping(self) -> bool:
+        try:
+            self.run_query("SELECT 1")
+            return True
+        except Exception as e:
+            logger.warning(f"ClickHouse ping failed: {e}")
+            return False
+    
+    def truncate(self):
+        for table in ('order_events', 'order_items_analytics', *COHORT_TABLES, *TIERING_TABLES):
+            self.run_query(f"TRUNCATE TABLE IF EXISTS {table}")
+        self.tiers.refresh()
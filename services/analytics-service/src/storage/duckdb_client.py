@@ -0,0 +1,513 @@
+import contextlib
+import duckdb
+import functools
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from src.storage.base import StorageBackend
+from src.utils.logger import logger
+from src.utils.metrics import STORAGE_QUERY_DURATION, timed
+from src.utils.request_context import current_endpoint
+from src.utils.slow_query_log import slow_query_log
+
+
+# Event ids are only unique per event type: order-service sends the order
+# id as the id of the created event and of every status event
+ORDER_EVENTS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        event_id VARCHAR, order_id VARCHAR, user_id VARCHAR, event_type VARCHAR,
+        timestamp TIMESTAMP, total_amount DOUBLE, status VARCHAR,
+        created_at TIMESTAMP DEFAULT current_timestamp,
+        PRIMARY KEY (event_type, event_id)
+    )
+"""
+# Cohort aggregates: one row per user per active cohort week and per cohort
+# month, upserted as orders arrive. cohort_orders holds the orders already
+# counted, so a replayed order is skipped
+COHORT_SCHEMAS = {
+    'user_first_orders': """
+        CREATE TABLE IF NOT EXISTS {name} (
+            user_id VARCHAR PRIMARY KEY, first_order TIMESTAMP
+        )
+    """,
+    'cohort_orders': """
+        CREATE TABLE IF NOT EXISTS {name} (
+            order_id VARCHAR PRIMARY KEY, user_id VARCHAR, first_order TIMESTAMP,
+            timestamp TIMESTAMP, total_amount DOUBLE
+        )
+    """,
+    'cohort_weekly_activity': """
+        CREATE TABLE IF NOT EXISTS {name} (
+            cohort_week DATE, week_number INTEGER, user_id VARCHAR,
+            orders BIGINT, revenue DOUBLE,
+            PRIMARY KEY (cohort_week, week_number, user_id)
+        )
+    """,
+    'cohort_monthly_customers': """
+        CREATE TABLE IF NOT EXISTS {name} (
+            cohort_month DATE, user_id VARCHAR, orders BIGINT,
+            PRIMARY KEY (cohort_month, user_id)
+        )
+    """,
+}
+COHORT_TABLES = tuple(COHORT_SCHEMAS)
+COHORT_ORDER_COLUMNS = ('order_id', 'user_id', 'first_order', 'timestamp', 'total_amount')
+
+
+def utcnow():
+    """Naive UTC now, matching how event timestamps are stored"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class DuckDBClient(StorageBackend):
+    """Embedded columnar backend for single-node deployments.
+
+    Runs in-process against a local database file with the same tables and
+    queries as the ClickHouse backend. Only one process may open the file for
+    writing, so the Kafka consumer runs inside the API process and the API must
+    run with a single worker.
+    """
+
+    name = 'duckdb'
+    embedded = True
+
+    def __init__(self):
+        self.path = os.getenv('DUCKDB_PATH', 'data/analytics.duckdb')
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = duckdb.connect(self.path)
+        self._local = threading.local()
+        logger.info(f"Opened DuckDB database at {self.path}")
+        self.init_database()
+
+    @property
+    def cursor(self):
+        """Per-thread cursor; DuckDB connections must not be shared across threads"""
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self.connection.cursor()
+        return cursor
+
+    def run_query(self, query: str, params=None, columnar: bool = False, many: bool = False):
+        """Execute a query, logging it with its plan when over the slow-query threshold"""
+        cursor = self.cursor
+        start = time.perf_counter()
+        if many:
+            cursor.executemany(query, params)
+            rows = []
+        else:
+            cursor.execute(query, params or [])
+            rows = cursor.fetchall()
+        elapsed = time.perf_counter() - start
+
+        if slow_query_log.is_slow(elapsed):
+            stats = {
+                'endpoint': current_endpoint(),
+                'elapsed_ms': elapsed * 1000,
+                'rows_read': None,
+                'bytes_read': None,
+                'result_rows': len(rows)
+            }
+            slow_query_log.record(query, stats, None if many else functools.partial(self.explain, query, params))
+
+        if columnar:
+            return [list(column) for column in zip(*rows)]
+        return rows
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Run the enclosed statements of this thread's cursor as one transaction"""
+        cursor = self.cursor
+        cursor.begin()
+        try:
+            yield
+        except BaseException:
+            cursor.rollback()
+            raise
+        cursor.commit()
+
+    def insert_columns(self, table: str, data: dict, verb: str = 'INSERT OR IGNORE', suffix: str = ''):
+        """Insert {column: values} in one statement, unnesting the lists server-side"""
+        return self.run_query(
+            f"{verb} INTO {table} ({', '.join(data)}) "
+            f"SELECT {', '.join(f'unnest(${column})' for column in data)} {suffix}",
+            data
+        )
+
+    def explain(self, query: str, params=None):
+        """Plan lines of a SELECT query; runs on the slow-query log's own cursor"""
+        if not query.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return None
+        try:
+            plan = self.cursor.execute(f"EXPLAIN {query}", params or []).fetchall()
+            return [line for _, text in plan for line in text.splitlines()]
+        except Exception as e:
+            logger.warning(f"Failed to EXPLAIN slow query: {e}")
+            return None
+
+    def iter_rows(self, query: str, params=None, block_size: int = 10000):
+        """Stream rows on a dedicated cursor; closing early interrupts the query"""
+        cursor = self.connection.cursor()
+        finished = False
+        try:
+            cursor.execute(query, params or [])
+            while True:
+                rows = cursor.fetchmany(block_size)
+                if not rows:
+                    break
+                yield from rows
+            finished = True
+        finally:
+            if not finished:
+                cursor.interrupt()
+            cursor.close()
+
+    def init_database(self):
+        try:
+            self.run_query(ORDER_EVENTS_SCHEMA.format(name='order_events'))
+            self.ensure_event_key()
+
+            self.run_query("""
+                CREATE TABLE IF NOT EXISTS order_items_analytics (
+                    order_id VARCHAR, product_id VARCHAR, product_name VARCHAR,
+                    quantity INTEGER, price DOUBLE, subtotal DOUBLE, timestamp TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT current_timestamp,
+                    PRIMARY KEY (order_id, product_id)
+                )
+            """)
+
+            for table in COHORT_TABLES:
+                self.run_query(COHORT_SCHEMAS[table].format(name=table))
+
+            logger.info("DuckDB tables initialized")
+        except Exception as e:
+            logger.error(f"Failed to init database: {e}")
+            raise
+
+    def ensure_event_key(self):
+        """Re-key an order_events table created by an older release on event_id alone.
+
+        That key dropped every status event of an order as a duplicate of its
+        created event. DuckDB cannot change a primary key in place, so the
+        rows are copied into a new table that replaces the old one.
+        """
+        key = [name for _, name, _, _, _, pk in self.run_query("PRAGMA table_info('order_events')") if pk]
+        if key != ['event_id']:
+            return
+        logger.info("Re-keying order_events on (event_type, event_id)")
+        with self.transaction():
+            self.run_query(ORDER_EVENTS_SCHEMA.format(name='order_events_rekeyed'))
+            self.run_query("INSERT INTO order_events_rekeyed SELECT * FROM order_events")
+            self.run_query("DROP TABLE order_events")
+            self.run_query("ALTER TABLE order_events_rekeyed RENAME TO order_events")
+
+    @timed(STORAGE_QUERY_DURATION)
+    def insert_order_event(self, event_data: dict):
+        try:
+            row = self.event_row(event_data)
+            self.run_query(
+                "INSERT OR IGNORE INTO order_events (event_id, order_id, user_id, event_type, timestamp, total_amount, status) "
+                "VALUES ($event_id, $order_id, $user_id, $event_type, $timestamp, $total_amount, $status)",
+                row
+            )
+            logger.debug("Order event inserted: %s", row['order_id'])
+        except Exception as e:
+            logger.error(f"Failed to insert order event: {e}")
+            raise
+
+    @timed(STORAGE_QUERY_DURATION)
+    def insert_order_items(self, order_id: str, items: list, timestamp: str):
+        try:
+            data = self.item_rows(order_id, items, timestamp)
+            if data:
+                self.run_query(
+                    "INSERT OR IGNORE INTO order_items_analytics (order_id, product_id, product_name, quantity, price, subtotal, timestamp) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [tuple(row.values()) for row in data],
+                    many=True
+                )
+                logger.debug("Order items inserted for order: %s", order_id)
+        except Exception as e:
+            logger.error(f"Failed to insert order items: {e}")
+            raise
+
+    @timed(STORAGE_QUERY_DURATION)
+    def insert_order_batch(self, events: list):
+        """One ``INSERT OR IGNORE`` per table for the whole batch.
+
+        Columns are passed as lists and unnested server-side: every statement
+        commits on its own, so row-at-a-time inserts cost a commit per row.
+        """
+        try:
+            rows, items = self.batch_rows(events)
+            for table, data in (('order_events', rows), ('order_items_analytics', items)):
+                if data:
+                    self.insert_columns(table, {column: [row[column] for row in data] for column in data[0]})
+            logger.debug("Inserted %d order events and %d order items", len(rows), len(items))
+        except Exception as e:
+            logger.error(f"Failed to insert order batch: {e}")
+            raise
+
+    @timed(STORAGE_QUERY_DURATION)
+    def get_daily_sales(self, days: int = 7, columnar: bool = False):
+        try:
+            return self.run_query("""
+                SELECT CAST(timestamp AS DATE) as date, count(*) as total_orders,
+                       sum(total_amount) as total_revenue, avg(total_amount) as avg_order
+                FROM order_events WHERE event_type = 'order.created'
+                AND timestamp >= ?
+                GROUP BY date ORDER BY date DESC
+            """, [utcnow() - timedelta(days=days)], columnar=columnar)
+        except Exception as e:
+            logger.error(f"Failed to get daily sales: {e}")
+            return []
+
+    @timed(STORAGE_QUERY_DURATION)
+    def get_top_products(self, limit: int = 10, columnar: bool = False):
+        try:
+            return self.run_query("""
+                SELECT product_id, product_name, sum(quantity) as total_qty,
+                       sum(subtotal) as total_revenue, count(DISTINCT order_id) as order_count
+                FROM order_items_analytics
+                GROUP BY product_id, product_name ORDER BY total_revenue DESC LIMIT ?
+            """, [limit], columnar=columnar)
+        except Exception as e:
+            logger.error(f"Failed to get top products: {e}")
+            return []
+
+    @timed(STORAGE_QUERY_DURATION)
+    def get_order_status_distribution(self, columnar: bool = False):
+        try:
+            return self.run_query("""
+                WITH latest_status AS (
+                    SELECT order_id, arg_max(status, timestamp) as current_status
+                    FROM order_events WHERE status IS NOT NULL GROUP BY order_id
+                )
+                SELECT current_status as status, count(*) as count
+                FROM latest_status GROUP BY current_status ORDER BY count DESC
+            """, columnar=columnar)
+        except Exception as e:
+            logger.error(f"Failed to get status distribution: {e}")
+            return []
+
+    @timed(STORAGE_QUERY_DURATION)
+    def get_top_users(self, days: int = 30, limit: int = 10, columnar: bool = False):
+        try:
+            return self.run_query("""
+                SELECT user_id, count(DISTINCT order_id) as order_count,
+                       sum(total_amount) as total_spent, max(timestamp) as last_order_date
+                FROM order_events WHERE event_type = 'order.created'
+                AND timestamp >= ?
+                GROUP BY user_id ORDER BY total_spent DESC LIMIT ?
+            """, [utcnow() - timedelta(days=days), limit], columnar=columnar)
+        except Exception as e:
+            logger.error(f"Failed to get user activity: {e}")
+            return []
+
+    def iter_order_events(self, start, end, after=None, limit=None):
+        keyset = "AND (timestamp, event_id, event_type) > (?, ?, ?)" if after else ""
+        query = f"""
+            SELECT event_id, order_id, user_id, event_type, timestamp, total_amount, status
+            FROM order_events
+            WHERE timestamp >= ? AND timestamp < ? {keyset}
+            ORDER BY timestamp, event_id, event_type
+            {f"LIMIT {int(limit)}" if limit else ""}
+        """
+        return self.iter_rows(query, [start, end, *(after or ())])
+
+    def iter_user_spend(self, start, end, after=None, limit=None):
+        keyset = "AND user_id > ?" if after else ""
+        query = f"""
+            SELECT user_id, count(DISTINCT order_id) as order_count, sum(total_amount) as total_spent,
+                   min(timestamp) as first_order_date, max(timestamp) as last_order_date
+            FROM order_events
+            WHERE event_type = 'order.created' AND timestamp >= ? AND timestamp < ? {keyset}
+            GROUP BY user_id ORDER BY user_id
+            {f"LIMIT {int(limit)}" if limit else ""}
+        """
+        return self.iter_rows(query, [start, end, *(after or ())])
+
+    def iter_product_sales(self, start, end, after=None, limit=None):
+        keyset = "AND product_id > ?" if after else ""
+        query = f"""
+            SELECT product_id, any_value(product_name) as product_name, sum(quantity) as total_quantity,
+                   sum(subtotal) as total_revenue, count(DISTINCT order_id) as order_count
+            FROM order_items_analytics
+            WHERE timestamp >= ? AND timestamp < ? {keyset}
+            GROUP BY product_id ORDER BY product_id
+            {f"LIMIT {int(limit)}" if limit else ""}
+        """
+        return self.iter_rows(query, [start, end, *(after or ())])
+
+    @timed(STORAGE_QUERY_DURATION)
+    def get_first_orders(self, user_ids):
+        return dict(self.run_query(
+            "SELECT user_id, first_order FROM user_first_orders WHERE user_id IN (SELECT unnest(?))",
+            [list(user_ids)]
+        ))
+
+    @timed(STORAGE_QUERY_DURATION)
+    def set_first_orders(self, first_orders: dict):
+        if first_orders:
+            self.insert_columns(
+                'user_first_orders',
+                {'user_id': list(first_orders), 'first_order': list(first_orders.values())},
+                verb='INSERT',
+                suffix="ON CONFLICT (user_id) DO UPDATE SET first_order = least(first_order, excluded.first_order)"
+            )
+
+    @timed(STORAGE_QUERY_DURATION)
+    def record_cohort_orders(self, orders: list):
+        """Aggregate only the orders ``cohort_orders`` accepted, in one transaction"""
+        if not orders:
+            return
+        weekly = defaultdict(lambda: [0, 0.0])
+        monthly = Counter()
+        with self.transaction():
+            added = self.insert_columns(
+                'cohort_orders',
+                dict(zip(COHORT_ORDER_COLUMNS, map(list, zip(*orders)))),
+                suffix="RETURNING user_id, first_order, timestamp, total_amount"
+            )
+            for user_id, first_order, timestamp, total_amount in added:
+                cohort_week, week_number, cohort_month = self.cohort_keys(first_order, timestamp)
+                week = weekly[(cohort_week, week_number, user_id)]
+                week[0] += 1
+                week[1] += total_amount or 0
+                monthly[(cohort_month, user_id)] += 1
+            if not added:
+                return
+            self.insert_columns('cohort_weekly_activity', {
+                'cohort_week': [key[0] for key in weekly],
+                'week_number': [key[1] for key in weekly],
+                'user_id': [key[2] for key in weekly],
+                'orders': [orders for orders, _ in weekly.values()],
+                'revenue': [revenue for _, revenue in weekly.values()]
+            }, verb='INSERT', suffix="""
+                ON CONFLICT (cohort_week, week_number, user_id)
+                DO UPDATE SET orders = orders + excluded.orders, revenue = revenue + excluded.revenue
+            """)
+            self.insert_columns('cohort_monthly_customers', {
+                'cohort_month': [key[0] for key in monthly],
+                'user_id': [key[1] for key in monthly],
+                'orders': list(monthly.values())
+            }, verb='INSERT', suffix="ON CONFLICT (cohort_month, user_id) DO UPDATE SET orders = orders + excluded.orders")
+
+    @timed(STORAGE_QUERY_DURATION)
+    def get_weekly_retention(self, since, columnar: bool = False):
+        return self.run_query("""
+            SELECT cohort_week, week_number, count(*) as active_users, sum(orders) as orders, sum(revenue) as revenue
+            FROM cohort_weekly_activity
+            WHERE cohort_week >= ?
+            GROUP BY cohort_week, week_number ORDER BY cohort_week, week_number
+        """, [since], columnar=columnar)
+
+    @timed(STORAGE_QUERY_DURATION)
+    def get_repeat_purchase(self, since, columnar: bool = False):
+        return self.run_query("""
+            SELECT cohort_month, count(*) as customers, count(*) FILTER (WHERE orders > 1) as repeat_customers,
+                   sum(orders) as orders
+            FROM cohort_monthly_customers
+            WHERE cohort_month >= ?
+            GROUP BY cohort_month ORDER BY cohort_month
+        """, [since], columnar=columnar)
+
+    def rebuild_cohorts(self):
+        """Recompute the cohort tables in one transaction; readers see the old
+        aggregates until it commits.
+
+        DuckDB checks primary keys against rows deleted earlier in the same
+        transaction, so the aggregates are built into staging tables that
+        replace the live ones instead of being deleted and inserted again.
+        """
+        with self.transaction():
+            for table in COHORT_TABLES:
+                self.run_query(f"DROP TABLE IF EXISTS {table}_rebuild")
+                self.run_query(COHORT_SCHEMAS[table].format(name=f"{table}_rebuild"))
+            self.run_query("""
+                INSERT INTO user_first_orders_rebuild
+                SELECT user_id, min(timestamp) FROM order_events
+                WHERE event_type = 'order.created' GROUP BY user_id
+            """)
+            self.run_query("""
+                INSERT INTO cohort_orders_rebuild
+                SELECT oe.order_id, oe.user_id, fo.first_order, oe.timestamp, coalesce(oe.total_amount, 0)
+                FROM order_events oe JOIN user_first_orders_rebuild fo ON oe.user_id = fo.user_id
+                WHERE oe.event_type = 'order.created'
+                QUALIFY row_number() OVER (PARTITION BY oe.order_id ORDER BY oe.timestamp, oe.event_id) = 1
+            """)
+            self.run_query("""
+                INSERT INTO cohort_weekly_activity_rebuild
+                SELECT CAST(date_trunc('week', first_order) AS DATE) as cohort_week,
+                       (CAST(timestamp AS DATE) - cohort_week) // 7 as week_number, user_id,
+                       count(*), sum(total_amount)
+                FROM cohort_orders_rebuild GROUP BY ALL
+            """)
+            self.run_query("""
+                INSERT INTO cohort_monthly_customers_rebuild
+                SELECT CAST(date_trunc('month', first_order) AS DATE), user_id, count(*)
+                FROM cohort_orders_rebuild GROUP BY ALL
+            """)
+            for table in COHORT_TABLES:
+                self.run_query(f"DROP TABLE {table}")
+                self.run_query(f"ALTER TABLE {table}_rebuild RENAME TO {table}")
+        logger.info("Cohort aggregates rebuilt from order events")
+
+    @timed(STORAGE_QUERY_DURATION)
+    def get_training_order_items(self):
+        return self.run_query("""
+            SELECT oi.order_id, oe.user_id, oi.product_id, oi.product_name, oi.quantity, oi.subtotal
+            FROM order_items_analytics oi
+            JOIN order_events oe ON oi.order_id = oe.order_id
+            WHERE oe.event_type = 'order.created'
+        """)
+
+    @timed(STORAGE_QUERY_DURATION)
+    def get_popular_products(self, limit: int = 5):
+        return self.run_query("""
+            SELECT product_id, product_name, sum(quantity) as total_sold, count(DISTINCT order_id) as order_count
+            FROM order_items_analytics
+            GROUP BY product_id, product_name ORDER BY total_sold DESC LIMIT ?
+        """, [limit])
+
+    @timed(STORAGE_QUERY_DURATION)
+    def get_total_metrics(self):
+        try:
+            result = self.run_query("""
+                SELECT count(*) as total_orders, sum(total_amount) as total_revenue,
+                       avg(total_amount) as avg_order
+                FROM order_events WHERE event_type = 'order.created'
+            """)
+            return result[0] if result else (0, 0, 0)
+        except Exception as e:
+            logger.error(f"Failed to get total metrics: {e}")
+            return (0, 0, 0)
+
+    def recent_event_ids(self, since):
+        return self.iter_rows("SELECT event_type, event_id, timestamp FROM order_events WHERE timestamp > ?", [since])
+
+    @timed(STORAGE_QUERY_DURATION)
+    def existing_event_ids(self, keys) -> set:
+        if not keys:
+            return set()
+        timestamps = [timestamp for _, timestamp in keys]
+        # The timestamp bounds let zone maps skip row groups
+        result = self.run_query(
+            "SELECT event_type, event_id FROM order_events WHERE timestamp BETWEEN ? AND ? AND list_contains(?, event_id)",
+            [min(timestamps), max(timestamps), [event_id for (_, event_id), _ in keys]]
+        )
+        return set(result) & {key for key, _ in keys}
+
+    def ping(self) -> bool:
+        try:
+            self.run_query("SELECT 1")
+            return True
+        except Exception as e:
+            logger.warning(f"DuckDB ping failed: {e}")
+            return False
+
+    def truncate(self):
+        for table in ('order_events', 'order_items_analytics', *COHORT_TABLES):
+            self.run_query(f"DELETE FROM {table}")
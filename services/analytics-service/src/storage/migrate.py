@@ -0,0 +1,29 @@
+"""One-shot schema migrations for the ClickHouse backend.
+
+    python -m src.storage.migrate
+
+Rebuilds tables created by older releases by copying them into the current
+schema and swapping the copy in. A table is rebuilt when it is a plain
+``MergeTree`` instead of a ``ReplacingMergeTree``, when its sorting key
+differs from the current one, or when it is not partitioned by month (the
+archiver drops archived months as whole partitions). The migration also
+drops the ``cohort_events`` table and views that fed the cohort aggregates
+before ``cohort_orders``; run ``python -m src.kafka_consumer.cohorts rebuild``
+afterwards.
+
+Stop every Kafka consumer before running it: rows inserted while a table is
+copied would be lost by the swap, so the migration aborts when it notices
+them. Services only report outdated tables at startup and never migrate them
+themselves.
+"""
+import sys
+from src.storage import storage
+from src.utils.logger import logger
+
+if __name__ == '__main__':
+    if sys.argv[1:]:
+        sys.exit("usage: python -m src.storage.migrate")
+    if storage.name != 'clickhouse':
+        sys.exit(f"Migrations only apply to the ClickHouse backend, not '{storage.name}'")
+    migrated = storage.migrate()
+    logger.info(f"Migrated tables: {', '.join(migrated)}" if migrated else "All tables are up to date")
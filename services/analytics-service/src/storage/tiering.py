@@ -0,0 +1,336 @@
+"""Hot/cold tiering for the ClickHouse event tables.
+
+``order_events`` and ``order_items_analytics`` keep recent months in hot
+storage. Whole months older than ``CLICKHOUSE_ARCHIVE_AFTER_DAYS`` are
+archived by ``python -m src.storage.tiering archive`` (run it from cron):
+
+1. The month is exported to a zstd-compressed Parquet file under the
+   server's ``user_files`` directory (``CLICKHOUSE_ARCHIVE_DIR``).
+2. Compact summary rows (daily sales, final order statuses, product sales)
+   are computed from that file into small hot tables.
+3. A row in ``archive_batches`` records the batch. Each table's *boundary*
+   is the end of its newest archived month.
+4. After ``CLICKHOUSE_ARCHIVE_GRACE_SECONDS``, which lets every API worker
+   pick up the new boundary, the archived rows are removed from hot storage.
+
+``TierPlanner`` is what queries use to decide what to read. A query whose
+range starts at or after a table's boundary reads only the hot table.
+All-time aggregates combine hot rows after the boundary with the summaries.
+Ranged queries that reach further back also read the archived Parquet files
+of the months they overlap.
+
+Each batch only takes rows written before the run started
+(``created_at <= cutoff``), and a later batch of the same month only takes
+rows written after the previous cutoff, so a run interrupted at any step can
+simply be repeated. Rows arriving late for an archived month are not visible
+until the next run archives them.
+"""
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime
+from src.utils.logger import logger
+from src.utils.metrics import CLICKHOUSE_TIER_READS
+
+# Columns kept in the Parquet archives, as a file() structure
+ARCHIVE_STRUCTURES = {
+    'order_events': (
+        "event_id String, order_id String, user_id String, event_type String, "
+        "timestamp DateTime, total_amount Nullable(Float64), status Nullable(String)"
+    ),
+    'order_items_analytics': (
+        "order_id String, product_id String, product_name String, "
+        "quantity Int32, price Float64, subtotal Float64, timestamp DateTime"
+    ),
+}
+
+TIERING_SCHEMAS = (
+    """
+    CREATE TABLE IF NOT EXISTS archive_batches (
+        table_name String, batch String, month Date, boundary DateTime, cutoff DateTime,
+        rows UInt64, path String, archived_at DateTime DEFAULT now()
+    ) ENGINE = MergeTree() ORDER BY (table_name, batch)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS archived_daily_sales (
+        batch String, date Date, orders UInt64, priced_orders UInt64, revenue Float64
+    ) ENGINE = MergeTree() ORDER BY (batch, date)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS archived_order_status (
+        batch String, status String, orders UInt64
+    ) ENGINE = MergeTree() ORDER BY (batch, status)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS archived_product_sales (
+        batch String, product_id String, product_name String,
+        quantity Int64, revenue Float64, orders UInt64
+    ) ENGINE = MergeTree() ORDER BY (batch, product_id)
+    """,
+)
+
+TIERING_TABLES = ('archive_batches', 'archived_daily_sales', 'archived_order_status', 'archived_product_sales')
+
+# Summaries of each archived batch. {archive} reads the batch's Parquet file,
+# {month_archive} every batch of its month: an order's status events can span
+# batches, so the status summary of the newest batch covers the whole month
+# and supersedes those of the earlier batches.
+ARCHIVE_SUMMARIES = {
+    'order_events': (
+        """
+        INSERT INTO archived_daily_sales (batch, date, orders, priced_orders, revenue)
+        SELECT %(batch)s, toDate(timestamp) as date, count(), count(total_amount), sum(ifNull(total_amount, 0))
+        FROM {archive} WHERE event_type = 'order.created' GROUP BY date
+        """,
+        # Orders with status events after the month are counted from hot rows
+        """
+        INSERT INTO archived_order_status (batch, status, orders)
+        SELECT %(batch)s, current_status, count() FROM (
+            SELECT order_id, argMax(assumeNotNull(status), timestamp) as current_status
+            FROM {month_archive} WHERE status IS NOT NULL GROUP BY order_id
+        )
+        WHERE order_id NOT IN (
+            SELECT order_id FROM order_events WHERE timestamp >= %(boundary)s AND status IS NOT NULL
+        )
+        GROUP BY current_status
+        """,
+    ),
+    'order_items_analytics': (
+        """
+        INSERT INTO archived_product_sales (batch, product_id, product_name, quantity, revenue, orders)
+        SELECT %(batch)s, product_id, product_name, sum(quantity), sum(subtotal), count(DISTINCT order_id)
+        FROM {archive} GROUP BY product_id, product_name
+        """,
+    ),
+}
+
+
+def archive_path(archive_dir: str, table: str, batch: str) -> str:
+    return f"{archive_dir}/{table}/{batch}.parquet"
+
+
+def archive_file(archive_dir: str, table: str, batches: list) -> str:
+    """file() table function reading the given archived batches of ``table``"""
+    pattern = batches[0] if len(batches) == 1 else f"{{{','.join(batches)}}}"
+    return f"file('{archive_path(archive_dir, table, pattern)}', 'Parquet', '{ARCHIVE_STRUCTURES[table]}')"
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def month_start(month: date) -> datetime:
+    return datetime.combine(month, datetime.min.time())
+
+
+class Archive(namedtuple('Archive', 'boundary batches months')):
+    """Archived batches of a table and the month each one holds, oldest first"""
+
+    def overlapping(self, start=None, end=None) -> list:
+        """Batches whose month overlaps [start, end); None leaves that side open"""
+        return [
+            batch for batch, month in zip(self.batches, self.months)
+            if (start is None or month_start(next_month(month)) > start)
+            and (end is None or month_start(month) < end)
+        ]
+
+    def latest(self) -> list:
+        """Newest batch of each month, whose summaries cover the whole month"""
+        return list({month: batch for batch, month in zip(self.batches, self.months)}.values())
+
+
+class TierPlanner:
+    """Decides whether a query can stay on the hot tier.
+
+    Archive boundaries are cached for ``refresh_seconds``; the archiver waits
+    longer than that before deleting hot rows, so a stale boundary only means
+    reading data that is still in both tiers from the hot one.
+    """
+
+    def __init__(self, backend, archive_dir: str, refresh_seconds: float = 30):
+        self.backend = backend
+        self.archive_dir = archive_dir
+        self.refresh_seconds = refresh_seconds
+        self.archives = {}
+        self.refreshed_at = float('-inf')
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        try:
+            result = self.backend.run_query("""
+                SELECT table_name, max(boundary), groupArray((batch, month))
+                FROM archive_batches GROUP BY table_name
+            """)
+            self.archives = {
+                table: Archive(boundary, *map(list, zip(*sorted(batches))))
+                for table, boundary, batches in result
+            }
+        except Exception as e:
+            logger.warning(f"Failed to load archive boundaries, keeping the previous ones: {e}")
+        self.refreshed_at = time.monotonic()
+
+    def archive(self, table: str):
+        """Archive of ``table``, or None when nothing has been archived"""
+        if time.monotonic() - self.refreshed_at >= self.refresh_seconds:
+            with self.lock:
+                if time.monotonic() - self.refreshed_at >= self.refresh_seconds:
+                    self.refresh()
+        return self.archives.get(table)
+
+    def plan(self, table: str, start=None):
+        """Archive a query reading ``table`` from ``start`` (None: all time) needs, or None for hot only"""
+        archive = self.archive(table)
+        if archive is not None and (start is None or start < archive.boundary):
+            CLICKHOUSE_TIER_READS.labels(table, 'archive').inc()
+            return archive
+        CLICKHOUSE_TIER_READS.labels(table, 'hot').inc()
+        return None
+
+    def archived_rows(self, table: str, batches: list) -> str:
+        return archive_file(self.archive_dir, table, batches)
+
+    def source(self, table: str, start=None, end=None):
+        """(FROM clause, params) for the rows of ``table`` a query over [start, end) needs.
+
+        Only the batches whose month overlaps the range are read, so a query
+        does not open every Parquet file ever archived.
+        """
+        archive = self.plan(table, start)
+        batches = archive.overlapping(start, end) if archive else []
+        if not batches:
+            return table, {}
+        columns = ', '.join(column.split()[0] for column in ARCHIVE_STRUCTURES[table].split(', '))
+        param = f"{table}_hot_from"
+        return (
+            f"(SELECT {columns} FROM {table} WHERE timestamp >= %({param})s "
+            f"UNION ALL SELECT {columns} FROM {self.archived_rows(table, batches)})",
+            {param: archive.boundary}
+        )
+
+
+class Archiver:
+    """Moves whole months past ``archive_after_days`` from hot tables to Parquet"""
+
+    def __init__(self, backend, archive_after_days: int, grace_seconds: float):
+        self.backend = backend
+        self.archive_after_days = archive_after_days
+        self.grace_seconds = grace_seconds
+
+    def run(self):
+        cutoff, horizon = self.backend.run_query(
+            f"SELECT now() - 1, toStartOfMonth(now() - INTERVAL {int(self.archive_after_days)} DAY)"
+        )[0]
+        # Rows archived by an interrupted run are removed along with this run's
+        archived = self.pending_deletes()
+        for table in ARCHIVE_STRUCTURES:
+            months = self.backend.run_query(
+                f"SELECT DISTINCT toStartOfMonth(timestamp) as month FROM {table} "
+                f"WHERE timestamp < %(horizon)s ORDER BY month",
+                {'horizon': horizon}
+            )
+            for (month,) in months:
+                if self.archive_month(table, month, cutoff):
+                    archived.append((table, month, cutoff))
+        if not archived:
+            logger.info(f"Nothing to archive before {horizon}")
+            return
+
+        logger.info(f"Waiting {self.grace_seconds}s for API workers to pick up the new archive boundaries")
+        time.sleep(self.grace_seconds)
+        for table, month, batch_cutoff in archived:
+            self.delete_archived(table, month, batch_cutoff)
+
+    def archive_month(self, table: str, month: date, cutoff) -> bool:
+        boundary = datetime.combine(next_month(month), datetime.min.time())
+        previous, earlier_batches = self.backend.run_query(
+            "SELECT max(cutoff), groupArray(batch) FROM archive_batches "
+            "WHERE table_name = %(table)s AND month = %(month)s",
+            {'table': table, 'month': month}
+        )[0]
+        params = {'start': month, 'boundary': boundary, 'previous': previous, 'cutoff': cutoff}
+        rows_filter = (
+            "timestamp >= %(start)s AND timestamp < %(boundary)s "
+            "AND created_at > %(previous)s AND created_at <= %(cutoff)s"
+        )
+        # FINAL keeps the newest version of each row before filtering on created_at
+        rows = self.backend.run_query(f"SELECT count() FROM {table} FINAL WHERE {rows_filter}", params)[0][0]
+        if not rows:
+            return False
+
+        batch = f"{month:%Y%m}-{cutoff:%Y%m%d%H%M%S}"
+        path = archive_path(self.backend.archive_dir, table, batch)
+        structure = ARCHIVE_STRUCTURES[table]
+        columns = ', '.join(column.split()[0] for column in structure.split(', '))
+        self.backend.run_query(
+            f"INSERT INTO FUNCTION file('{path}', 'Parquet', '{structure}') "
+            f"SELECT {columns} FROM {table} FINAL WHERE {rows_filter} ORDER BY timestamp",
+            params,
+            settings={'engine_file_truncate_on_insert': 1, 'output_format_parquet_compression_method': 'zstd'}
+        )
+        archive_dir = self.backend.archive_dir
+        for summary in ARCHIVE_SUMMARIES[table]:
+            self.backend.run_query(
+                summary.format(
+                    archive=archive_file(archive_dir, table, [batch]),
+                    month_archive=archive_file(archive_dir, table, sorted(earlier_batches) + [batch])
+                ),
+                {'batch': batch, 'boundary': boundary}
+            )
+        self.backend.run_query(
+            "INSERT INTO archive_batches (table_name, batch, month, boundary, cutoff, rows, path) VALUES",
+            [(table, batch, month, boundary, cutoff, rows, path)]
+        )
+        logger.info(f"Archived {rows} rows of {table} for {month:%Y-%m} to {path}")
+        return True
+
+    def pending_deletes(self) -> list:
+        """Batches whose rows are still in hot storage"""
+        pending = []
+        for table, month, cutoff in self.backend.run_query(
+            "SELECT table_name, month, max(cutoff) FROM archive_batches GROUP BY table_name, month"
+        ):
+            remaining = self.backend.run_query(
+                f"SELECT count() FROM {table} WHERE timestamp >= %(start)s AND timestamp < %(boundary)s "
+                f"AND created_at <= %(cutoff)s",
+                {'start': month, 'boundary': next_month(month), 'cutoff': cutoff}
+            )[0][0]
+            if remaining:
+                pending.append((table, month, cutoff))
+        return pending
+
+    def delete_archived(self, table: str, month: date, cutoff):
+        params = {'start': month, 'boundary': next_month(month), 'cutoff': cutoff}
+        late_rows = self.backend.run_query(
+            f"SELECT count() FROM {table} WHERE timestamp >= %(start)s AND timestamp < %(boundary)s "
+            f"AND created_at > %(cutoff)s",
+            params
+        )[0][0]
+        partitioned = self.backend.run_query(
+            "SELECT partition_key FROM system.tables WHERE database = currentDatabase() AND name = %(table)s",
+            {'table': table}
+        )[0][0] == 'toYYYYMM(timestamp)'
+        if partitioned and not late_rows:
+            self.backend.run_query(f"ALTER TABLE {table} DROP PARTITION {month:%Y%m}")
+        else:
+            self.backend.run_query(
+                f"ALTER TABLE {table} DELETE WHERE timestamp >= %(start)s AND timestamp < %(boundary)s "
+                f"AND created_at <= %(cutoff)s",
+                params,
+                settings={'mutations_sync': 1}
+            )
+        logger.info(f"Removed archived {month:%Y-%m} rows from {table}")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['archive']:
+        sys.exit("usage: python -m src.storage.tiering archive")
+    from src.storage import storage
+    if storage.name != 'clickhouse':
+        sys.exit(f"Tiering is only supported by the ClickHouse backend, not '{storage.name}'")
+    Archiver(
+        storage,
+        archive_after_days=int(os.getenv('CLICKHOUSE_ARCHIVE_AFTER_DAYS', 180)),
+        grace_seconds=float(os.getenv('CLICKHOUSE_ARCHIVE_GRACE_SECONDS', 2 * storage.tiers.refresh_seconds))
+    ).run()
@@ -1,11 +1,12 @@
 import logging
+import os
 import sys
 from datetime import datetime
 
 def setup_logger(name: str = "analytics-service") -> logging.Logger:
     """Setup and configure logger"""
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
     
     # Console handler
     handler = logging.StreamHandler(sys.stdout)
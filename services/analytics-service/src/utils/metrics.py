@@ -0,0 +1,174 @@
+"""Prometheus metrics shared by the API, the Kafka consumer and the recommender.
+
+The consumer process serves its own registry on ``CONSUMER_METRICS_PORT``.
+A single API process exposes its registry at ``/metrics``. With several
+uvicorn workers (``WEB_CONCURRENCY``) each scrape would only reach one of
+them, so set ``PROMETHEUS_MULTIPROC_DIR`` to an empty directory: every worker
+then writes its values there and ``/metrics`` aggregates all of them.
+"""
+import functools
+import os
+import time
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+    start_http_server
+)
+from src.utils.logger import logger
+
+# Latency buckets (seconds) tuned for sub-millisecond to multi-second calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# HTTP
+HTTP_REQUEST_DURATION = Histogram(
+    "analytics_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+# Admission control
+ADMISSION_ACTIVE = Gauge(
+    "analytics_admission_active_requests",
+    "Requests currently holding a slot, by cost class",
+    ["cost_class"],
+    multiprocess_mode="livesum"
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "analytics_admission_queue_depth",
+    "Requests waiting for a slot, by cost class",
+    ["cost_class"],
+    multiprocess_mode="livesum"
+)
+ADMISSION_QUEUE_WAIT = Histogram(
+    "analytics_admission_queue_wait_seconds",
+    "Time admitted requests spent waiting for a slot",
+    ["cost_class"],
+    buckets=LATENCY_BUCKETS
+)
+ADMISSION_SHED = Counter(
+    "analytics_admission_shed_total",
+    "Requests rejected by admission control, by cost class and reason",
+    ["cost_class", "reason"]
+)
+
+# Storage (the metric keeps its ClickHouse-era name so existing dashboards
+# keep working; it covers every backend, told apart by the method label)
+STORAGE_QUERY_DURATION = Histogram(
+    "analytics_clickhouse_query_duration_seconds",
+    "Duration of storage backend calls by method",
+    ["method"],
+    buckets=LATENCY_BUCKETS
+)
+CLICKHOUSE_ROWS_READ = Counter(
+    "analytics_clickhouse_rows_read_total",
+    "Rows read by ClickHouse queries, by calling endpoint",
+    ["endpoint"]
+)
+CLICKHOUSE_BYTES_READ = Counter(
+    "analytics_clickhouse_bytes_read_total",
+    "Bytes read by ClickHouse queries, by calling endpoint",
+    ["endpoint"]
+)
+CLICKHOUSE_TIER_READS = Counter(
+    "analytics_clickhouse_tier_reads_total",
+    "Planned ClickHouse reads by table and tier (hot only, or hot plus archive)",
+    ["table", "tier"]
+)
+
+# Kafka consumer
+CONSUMER_EVENTS = Counter(
+    "analytics_consumer_events_total",
+    "Events processed by the Kafka consumer",
+    ["topic", "result"]
+)
+CONSUMER_BATCH_SIZE = Histogram(
+    "analytics_consumer_batch_size",
+    "Number of records returned by each consumer poll",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+CONSUMER_EVENT_DURATION = Histogram(
+    "analytics_consumer_event_duration_seconds",
+    "Time to process and insert a single event",
+    ["topic"],
+    buckets=LATENCY_BUCKETS
+)
+CONSUMER_BATCH_DURATION = Histogram(
+    "analytics_consumer_batch_duration_seconds",
+    "Time to store the new events of a poll with one write per table",
+    buckets=LATENCY_BUCKETS
+)
+CONSUMER_LAG = Gauge(
+    "analytics_consumer_lag",
+    "Messages between the partition high watermark and the consumer position",
+    ["topic", "partition"],
+    multiprocess_mode="livemax"
+)
+
+# Recommender (every worker maps the same model, so across workers the model
+# gauges report the largest value instead of a sum)
+RECOMMENDER_PHASE_DURATION = Histogram(
+    "analytics_recommender_phase_duration_seconds",
+    "Duration of recommender training phases",
+    ["phase"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+)
+RECOMMENDER_MODEL_BYTES = Gauge(
+    "analytics_recommender_model_bytes",
+    "Memory held by the trained model arrays",
+    ["component"],
+    multiprocess_mode="livemax"
+)
+RECOMMENDER_MODEL_ENTITIES = Gauge(
+    "analytics_recommender_model_entities",
+    "Users and products covered by the trained model",
+    ["entity"],
+    multiprocess_mode="livemax"
+)
+
+
+def timed(histogram):
+    """Decorator observing a call's duration, labelled with the function name"""
+    def decorator(func):
+        child = histogram.labels(func.__name__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def start_metrics_server():
+    """Expose this process' metrics over HTTP (used by the consumer process)"""
+    port = int(os.getenv('CONSUMER_METRICS_PORT', 9108))
+    start_http_server(port)
+    logger.info(f"Metrics server listening on port {port}")
+
+
+def multiprocess_enabled() -> bool:
+    return 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+
+def generate_metrics() -> bytes:
+    """Exposition of this process' metrics, or of every worker's in multiprocess mode"""
+    if not multiprocess_enabled():
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def mark_process_dead():
+    """Drop this worker's live gauges from the shared directory on shutdown"""
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(os.getpid())
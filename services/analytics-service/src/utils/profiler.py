@@ -0,0 +1,76 @@
+import os
+import sys
+import threading
+from collections import Counter
+
+# Source root: frames under it are application code
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler producing collapsed (folded) stacks.
+
+    A background thread snapshots ``sys._current_frames()`` every ``interval``
+    seconds. The target thread (the event loop serving the request) is always
+    sampled; other threads only when they are running application code, which
+    captures handlers and queries offloaded to the threadpool while skipping
+    idle workers. The output is the ``frame;frame;frame count`` format read by
+    flamegraph.pl, speedscope and inferno.
+    """
+
+    def __init__(self, target_thread_id: int = None, interval: float = None):
+        self.target_thread_id = target_thread_id or threading.get_ident()
+        self.interval = interval or float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', 5)) / 1000
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _label(frame):
+        code = frame.f_code
+        filename = code.co_filename
+        if filename.startswith(SRC_DIR):
+            filename = os.path.relpath(filename, os.path.dirname(SRC_DIR))
+        else:
+            filename = os.path.basename(filename)
+        return f"{code.co_name} ({filename}:{frame.f_lineno})".replace(";", ":")
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            in_app = thread_id == self.target_thread_id
+            while frame is not None:
+                stack.append(self._label(frame))
+                in_app = in_app or frame.f_code.co_filename.startswith(SRC_DIR)
+                frame = frame.f_back
+            if not in_app:
+                continue
+            stack.append(names.get(thread_id, str(thread_id)))
+            stack.reverse()
+            self.samples[";".join(stack)] += 1
+        self.sample_count += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        return self
+
+    def collapsed(self) -> str:
+        """Folded stacks, one ``stack count`` line per distinct stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
@@ -0,0 +1,58 @@
+from contextvars import ContextVar
+from starlette.routing import Match
+
+# ASGI scope of the request currently being served (None outside requests)
+_current_scope = ContextVar("current_scope", default=None)
+
+# app -> {endpoint: route template}
+_route_templates = {}
+
+
+def route_template(scope) -> str:
+    """Route template (``/recommendations/user/{user_id}``) matched for a scope.
+
+    Only available once the router has matched the request; returns
+    ``unmatched`` before that or for unknown paths.
+    """
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    app = scope["app"]
+    routes = _route_templates.get(app)
+    if routes is None:
+        routes = _route_templates[app] = {
+            route.endpoint: route.path
+            for route in app.routes
+            if hasattr(route, "endpoint")
+        }
+    return routes.get(endpoint, "unmatched")
+
+
+def match_route_template(scope) -> str:
+    """Route template for a scope before the router has run.
+
+    Middleware that has to act per route before the request is dispatched
+    matches the app's routes itself; returns ``unmatched`` for unknown paths.
+    """
+    for route in scope["app"].routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+def bind_scope(scope):
+    """Mark ``scope`` as the current request; returns a token for ``unbind_scope``"""
+    return _current_scope.set(scope)
+
+
+def unbind_scope(token):
+    _current_scope.reset(token)
+
+
+def current_endpoint():
+    """Route template of the request being served, or None in background work"""
+    scope = _current_scope.get()
+    if scope is None:
+        return None
+    return route_template(scope)
@@ -0,0 +1,74 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from src.utils.logger import logger
+
+
+class SlowQueryLog:
+    """Keeps the most recent queries that exceeded a latency threshold.
+
+    Entries are logged as warnings and retained in a bounded in-memory buffer
+    served by ``/api/analytics/debug/slow-queries``. Query plans are produced
+    by a single background thread, so the request that ran the slow query does
+    not also wait for its EXPLAIN; at most ``capacity`` plans wait at once and
+    the rest are skipped.
+    """
+
+    def __init__(self, threshold_ms: float = None, capacity: int = None):
+        self.threshold_ms = float(threshold_ms if threshold_ms is not None else os.getenv('SLOW_QUERY_THRESHOLD_MS', 500))
+        self.entries = deque(maxlen=int(capacity if capacity is not None else os.getenv('SLOW_QUERY_LOG_SIZE', 100)))
+        self._lock = threading.Lock()
+        self._explainer = None
+        self._pending = 0
+
+    def is_slow(self, elapsed: float) -> bool:
+        return elapsed * 1000 >= self.threshold_ms
+
+    def record(self, query: str, stats: dict, explain=None):
+        """Log a slow query; ``explain`` returns its plan and runs in the background"""
+        entry = {
+            "logged_at": datetime.now().isoformat(),
+            "query": " ".join(query.split()),
+            **stats,
+            "explain": None
+        }
+        with self._lock:
+            self.entries.append(entry)
+            if explain and self._pending < self.entries.maxlen:
+                self._pending += 1
+                if self._explainer is None:
+                    self._explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query-explain')
+                self._explainer.submit(self._explain, entry, explain)
+        logger.warning(
+            f"Slow query ({stats['elapsed_ms']:.1f} ms, endpoint={stats['endpoint'] or 'background'}, "
+            f"rows_read={stats['rows_read']}, bytes_read={stats['bytes_read']}): {entry['query']}"
+        )
+
+    def _explain(self, entry: dict, explain):
+        try:
+            plan = explain()
+        finally:
+            with self._lock:
+                self._pending -= 1
+        if plan:
+            with self._lock:
+                entry["explain"] = plan
+            logger.warning(f"EXPLAIN of slow query {entry['query']}:\n" + "\n".join(plan))
+
+    def flush(self):
+        """Wait for the query plans already scheduled"""
+        with self._lock:
+            explainer = self._explainer
+        if explainer:
+            explainer.submit(lambda: None).result()
+
+    def recent(self, limit: int = None):
+        with self._lock:
+            entries = list(self.entries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+
+slow_query_log = SlowQueryLog()
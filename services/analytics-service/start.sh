@@ -3,10 +3,21 @@ set -e
 
 echo "Starting Analytics Service..."
 
-# Start Kafka consumer in background
-python consumer.py &
-CONSUMER_PID=$!
-echo "Kafka consumer started with PID: $CONSUMER_PID"
+# Start Kafka consumer in background. Embedded backends (DuckDB) allow a
+# single writer process, so the API runs the consumer in-process instead.
+if [ "${STORAGE_BACKEND:-clickhouse}" != "duckdb" ]; then
+    # The consumer serves its own metrics on CONSUMER_METRICS_PORT
+    env -u PROMETHEUS_MULTIPROC_DIR python consumer.py &
+    CONSUMER_PID=$!
+    echo "Kafka consumer started with PID: $CONSUMER_PID"
+fi
+
+# Workers write their metrics to PROMETHEUS_MULTIPROC_DIR so /metrics covers
+# all of them. Values left by a previous run would be added to the new ones.
+if [ -n "${PROMETHEUS_MULTIPROC_DIR:-}" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
 
 # Start FastAPI server
 echo "Starting FastAPI server..."
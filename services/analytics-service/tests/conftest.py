@@ -0,0 +1,52 @@
+"""Run the service against the in-process fake backend.
+
+The environment is set before anything under ``src`` is imported, because
+the storage backend, interaction store and model store are created at import.
+"""
+import os
+import tempfile
+
+import pytest
+
+from benchmarks import fakes
+
+fakes.install()
+os.environ['INTERACTION_STORE'] = 'memory'
+os.environ.setdefault('MODEL_STORE_DIR', tempfile.mkdtemp(prefix='analytics-models-'))
+
+
+@pytest.fixture
+def storage():
+    """The shared fake backend, emptied before each test"""
+    from src.storage import storage
+    storage.truncate()
+    yield storage
+    storage.truncate()
+
+
+@pytest.fixture
+def clickhouse(monkeypatch):
+    """A ClickHouseClient that records its queries instead of reaching a server.
+
+    Append ``(substring, result)`` pairs to ``client.results``: the first
+    pair whose substring occurs in a query answers it, either with ``result``
+    or, when it is callable, with ``result(query, params)``. Other queries
+    return no rows. Recorded queries are whitespace-normalized.
+    """
+    from src.storage.clickhouse_client import ClickHouseClient
+    monkeypatch.setattr(ClickHouseClient, 'connect_with_retry', lambda self: None)
+    monkeypatch.setattr(ClickHouseClient, 'init_database', lambda self: None)
+    recorder = ClickHouseClient()
+    recorder.queries = []
+    recorder.results = []
+
+    def run_query(query, params=None, columnar=False, client=None, settings=None):
+        query = " ".join(query.split())
+        recorder.queries.append((query, params, settings))
+        for pattern, result in recorder.results:
+            if pattern in query:
+                return result(query, params) if callable(result) else result
+        return []
+
+    monkeypatch.setattr(recorder, 'run_query', run_query)
+    return recorder
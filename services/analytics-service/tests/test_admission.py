@@ -0,0 +1,142 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from src.api.admission import AdmissionMiddleware, CostClass
+
+
+def make_class(**overrides):
+    settings = {"concurrency": 1, "queue_size": 1, "queue_timeout_ms": 1000, "retry_after": 7}
+    settings.update(overrides)
+    return CostClass("test", **settings)
+
+
+def test_queued_request_gets_the_released_slot():
+    async def scenario():
+        cost_class = make_class()
+        assert await cost_class.acquire() is None
+        waiting = asyncio.ensure_future(cost_class.acquire())
+        await asyncio.sleep(0)
+        assert len(cost_class.waiters) == 1
+        assert await cost_class.acquire() == "queue_full"
+
+        cost_class.release()
+        assert await waiting is None
+        assert cost_class.active == 1
+        cost_class.release()
+        assert cost_class.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_queued_request_times_out():
+    async def scenario():
+        cost_class = make_class(queue_timeout_ms=10)
+        assert await cost_class.acquire() is None
+        assert await cost_class.acquire() == "timeout"
+        assert not cost_class.waiters
+        cost_class.release()
+        assert cost_class.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_param_caps():
+    cost_class = make_class(limits={"days": 365, "limit": 100})
+    assert cost_class.check_params({"days": ["30"], "limit": ["100"]}) is None
+    assert cost_class.check_params({"days": ["400"]}) == "days must be between 1 and 365"
+    assert cost_class.check_params({"limit": ["0"]}) == "limit must be between 1 and 100"
+    # Non-numeric values are left to request validation
+    assert cost_class.check_params({"days": ["many"]}) is None
+
+
+def make_app(release, classes):
+    app = FastAPI()
+
+    @app.get("/api/analytics/dashboard")
+    async def dashboard():
+        await release.wait()
+        return {"ok": True}
+
+    @app.get("/api/ai/train")
+    async def train():
+        await release.wait()
+        return {"ok": True}
+
+    @app.get("/api/analytics/health")
+    async def health():
+        return {"ok": True}
+
+    app.add_middleware(AdmissionMiddleware, classes=classes)
+    return app
+
+
+def run_concurrently(classes, *paths):
+    """Send the first request, then the others while it holds its slot"""
+    async def scenario():
+        release = asyncio.Event()
+        transport = httpx.ASGITransport(app=make_app(release, classes))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = asyncio.ensure_future(client.get(paths[0]))
+            await asyncio.sleep(0.05)
+            others = [await client.get(path) for path in paths[1:]]
+            release.set()
+            return [await first, *others]
+
+    return asyncio.run(scenario())
+
+
+def test_saturated_class_sheds_with_retry_after():
+    classes = {"aggregate": make_class(queue_size=0), "cheap": make_class(), "training": make_class()}
+    first, second, health = run_concurrently(
+        classes, "/api/analytics/dashboard", "/api/analytics/dashboard", "/api/analytics/health"
+    )
+    assert first.status_code == 200
+    assert second.status_code == 503
+    assert second.headers["Retry-After"] == "7"
+    # Probes are never limited
+    assert health.status_code == 200
+
+
+def test_running_retrain_is_rejected_with_429():
+    classes = {
+        "aggregate": make_class(),
+        "cheap": make_class(),
+        "training": make_class(queue_size=0, retry_after=60, reject_status=429),
+    }
+    first, second = run_concurrently(classes, "/api/ai/train", "/api/ai/train")
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert second.headers["Retry-After"] == "60"
+
+
+def test_param_cap_is_rejected_with_400():
+    classes = {"aggregate": make_class(limits={"days": 365}), "cheap": make_class(), "training": make_class()}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=make_app(asyncio.Event(), classes))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/api/analytics/dashboard?days=1000")
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 400
+    assert response.json()["detail"] == "days must be between 1 and 365"
+
+
+def test_shed_response_carries_cors_headers(monkeypatch):
+    from src.main import app
+    monkeypatch.setenv("ADMISSION_AGGREGATE_CONCURRENCY", "0")
+    monkeypatch.setenv("ADMISSION_AGGREGATE_QUEUE_SIZE", "0")
+    # The middleware stack, and the cost classes with it, is built on first use
+    monkeypatch.setattr(app, "middleware_stack", None)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/api/analytics/dashboard", headers={"Origin": "https://shop.example"})
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 503
+    assert response.headers["Access-Control-Allow-Origin"] == "*"
+    assert response.headers["Retry-After"] == "5"
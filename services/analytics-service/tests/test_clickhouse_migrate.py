@@ -0,0 +1,88 @@
+import pytest
+
+
+from src.storage.clickhouse_client import TABLE_SCHEMAS
+
+MONTHLY = 'toYYYYMM(timestamp)'
+
+
+def engines(**tables):
+    """system.tables answers; a table maps to its engine or (engine, partition_key[, sorting_key])"""
+    def answer(query, params):
+        table = tables.get(params['table'])
+        if table is None:
+            return []
+        table = table if isinstance(table, tuple) else (table, MONTHLY)
+        if len(table) == 2:
+            table += (', '.join(TABLE_SCHEMAS[params['table']][1]),)
+        return [table]
+    return answer
+
+
+def test_migrate_rebuilds_plain_merge_tree_tables(clickhouse):
+    clickhouse.results += [
+        ("SELECT engine, partition_key, sorting_key FROM system.tables", engines(order_events='MergeTree', order_items_analytics='ReplacingMergeTree')),
+        ("SELECT count() FROM order_events", [(42,)]),
+    ]
+
+    assert clickhouse.migrate() == ['order_events']
+
+    queries = [query for query, _, _ in clickhouse.queries]
+    copy = queries.index(
+        "INSERT INTO order_events_migrate SELECT * FROM order_events "
+        "ORDER BY created_at DESC LIMIT 1 BY timestamp, event_type, event_id"
+    )
+    assert queries[copy + 2] == "EXCHANGE TABLES order_events_migrate AND order_events"
+    assert queries[copy + 3] == "DROP TABLE order_events_migrate"
+    assert not any("order_items_analytics_migrate" in query for query in queries)
+
+
+def test_migration_aborts_when_rows_arrive(clickhouse):
+    counts = iter([(10,), (11,)])
+    clickhouse.results += [
+        ("SELECT engine, partition_key, sorting_key FROM system.tables", engines(order_events='MergeTree')),
+        ("SELECT count() FROM order_events", lambda query, params: [next(counts)]),
+    ]
+
+    with pytest.raises(RuntimeError, match="stop ingest"):
+        clickhouse.migrate()
+
+    queries = [query for query, _, _ in clickhouse.queries]
+    assert not any(query.startswith("EXCHANGE") for query in queries)
+    assert queries[-1] == "DROP TABLE order_events_migrate"
+
+
+def test_startup_only_reports_outdated_tables(clickhouse):
+    clickhouse.results.append(("SELECT engine, partition_key, sorting_key FROM system.tables", engines(order_events='MergeTree')))
+    assert clickhouse.outdated_table('order_events')
+    assert clickhouse.outdated_table('order_items_analytics') is None
+
+
+def test_migrate_repartitions_unpartitioned_tables(clickhouse):
+    clickhouse.results += [
+        ("SELECT engine, partition_key, sorting_key FROM system.tables", engines(
+            order_events=('ReplacingMergeTree', ''),
+            order_items_analytics='ReplacingMergeTree'
+        )),
+        ("SELECT count() FROM order_events", [(42,)]),
+    ]
+
+    assert clickhouse.migrate() == ['order_events']
+
+    queries = [query for query, _, _ in clickhouse.queries]
+    staging = next(query for query in queries if query.startswith("CREATE TABLE IF NOT EXISTS order_events_migrate"))
+    assert f"PARTITION BY {MONTHLY}" in staging
+    assert "EXCHANGE TABLES order_events_migrate AND order_events" in queries
+
+
+def test_migrate_rekeys_tables_keyed_on_event_id_alone(clickhouse):
+    clickhouse.results += [
+        ("SELECT engine, partition_key, sorting_key FROM system.tables", engines(
+            order_events=('ReplacingMergeTree', MONTHLY, 'timestamp, event_id'),
+            order_items_analytics='ReplacingMergeTree'
+        )),
+        ("SELECT count() FROM order_events", [(42,)]),
+    ]
+
+    assert 'keyed on (timestamp, event_id)' in clickhouse.outdated_table('order_events')
+    assert clickhouse.migrate() == ['order_events']
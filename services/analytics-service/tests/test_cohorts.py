@@ -0,0 +1,136 @@
+from datetime import date, datetime
+
+import pytest
+
+from src.kafka_consumer import cohorts
+from src.kafka_consumer.cohorts import CohortTracker
+from src.kafka_consumer.consumer import OrderEventConsumer
+
+# user-a joins on Monday 2026-01-05 and orders again in week 1, user-b joins
+# on the Wednesday and never comes back
+ORDERS = [
+    ('order-1', 'user-a', datetime(2026, 1, 5, 10), 10.0),
+    ('order-2', 'user-b', datetime(2026, 1, 7, 12), 5.0),
+    ('order-3', 'user-a', datetime(2026, 1, 14, 9), 20.0),
+]
+RETENTION = [(date(2026, 1, 5), 0, 2, 2, 15.0), (date(2026, 1, 5), 1, 1, 1, 20.0)]
+REPEAT_PURCHASE = [(date(2026, 1, 1), 2, 1, 3)]
+
+
+def order_event(order_id, user_id, timestamp, amount):
+    return {
+        'eventId': f'event-{order_id}',
+        'event_type': 'order.created',
+        'orderId': order_id,
+        'userId': user_id,
+        'timestamp': timestamp.isoformat(),
+        'totalAmount': amount,
+        'status': 'PENDING'
+    }
+
+
+@pytest.fixture
+def duckdb_storage(monkeypatch):
+    monkeypatch.setenv('DUCKDB_PATH', ':memory:')
+    from src.storage.duckdb_client import DuckDBClient
+    return DuckDBClient()
+
+
+def cohort_results(backend):
+    since = date(2026, 1, 1)
+    return backend.get_weekly_retention(since), backend.get_repeat_purchase(since)
+
+
+def test_replayed_orders_are_counted_once(storage):
+    consumer = OrderEventConsumer()
+    for _ in range(2):
+        # Replays that got past duplicate detection reach the cohort writes again
+        for order in ORDERS:
+            assert consumer.process_event('order.created', order_event(*order))
+        consumer.recent_events = type(consumer.recent_events)()
+
+    assert cohort_results(storage) == (RETENTION, REPEAT_PURCHASE)
+
+
+def test_tracker_batches_lookups_and_writes(storage, monkeypatch):
+    lookups = []
+    get_first_orders = storage.get_first_orders
+    monkeypatch.setattr(storage, 'get_first_orders', lambda user_ids: lookups.append(set(user_ids)) or get_first_orders(user_ids))
+    tracker = CohortTracker()
+
+    # Newest first: the batch is still attributed to the oldest order
+    tracker.record_orders(list(reversed(ORDERS)))
+    tracker.record_orders(ORDERS[:1])
+
+    assert lookups == [{'user-a', 'user-b'}]
+    assert storage.get_first_orders(['user-a', 'user-b']) == {'user-a': ORDERS[0][2], 'user-b': ORDERS[1][2]}
+    assert cohort_results(storage) == (RETENTION, REPEAT_PURCHASE)
+
+
+def test_duckdb_cohorts_are_idempotent_and_match_a_rebuild(duckdb_storage, monkeypatch):
+    monkeypatch.setattr(cohorts, 'storage', duckdb_storage)
+    duckdb_storage.insert_order_batch([order_event(*order) for order in ORDERS])
+    tracker = CohortTracker()
+    tracker.record_orders(ORDERS)
+    CohortTracker().record_orders(ORDERS)
+
+    assert cohort_results(duckdb_storage) == (RETENTION, REPEAT_PURCHASE)
+    for _ in range(2):
+        duckdb_storage.rebuild_cohorts()
+        assert cohort_results(duckdb_storage) == (RETENTION, REPEAT_PURCHASE)
+    assert not duckdb_storage.run_query("SELECT table_name FROM duckdb_tables() WHERE table_name LIKE '%_rebuild'")
+
+
+def test_duckdb_failed_cohort_write_leaves_no_trace(duckdb_storage, monkeypatch):
+    insert_columns = duckdb_storage.insert_columns
+
+    def failing_insert(table, data, **kwargs):
+        if table == 'cohort_monthly_customers':
+            raise RuntimeError("insert failed")
+        return insert_columns(table, data, **kwargs)
+
+    rows = [(order_id, user_id, ORDERS[0][2], timestamp, amount) for order_id, user_id, timestamp, amount in ORDERS]
+    monkeypatch.setattr(duckdb_storage, 'insert_columns', failing_insert)
+    with pytest.raises(RuntimeError):
+        duckdb_storage.record_cohort_orders(rows)
+    monkeypatch.setattr(duckdb_storage, 'insert_columns', insert_columns)
+
+    # The rolled back orders are not taken for recorded ones
+    assert duckdb_storage.run_query("SELECT count(*) FROM cohort_orders") == [(0,)]
+    duckdb_storage.record_cohort_orders(rows)
+    assert duckdb_storage.run_query("SELECT sum(orders) FROM cohort_monthly_customers") == [(3,)]
+
+
+def test_clickhouse_records_only_new_orders(clickhouse):
+    clickhouse.results.append(("FROM cohort_orders WHERE order_id IN", [('order-1',)]))
+    rows = [(order_id, user_id, ORDERS[0][2], timestamp, amount) for order_id, user_id, timestamp, amount in ORDERS]
+
+    clickhouse.record_cohort_orders(rows + rows[1:2])
+
+    lookup, insert = clickhouse.queries
+    assert sorted(lookup[1]['order_ids']) == ['order-1', 'order-2', 'order-3']
+    assert insert[0].startswith("INSERT INTO cohort_orders")
+    assert insert[1] == rows[1:]
+
+
+def test_clickhouse_rebuild_swaps_staging_tables(clickhouse):
+    started = datetime(2026, 2, 1, 12)
+    clickhouse.results.append(("SELECT now()", [(started,)]))
+
+    clickhouse.rebuild_cohorts()
+
+    queries = [query for query, _, _ in clickhouse.queries]
+    assert not any(query.startswith(("TRUNCATE", "EXCHANGE")) for query in queries)
+    swaps = [query for query in queries if "REPLACE PARTITION" in query]
+    assert swaps == [
+        f"ALTER TABLE {table} REPLACE PARTITION ID 'all' FROM {table}_rebuild"
+        for table in ('user_first_orders', 'cohort_orders', 'cohort_weekly_activity', 'cohort_monthly_customers')
+    ]
+    # Staging tables are filled before the first swap, orders stored since the
+    # start are recorded again after the last one
+    first_swap, last_swap = queries.index(swaps[0]), queries.index(swaps[-1])
+    assert not any(query.startswith("INSERT INTO") and "_rebuild" in query.split()[2] for query in queries[first_swap:])
+    catch_up = [(query, params) for query, params, _ in clickhouse.queries[last_swap:] if query.startswith("INSERT")]
+    assert [query.split()[2] for query, _ in catch_up] == ['user_first_orders', 'cohort_orders']
+    assert all(params == {'started': started} for _, params in catch_up)
+    assert "NOT IN (SELECT order_id FROM cohort_orders)" in catch_up[1][0]
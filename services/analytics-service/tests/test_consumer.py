@@ -0,0 +1,165 @@
+from datetime import datetime, timedelta
+
+from benchmarks.fakes import FakeKafkaConsumer
+from src.kafka_consumer.consumer import OrderEventConsumer
+from src.kafka_consumer.dedup import RecentEventFilter
+
+
+def order_event(index, minutes_ago=10):
+    timestamp = datetime.utcnow().replace(microsecond=0) - timedelta(minutes=minutes_ago) + timedelta(seconds=index)
+    return {
+        'eventId': f'event-{index}',
+        'orderId': f'order-{index}',
+        'userId': f'user-{index % 2}',
+        'timestamp': timestamp.isoformat(),
+        'totalAmount': 10,
+        'status': 'PENDING',
+        'items': [{'product_id': 'product-1', 'product_name': 'Product 1', 'quantity': 1, 'price': 10, 'subtotal': 10}]
+    }
+
+
+def make_consumer(events, partitions=1, max_polls=10):
+    consumer = OrderEventConsumer()
+    consumer.retry_backoff = 0
+    consumer.consumer = FakeKafkaConsumer(events, partitions=partitions, on_exhausted=consumer.stop)
+    consumer.consumer.close = lambda: None
+    consumer.commits = []
+
+    poll, commit = consumer.consumer.poll, consumer.consumer.commit
+    polls = []
+
+    def limited_poll(**kwargs):
+        polls.append(1)
+        if len(polls) > max_polls:
+            consumer.stop()
+            return {}
+        return poll(**kwargs)
+
+    def recorded_commit(offsets=None):
+        commit(offsets)
+        consumer.commits.append({p.partition: offset for p, offset in consumer.consumer.committed.items()})
+
+    consumer.consumer.poll = limited_poll
+    consumer.consumer.commit = recorded_commit
+    return consumer
+
+
+def fail_event(storage, monkeypatch, event_id, times=None):
+    """Make inserts of any batch containing ``event_id`` fail, ``times`` times or forever"""
+    insert = storage.insert_order_batch
+    failures = []
+
+    def failing_insert(events):
+        if any(event.get('eventId') == event_id for event in events):
+            if times is None or len(failures) < times:
+                failures.append(event_id)
+                raise RuntimeError("insert failed")
+        insert(events)
+
+    monkeypatch.setattr(storage, 'insert_order_batch', failing_insert)
+
+
+def stored_ids(storage):
+    return sorted(row[0] for row in storage.events)
+
+
+def test_failed_insert_is_not_committed(storage, monkeypatch):
+    events = [('order.created', order_event(index)) for index in range(6)]
+    fail_event(storage, monkeypatch, 'event-3')
+    consumer = make_consumer(events, max_polls=3)
+    consumer.start()
+
+    assert stored_ids(storage) == ['event-0', 'event-1', 'event-2']
+    # Never committed past the failed event, which is polled again each time
+    assert all(commit[0] == 3 for commit in consumer.commits)
+    assert consumer.consumer.committed[next(iter(consumer.consumer.committed))] == 3
+
+
+def test_failed_event_is_retried(storage, monkeypatch):
+    events = [('order.created', order_event(index)) for index in range(6)]
+    # The batch insert and the single retry fail, the replay succeeds
+    fail_event(storage, monkeypatch, 'event-3', times=2)
+    consumer = make_consumer(events)
+    consumer.start()
+
+    assert stored_ids(storage) == [f'event-{index}' for index in range(6)]
+    assert consumer.commits == [{0: 3}, {0: 6}]
+
+
+def test_failure_only_holds_back_its_partition(storage, monkeypatch):
+    events = [('order.created', order_event(index)) for index in range(6)]
+    # Partition 0 holds events 0, 2 and 4, partition 1 holds 1, 3 and 5
+    fail_event(storage, monkeypatch, 'event-2')
+    consumer = make_consumer(events, partitions=2, max_polls=2)
+    consumer.start()
+
+    assert consumer.commits[0] == {0: 1, 1: 3}
+    assert 'event-5' in stored_ids(storage)
+    assert 'event-4' not in stored_ids(storage)
+
+
+def test_replayed_batch_is_not_stored_twice(storage):
+    events = [('order.created', order_event(index)) for index in range(5)]
+    make_consumer([(topic, dict(event)) for topic, event in events]).start()
+
+    # A new consumer seeds its filter from storage, a redelivery adds duplicates
+    replay = [(topic, dict(event)) for topic, event in events + events[:2]] + [('order.created', order_event(5))]
+    make_consumer(replay).start()
+
+    assert stored_ids(storage) == [f'event-{index}' for index in range(6)]
+    assert storage.get_total_metrics()[0] == 6
+
+
+def status_event(index, status):
+    event = {**order_event(index), 'status': status}
+    del event['items']
+    return event
+
+
+def test_status_events_sharing_the_order_id_are_stored(storage):
+    # order-service sends the order id as eventId for every event of an order
+    make_consumer([
+        ('order.created', order_event(1)),
+        ('order.confirmed', status_event(1, 'CONFIRMED')),
+        ('order.confirmed', status_event(1, 'CONFIRMED')),
+    ]).start()
+    make_consumer([
+        ('order.confirmed', status_event(1, 'CONFIRMED')),
+        ('order.shipped', status_event(1, 'SHIPPED')),
+    ]).start()
+
+    assert sorted(row[3] for row in storage.events) == ['order.confirmed', 'order.created', 'order.shipped']
+    assert storage.get_order_status_distribution() == [('SHIPPED', 1)]
+
+
+def test_duplicate_lookup_only_for_unsure_events(storage, monkeypatch):
+    lookups = []
+    existing_event_ids = storage.existing_event_ids
+    monkeypatch.setattr(storage, 'existing_event_ids', lambda keys: lookups.append(keys) or existing_event_ids(keys))
+
+    consumer = make_consumer([('order.created', order_event(index)) for index in range(3)])
+    consumer.start()
+    # The filter covers recent events it has never seen, so no lookup was needed
+    assert lookups == []
+
+    old = order_event(9, minutes_ago=3 * 24 * 60)
+    make_consumer([('order.created', old)]).start()
+    assert [key for key, _ in lookups[0]] == [('order.created', 'event-9')]
+
+
+def test_filter_horizon_and_rotation():
+    recent = RecentEventFilter(capacity=2, error_rate=0.01)
+    horizon = datetime(2026, 1, 1)
+    recent.seed([('order.created', 'a', datetime(2026, 1, 2))], horizon)
+
+    assert ('order.created', 'a') in recent
+    assert ('order.confirmed', 'a') not in recent
+    assert recent.covers(datetime(2026, 1, 3))
+    assert not recent.covers(horizon)
+
+    for index, event_id in enumerate(['b', 'c', 'd', 'e']):
+        recent.add(('order.created', event_id), datetime(2026, 1, 3 + index))
+    # Dropping the generation holding 'a' and 'b' moves the horizon past them
+    assert recent.horizon == datetime(2026, 1, 3)
+    assert not recent.covers(datetime(2026, 1, 3))
+    assert ('order.created', 'e') in recent
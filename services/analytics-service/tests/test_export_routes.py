@@ -0,0 +1,107 @@
+import csv
+import io
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from src.api import export_routes
+from src.api.export_routes import decode_token, encode_token, router
+
+KEY_COLUMNS = ("timestamp", "event_id", "event_type")
+
+
+def make_client():
+    app = FastAPI()
+    app.include_router(router, prefix="/api/analytics/export")
+    return TestClient(app)
+
+
+def store_events(storage, count):
+    for index in range(count):
+        storage.insert_order_event({
+            'eventId': f'event-{index}',
+            'orderId': f'order-{index}',
+            'userId': 'user-1',
+            'event_type': 'order.created',
+            'timestamp': f'2026-01-05T10:00:{index:02d}Z',
+            'totalAmount': 10,
+            'status': 'PENDING'
+        })
+
+
+def test_token_round_trip():
+    values = [datetime(2026, 1, 5, 10, 0, 1), "event-1", "order.created"]
+    assert decode_token(encode_token(values), KEY_COLUMNS) == tuple(values)
+
+
+@pytest.mark.parametrize("values", [
+    ["not a date", "event-1", "order.created"],
+    [12345, "event-1", "order.created"],
+    [None, "event-1", "order.created"],
+    ["2026-01-05T10:00:01", "event-1"],
+    {"timestamp": "2026-01-05T10:00:01"},
+])
+def test_malformed_token_is_rejected(values):
+    with pytest.raises(HTTPException) as error:
+        decode_token(encode_token(values), KEY_COLUMNS)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize("token", ["%%%", "bm90IGpzb24=", "é"])
+def test_undecodable_token_is_rejected(token):
+    with pytest.raises(HTTPException) as error:
+        decode_token(token, KEY_COLUMNS)
+    assert error.value.status_code == 400
+
+
+def test_bad_token_is_a_client_error(storage):
+    response = make_client().get(
+        "/api/analytics/export/order-events",
+        params={"start": "2026-01-01", "after": encode_token([1, "event-1"])}
+    )
+    assert response.status_code == 400
+
+
+def test_csv_pages_carry_the_token_in_a_header(storage):
+    store_events(storage, 5)
+    client = make_client()
+    params = {"start": "2026-01-01", "end": "2026-01-31", "format": "csv", "limit": 3}
+
+    first = client.get("/api/analytics/export/order-events", params=params)
+    assert first.status_code == 200
+    rows = list(csv.reader(io.StringIO(first.text)))
+    assert rows[0][0] == "event_id"
+    assert [row[0] for row in rows[1:]] == ["event-0", "event-1", "event-2"]
+    assert "X-Next-Token" in first.headers
+
+    second = client.get(
+        "/api/analytics/export/order-events",
+        params={**params, "after": first.headers["X-Next-Token"]}
+    )
+    rows = list(csv.reader(io.StringIO(second.text)))
+    assert [row[0] for row in rows[1:]] == ["event-3", "event-4"]
+    assert "X-Next-Token" not in second.headers
+
+
+def test_csv_page_size_is_capped(storage, monkeypatch):
+    monkeypatch.setattr(export_routes, "CSV_MAX_PAGE_ROWS", 2)
+    client = make_client()
+    params = {"start": "2026-01-01", "end": "2026-01-31", "limit": 3}
+
+    response = client.get("/api/analytics/export/order-events", params={**params, "format": "csv"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "limit must be at most 2 for paged CSV"
+    # Streamed NDJSON pages are not buffered, so they keep the larger limit
+    assert client.get("/api/analytics/export/order-events", params=params).status_code == 200
+
+
+def test_ndjson_pages_end_with_the_token(storage):
+    store_events(storage, 3)
+    response = make_client().get(
+        "/api/analytics/export/order-events",
+        params={"start": "2026-01-01", "end": "2026-01-31", "limit": 3}
+    )
+    assert response.status_code == 200
+    assert response.text.splitlines()[-1].startswith('{"next_token":')
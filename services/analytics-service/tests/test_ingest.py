@@ -0,0 +1,113 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.api import routes
+
+
+@pytest.fixture
+def duckdb_storage(monkeypatch):
+    pytest.importorskip("duckdb")
+    monkeypatch.setenv("DUCKDB_PATH", ":memory:")
+    from src.storage.duckdb_client import DuckDBClient
+    return DuckDBClient()
+
+
+def order(index, items=2):
+    return {
+        'eventId': f'event-{index}',
+        'orderId': f'order-{index}',
+        'userId': f'user-{index % 3}',
+        'event_type': 'order.created',
+        'timestamp': f'2026-01-05T10:00:{index:02d}Z',
+        'totalAmount': 30,
+        'status': None,
+        'items': [
+            {'product_id': f'product-{n}', 'product_name': f'Product {n}', 'quantity': 1, 'price': 15, 'subtotal': 15}
+            for n in range(items)
+        ]
+    }
+
+
+def test_duckdb_batch_insert_is_idempotent(duckdb_storage):
+    batch = [order(index) for index in range(5)]
+    duckdb_storage.insert_order_batch(batch)
+    duckdb_storage.insert_order_batch(batch[2:] + [order(5)])
+
+    assert duckdb_storage.run_query("SELECT count(*) FROM order_events") == [(6,)]
+    assert duckdb_storage.run_query("SELECT count(*) FROM order_items_analytics") == [(12,)]
+    assert duckdb_storage.get_total_metrics()[0] == 6
+
+
+def test_duckdb_batch_matches_single_inserts(duckdb_storage):
+    confirmed = {**order(1), 'eventId': 'event-1-confirmed', 'event_type': 'order.confirmed', 'status': 'CONFIRMED'}
+    del confirmed['items']
+    duckdb_storage.insert_order_batch([order(1), confirmed])
+
+    rows = duckdb_storage.run_query("SELECT event_id, event_type, status FROM order_events ORDER BY event_id")
+    assert rows == [('event-1', 'order.created', None), ('event-1-confirmed', 'order.confirmed', 'CONFIRMED')]
+    assert duckdb_storage.ping()
+
+
+def test_duckdb_keeps_status_events_sharing_the_event_id(duckdb_storage):
+    confirmed = {**order(1), 'event_type': 'order.confirmed', 'status': 'CONFIRMED'}
+    del confirmed['items']
+    duckdb_storage.insert_order_batch([order(1)])
+    duckdb_storage.insert_order_batch([confirmed])
+    duckdb_storage.insert_order_batch([confirmed])
+
+    assert duckdb_storage.run_query("SELECT event_type FROM order_events ORDER BY event_type") == [
+        ('order.confirmed',), ('order.created',)
+    ]
+    assert duckdb_storage.get_order_status_distribution() == [('CONFIRMED', 1)]
+    timestamp = duckdb_storage.parse_timestamp(order(1)['timestamp'])
+    keys = [((event_type, 'event-1'), timestamp) for event_type in ('order.created', 'order.shipped')]
+    assert duckdb_storage.existing_event_ids(keys) == {('order.created', 'event-1')}
+
+
+def test_duckdb_rekeys_order_events_from_older_releases(duckdb_storage):
+    duckdb_storage.run_query("DROP TABLE order_events")
+    duckdb_storage.run_query("""
+        CREATE TABLE order_events (
+            event_id VARCHAR PRIMARY KEY, order_id VARCHAR, user_id VARCHAR, event_type VARCHAR,
+            timestamp TIMESTAMP, total_amount DOUBLE, status VARCHAR,
+            created_at TIMESTAMP DEFAULT current_timestamp
+        )
+    """)
+    duckdb_storage.insert_order_batch([order(1)])
+
+    duckdb_storage.ensure_event_key()
+
+    key = [row[1] for row in duckdb_storage.run_query("PRAGMA table_info('order_events')") if row[5]]
+    assert sorted(key) == ['event_id', 'event_type']
+    assert duckdb_storage.run_query("SELECT event_id, event_type FROM order_events") == [('event-1', 'order.created')]
+
+
+def test_clickhouse_tokens_tell_event_types_apart(clickhouse):
+    confirmed = {**order(1), 'event_type': 'order.confirmed', 'status': 'CONFIRMED'}
+    del confirmed['items']
+    clickhouse.insert_order_batch([{**order(1), 'items': []}])
+    clickhouse.insert_order_batch([confirmed])
+
+    tokens = [settings['insert_deduplication_token'] for query, _, settings in clickhouse.queries
+              if query.startswith("INSERT INTO order_events")]
+    assert len(set(tokens)) == 2
+
+
+def make_client():
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/analytics")
+    return TestClient(app)
+
+
+def test_health_reports_storage(storage):
+    response = make_client().get("/api/analytics/health")
+    assert response.status_code == 200
+    assert response.json()["data"]["database"] == "connected"
+
+
+def test_health_fails_when_storage_is_down(storage, monkeypatch):
+    monkeypatch.setattr(storage, "ping", lambda: False)
+    response = make_client().get("/api/analytics/health")
+    assert response.status_code == 503
+    assert response.json()["data"]["database"] == "disconnected"
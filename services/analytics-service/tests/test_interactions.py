@@ -0,0 +1,95 @@
+import pytest
+import redis
+
+from src.ai.interactions import MemoryInteractionStore, RedisInteractionStore
+
+ITEMS = [{'product_id': 'product-1', 'quantity': 2}, {'product_id': 'product-2', 'quantity': 1}]
+
+
+def test_memory_store_adds_each_order_once():
+    store = MemoryInteractionStore(ttl=60)
+    store.record_order('user-1', 'order-1', ITEMS)
+    store.record_order('user-1', 'order-1', ITEMS)
+    store.record_order('user-1', 'order-2', ITEMS[:1])
+
+    assert store.get('user-1') == {'product-1': 4.0, 'product-2': 1.0}
+
+
+def test_memory_store_bounds_remembered_orders():
+    store = MemoryInteractionStore(ttl=60, max_orders=2)
+    for order_id in ('order-1', 'order-2', 'order-3'):
+        store.record_order('user-1', order_id, ITEMS[:1])
+
+    assert list(store.orders) == ['order-2', 'order-3']
+    assert store.get('user-1') == {'product-1': 6.0}
+
+
+class ScriptRecorder:
+    """Redis client stand-in recording script calls; raises while ``down``"""
+
+    def __init__(self):
+        self.calls = []
+        self.down = False
+
+    def register_script(self, script):
+        def run(keys, args):
+            if self.down:
+                raise redis.ConnectionError("Connection refused")
+            self.calls.append((keys, args))
+            return 1
+        return run
+
+    def hgetall(self, key):
+        if self.down:
+            raise redis.ConnectionError("Connection refused")
+        return {b'product-1': b'2'}
+
+
+def make_redis_store(client, retry_seconds=60):
+    return RedisInteractionStore(client, ttl=3600, fallback=MemoryInteractionStore(ttl=3600), retry_seconds=retry_seconds)
+
+
+def test_redis_store_guards_each_order_in_the_script():
+    client = ScriptRecorder()
+    make_redis_store(client).record_order('user-1', 'order-1', ITEMS)
+
+    assert client.calls == [(
+        ['analytics:interactions:user-1', 'analytics:interaction-orders:order-1'],
+        [3600, 'product-1', 2.0, 'product-2', 1.0]
+    )]
+
+
+def test_redis_outage_falls_back_per_call():
+    client = ScriptRecorder()
+    client.down = True
+    store = make_redis_store(client)
+
+    store.record_order('user-1', 'order-1', ITEMS)
+    assert store.get('user-1') == {'product-1': 2.0, 'product-2': 1.0}
+    assert not client.calls
+
+    # Redis is skipped until the retry window has passed
+    client.down = False
+    assert store.get('user-1') == {'product-1': 2.0, 'product-2': 1.0}
+    store.retry_at = 0.0
+    assert store.get('user-1') == {'product-1': 2.0}
+
+
+def test_redis_is_retried_after_a_startup_outage():
+    client = ScriptRecorder()
+    client.down = True
+    store = make_redis_store(client, retry_seconds=0)
+    store.record_order('user-1', 'order-1', ITEMS)
+
+    client.down = False
+    store.record_order('user-2', 'order-2', ITEMS)
+    assert [keys[1] for keys, _ in client.calls] == ['analytics:interaction-orders:order-2']
+
+
+def test_errors_outside_redis_are_not_hidden_by_the_fallback():
+    client = ScriptRecorder()
+    store = make_redis_store(client)
+
+    with pytest.raises(TypeError):
+        store.record_order('user-1', 'order-1', [{'product_id': 'product-1', 'quantity': None}])
+    assert store.available()
@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from src.api.admission import AdmissionMiddleware, CostClass
+from src.api.middleware import MetricsMiddleware
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def request_count(route, status):
+    return REGISTRY.get_sample_value(
+        "analytics_http_request_duration_seconds_count",
+        {"method": "GET", "route": route, "status": status}
+    ) or 0
+
+
+def test_rejected_requests_are_labelled_with_their_route():
+    app = FastAPI()
+
+    @app.get("/api/analytics/cohorts")
+    async def cohorts(weeks: int = 12):
+        return {"weeks": weeks}
+
+    classes = {
+        name: CostClass(name, concurrency=1, queue_size=1, queue_timeout_ms=1000, retry_after=1, limits={"weeks": 104})
+        for name in ("aggregate", "cheap", "training")
+    }
+    app.add_middleware(AdmissionMiddleware, classes=classes)
+    app.add_middleware(MetricsMiddleware)
+    rejected = request_count("/api/analytics/cohorts", "400")
+    unmatched = request_count("unmatched", "404")
+
+    client = TestClient(app)
+    assert client.get("/api/analytics/cohorts?weeks=500").status_code == 400
+    assert client.get("/no/such/route").status_code == 404
+
+    assert request_count("/api/analytics/cohorts", "400") == rejected + 1
+    assert request_count("unmatched", "404") == unmatched + 1
+
+
+def run_worker(code, multiproc_dir):
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(multiproc_dir)}
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=SERVICE_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def test_metrics_cover_every_worker(tmp_path):
+    # Each process stands for one uvicorn worker sharing the directory
+    for _ in range(2):
+        run_worker(
+            "from src.utils.metrics import ADMISSION_SHED, RECOMMENDER_MODEL_ENTITIES, mark_process_dead\n"
+            "ADMISSION_SHED.labels('aggregate', 'queue_full').inc()\n"
+            "RECOMMENDER_MODEL_ENTITIES.labels('users').set(40)\n"
+            "mark_process_dead()\n",
+            tmp_path
+        )
+
+    exposition = run_worker("from src.utils.metrics import generate_metrics\nprint(generate_metrics().decode())", tmp_path)
+    assert 'analytics_admission_shed_total{cost_class="aggregate",reason="queue_full"} 2.0' in exposition
+    # Workers that shut down no longer report live gauges
+    assert 'analytics_recommender_model_entities{entity="users"}' not in exposition
@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ai.model_store import ModelStore
+from src.ai.recommender import ProductRecommender
+
+
+def publish_in_child(root, queue):
+    generation = ModelStore(root).publish({'weights': np.arange(6, dtype=np.float32).reshape(2, 3)})
+    queue.put(generation)
+
+
+def model_arrays(value):
+    return {
+        'user_ids': np.array(['user-1'], dtype=str),
+        'product_ids': np.array(['product-1', 'product-2'], dtype=str),
+        'product_names': np.array(['One', 'Two'], dtype=str),
+        'user_item': np.full((1, 2), value, dtype=np.float32),
+        'similarity': np.full((2, 2), value, dtype=np.float32),
+    }
+
+
+def generations(store):
+    return sorted(name for name in os.listdir(store.root) if not name.startswith(('CURRENT', 'train.lock')))
+
+
+def test_generation_published_by_another_process_is_mapped(tmp_path):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    child = context.Process(target=publish_in_child, args=(str(tmp_path), queue))
+    child.start()
+    generation = queue.get(timeout=30)
+    child.join(timeout=30)
+    assert child.exitcode == 0
+
+    store = ModelStore(str(tmp_path))
+    assert store.current_generation() == generation
+    weights = store.load(generation)['weights']
+    assert isinstance(weights, np.memmap)
+    assert not weights.flags.writeable
+    assert weights.tolist() == [[0, 1, 2], [3, 4, 5]]
+
+
+def test_reader_keeps_its_mapping_across_swaps(tmp_path):
+    store = ModelStore(str(tmp_path))
+    reader = ProductRecommender(store)
+    reader.refresh_interval = 0
+    reader.attach(store.publish(model_arrays(1.0)))
+    held = reader.model['similarity']
+
+    # Two newer generations remove the one the reader still maps
+    store.publish(model_arrays(2.0))
+    latest = store.publish(model_arrays(3.0))
+    assert not os.path.exists(tmp_path / reader.generation)
+    assert held.tolist() == [[1.0, 1.0], [1.0, 1.0]]
+
+    reader.refresh()
+    assert reader.generation == latest
+    assert reader.model['similarity'].tolist() == [[3.0, 3.0], [3.0, 3.0]]
+    assert held.tolist() == [[1.0, 1.0], [1.0, 1.0]]
+
+
+def test_stale_generations_and_failed_publishes_are_removed(tmp_path):
+    store = ModelStore(str(tmp_path))
+    published = [store.publish(model_arrays(value)) for value in (1.0, 2.0, 3.0)]
+
+    assert generations(store) == published[1:]
+    assert store.current_generation() == published[-1]
+
+    with pytest.raises(ValueError):
+        store.publish({'broken': np.array([object()])})
+    # Neither the staging directory nor the pointer is left behind
+    assert generations(store) == published[1:]
+    assert store.current_generation() == published[-1]
+
+
+def order_items(seed=7, users=40, products=25, orders=300):
+    """Random baskets with integer quantities, as returned by storage"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for order in range(orders):
+        user = f"user-{rng.integers(users)}"
+        for product in rng.choice(products, size=rng.integers(1, 5), replace=False):
+            quantity = int(rng.integers(1, 4))
+            rows.append((f"order-{order}", user, f"product-{product:02d}", f"Product {product}", quantity, quantity * 9.5))
+    return pd.DataFrame(rows, columns=['order_id', 'user_id', 'product_id', 'product_name', 'quantity', 'subtotal'])
+
+
+def pandas_recommendations(user_item_matrix, product_similarity, user_id, n):
+    """The DataFrame scoring the shared-model recommender replaced"""
+    user_items = user_item_matrix.loc[user_id]
+    purchased = user_items[user_items > 0].index.tolist()
+    scores = {}
+    for product in product_similarity.index:
+        if product not in purchased:
+            scores[product] = sum(product_similarity.loc[product, p] * user_items[p] for p in purchased)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:n]
+
+
+def test_numpy_scoring_ranks_like_the_pandas_model(tmp_path):
+    df = order_items()
+    recommender = ProductRecommender(ModelStore(str(tmp_path)))
+    user_item_matrix = recommender.build_user_item_matrix(df)
+    product_similarity = recommender.calculate_product_similarity(df)
+    names = df.drop_duplicates('product_id').set_index('product_id')['product_name']
+    recommender.attach(recommender.store.publish(recommender.to_arrays(user_item_matrix, product_similarity, names)))
+
+    for user_id in user_item_matrix.index:
+        expected = pandas_recommendations(user_item_matrix, product_similarity, user_id, 5)
+        actual = recommender.get_user_recommendations(user_id, 5)
+        assert [item['product_id'] for item in actual] == [product for product, _ in expected]
+        assert [item['score'] for item in actual] == pytest.approx([score for _, score in expected], rel=1e-5)
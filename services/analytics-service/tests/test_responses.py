@@ -0,0 +1,103 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import pyarrow as pa
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from src.api import responses, routes
+from src.api.responses import ARROW_MEDIA_TYPE, COLUMNS_MEDIA_TYPE, JSON_MEDIA_TYPE, dumps, negotiate
+
+ITEMS = [
+    {'product_id': 'product-1', 'product_name': 'Keyboard', 'quantity': 2, 'subtotal': 100.0},
+    {'product_id': 'product-2', 'product_name': 'Mouse', 'quantity': 1, 'subtotal': 25.5},
+]
+
+
+def request_accepting(accept=None):
+    headers = [(b"accept", accept.encode("latin-1"))] if accept is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+@pytest.mark.parametrize("accept, media_type", [
+    (None, JSON_MEDIA_TYPE),
+    ("*/*", JSON_MEDIA_TYPE),
+    ("application/json", JSON_MEDIA_TYPE),
+    (COLUMNS_MEDIA_TYPE, COLUMNS_MEDIA_TYPE),
+    (ARROW_MEDIA_TYPE, ARROW_MEDIA_TYPE),
+    ("Application/Vnd.Apache.Arrow.Stream", ARROW_MEDIA_TYPE),
+    # Highest quality wins, ties go to the type listed first
+    (f"application/json;q=0.5, {ARROW_MEDIA_TYPE}", ARROW_MEDIA_TYPE),
+    (f"{ARROW_MEDIA_TYPE};q=0.2, {COLUMNS_MEDIA_TYPE};q=0.8", COLUMNS_MEDIA_TYPE),
+    (f"{COLUMNS_MEDIA_TYPE};q=0.7, {ARROW_MEDIA_TYPE} ; q=0.7", COLUMNS_MEDIA_TYPE),
+    # q=0 and unparsable qualities mean "not acceptable"
+    (f"{ARROW_MEDIA_TYPE};q=0, {COLUMNS_MEDIA_TYPE};q=0.1", COLUMNS_MEDIA_TYPE),
+    (f"{ARROW_MEDIA_TYPE};q=high", JSON_MEDIA_TYPE),
+])
+def test_accept_negotiation(accept, media_type):
+    assert negotiate(request_accepting(accept)) == media_type
+
+
+@pytest.mark.parametrize("accept", ["text/html", "application/xml;q=0.9, text/plain", f"{COLUMNS_MEDIA_TYPE};q=0"])
+def test_unacceptable_types_fall_back_to_json_instead_of_406(accept):
+    assert negotiate(request_accepting(accept)) == JSON_MEDIA_TYPE
+
+
+def test_arrow_is_skipped_where_unavailable(monkeypatch):
+    accept = f"{ARROW_MEDIA_TYPE}, {COLUMNS_MEDIA_TYPE};q=0.5"
+    assert negotiate(request_accepting(accept), allow_arrow=False) == COLUMNS_MEDIA_TYPE
+    assert negotiate(request_accepting(ARROW_MEDIA_TYPE), allow_arrow=False) == JSON_MEDIA_TYPE
+
+    monkeypatch.setattr(responses, "pa", None)
+    assert negotiate(request_accepting(accept)) == COLUMNS_MEDIA_TYPE
+
+
+def test_orjson_and_stdlib_encoders_agree(monkeypatch):
+    content = {
+        "revenue": Decimal("19.99"),
+        "day": date(2026, 1, 5),
+        "at": datetime(2026, 1, 5, 10, 30),
+        "by_week": {0: 2, 1: 1},
+        "names": ["Keyboard", "Mouse"],
+    }
+    fast = dumps(content)
+    monkeypatch.setattr(responses, "orjson", None)
+    assert json.loads(fast) == json.loads(dumps(content))
+    assert json.loads(fast) == {
+        "revenue": 19.99,
+        "day": "2026-01-05",
+        "at": "2026-01-05T10:30:00",
+        "by_week": {"0": 2, "1": 1},
+        "names": ["Keyboard", "Mouse"],
+    }
+    with pytest.raises(TypeError):
+        dumps({"unsupported": object()})
+
+
+def get_top_products(accept):
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/analytics")
+    response = TestClient(app).get("/api/analytics/products/top-selling", headers={"Accept": accept})
+    assert response.status_code == 200
+    assert response.headers["Vary"] == "Accept"
+    return response
+
+
+def test_arrow_stream_round_trips_to_the_json_body(storage):
+    storage.insert_order_items('order-1', ITEMS, '2026-01-05T10:00:00Z')
+    storage.insert_order_items('order-2', ITEMS[:1], '2026-01-05T11:00:00Z')
+
+    rows = get_top_products(JSON_MEDIA_TYPE).json()["data"]
+    columns = get_top_products(COLUMNS_MEDIA_TYPE).json()["data"]
+    arrow = get_top_products(ARROW_MEDIA_TYPE)
+    assert arrow.headers["Content-Type"] == ARROW_MEDIA_TYPE
+    table = pa.ipc.open_stream(arrow.content).read_all()
+
+    assert table.column_names == list(rows["products"][0])
+    assert table.to_pylist() == rows["products"]
+    assert table.to_pydict() == columns["products"]
+    # Scalar fields travel as schema metadata
+    assert json.loads(table.schema.metadata[b"limit"]) == rows["limit"] == columns["limit"] == 10
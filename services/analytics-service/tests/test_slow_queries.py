@@ -0,0 +1,51 @@
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.api import routes
+from src.utils.slow_query_log import SlowQueryLog
+
+STATS = {'endpoint': '/api/analytics/dashboard', 'elapsed_ms': 900.0, 'rows_read': 10, 'bytes_read': 80}
+
+
+def make_client():
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/analytics")
+    return TestClient(app)
+
+
+def test_explain_runs_off_the_calling_thread():
+    log = SlowQueryLog(threshold_ms=0, capacity=10)
+    threads = []
+
+    def explain():
+        threads.append(threading.current_thread())
+        return ["ReadFromMergeTree"]
+
+    log.record("SELECT 1", STATS, explain)
+    log.flush()
+
+    assert threads and threads[0] is not threading.current_thread()
+    assert log.recent()[0]["explain"] == ["ReadFromMergeTree"]
+
+
+def test_failed_or_missing_plan_leaves_the_entry():
+    log = SlowQueryLog(threshold_ms=0, capacity=10)
+    log.record("INSERT INTO t VALUES", STATS)
+    log.record("SELECT 1", STATS, lambda: None)
+    log.flush()
+
+    assert [entry["explain"] for entry in log.recent()] == [None, None]
+
+
+def test_debug_endpoint_is_disabled_by_default(monkeypatch):
+    monkeypatch.setattr(routes, "DEBUG_ENDPOINTS_ENABLED", False)
+    assert make_client().get("/api/analytics/debug/slow-queries").status_code == 404
+
+
+def test_debug_endpoint_when_enabled(monkeypatch):
+    monkeypatch.setattr(routes, "DEBUG_ENDPOINTS_ENABLED", True)
+    response = make_client().get("/api/analytics/debug/slow-queries")
+    assert response.status_code == 200
+    assert "queries" in response.json()["data"]
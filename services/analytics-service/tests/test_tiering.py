@@ -0,0 +1,91 @@
+from datetime import date, datetime
+
+ARCHIVE_BATCHES = [
+    ('order_events', datetime(2025, 4, 1), [
+        ('202503-20250901000000', date(2025, 3, 1)),
+        ('202501-20250901000000', date(2025, 1, 1)),
+        ('202502-20250901000000', date(2025, 2, 1)),
+    ]),
+]
+
+
+def archived(clickhouse):
+    clickhouse.results.append(("FROM archive_batches GROUP BY table_name", ARCHIVE_BATCHES))
+    clickhouse.tiers.refresh()
+    return clickhouse.tiers
+
+
+def test_archive_keeps_batch_months(clickhouse):
+    archive = archived(clickhouse).archive('order_events')
+
+    assert archive.batches == ['202501-20250901000000', '202502-20250901000000', '202503-20250901000000']
+    assert archive.months == [date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1)]
+    assert archive.overlapping() == archive.batches
+    assert archive.overlapping(datetime(2025, 2, 15), datetime(2025, 3, 1)) == ['202502-20250901000000']
+    assert archive.overlapping(datetime(2025, 1, 31, 23), datetime(2025, 2, 1, 1)) == archive.batches[:2]
+
+
+def test_source_reads_only_batches_in_range(clickhouse):
+    tiers = archived(clickhouse)
+
+    source, params = tiers.source('order_events', datetime(2025, 2, 10), datetime(2025, 2, 20))
+    assert "file('analytics_archive/order_events/202502-20250901000000.parquet'" in source
+    assert "WHERE timestamp >= %(order_events_hot_from)s" in source
+    assert params == {'order_events_hot_from': datetime(2025, 4, 1)}
+
+    source, _ = tiers.source('order_events', datetime(2025, 1, 10))
+    assert "order_events/{202501-20250901000000,202502-20250901000000,202503-20250901000000}.parquet" in source
+
+    # Ranges past the boundary, or with no archived month in them, stay on the hot table
+    assert tiers.source('order_events', datetime(2025, 5, 1)) == ('order_events', {})
+    assert tiers.source('order_events', datetime(2024, 11, 1), datetime(2024, 12, 1)) == ('order_events', {})
+
+
+def test_export_reads_the_months_it_covers(clickhouse, monkeypatch):
+    archived(clickhouse)
+    streamed = []
+    monkeypatch.setattr(clickhouse, 'iter_rows', lambda query, params: streamed.append(" ".join(query.split())) or iter(()))
+
+    list(clickhouse.iter_order_events(datetime(2025, 3, 5), datetime(2025, 3, 6)))
+
+    query, = streamed
+    assert "order_events/202503-20250901000000.parquet" in query
+    assert "202501" not in query and "202502" not in query
+
+
+def test_second_batch_recomputes_the_month_status_summary(clickhouse):
+    from src.storage.tiering import Archiver
+    clickhouse.results += [
+        ("SELECT max(cutoff), groupArray(batch) FROM archive_batches",
+         [(datetime(2025, 9, 1), ['202502-20250901000000'])]),
+        ("SELECT count() FROM order_events FINAL", [(3,)]),
+    ]
+
+    assert Archiver(clickhouse, 180, 0).archive_month('order_events', date(2025, 2, 1), datetime(2025, 10, 1))
+
+    batch = '202502-20251001000000'
+    queries = {query.split()[2]: (query, params) for query, params, _ in clickhouse.queries if query.startswith("INSERT INTO")}
+    daily_sales, params = queries['archived_daily_sales']
+    # Daily sales add up across batches, so they only read the new one
+    assert f"order_events/{batch}.parquet" in daily_sales
+    assert "20250901000000" not in daily_sales
+    assert params['batch'] == batch
+    status, params = queries['archived_order_status']
+    assert "order_events/{202502-20250901000000,202502-20251001000000}.parquet" in status
+    assert params['batch'] == batch
+
+
+def test_status_distribution_reads_the_newest_batch_of_each_month(clickhouse):
+    clickhouse.results.append(("FROM archive_batches GROUP BY table_name", [
+        ('order_events', datetime(2025, 3, 1), [
+            ('202502-20251001000000', date(2025, 2, 1)),
+            ('202501-20250901000000', date(2025, 1, 1)),
+            ('202502-20250901000000', date(2025, 2, 1)),
+        ]),
+    ]))
+    clickhouse.tiers.refresh()
+
+    clickhouse.get_order_status_distribution()
+
+    _, params, _ = clickhouse.queries[-1]
+    assert params['batches'] == ['202501-20250901000000', '202502-20251001000000']